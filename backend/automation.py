@@ -1,163 +1,323 @@
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
+import hashlib
+import json
+import uuid
 from sqlalchemy.orm import Session
+from sqlalchemy import insert, or_, false, Date
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from . import models
+from .services import rule_compiler
 
-def run_daily_automations(db: Session):
+# Catch-up window: a rule fires if its target date fell within the last N days
+CATCH_UP_DAYS = 7
+
+def run_daily_automations(db: Session, today=None, candidate_filter=None, incremental=False, advance_watermarks=True):
     """
     Runs daily automation rules to generate tasks based on offender milestones.
     Fetches rules dynamically from 'automation_rules' table.
+
+    Set-based engine: per rule, the trigger window becomes a date-range predicate
+    on the trigger column, candidates are fetched with their active episode in one
+    join, firings are claimed in the automation_runs ledger with one
+    INSERT ... ON CONFLICT DO NOTHING and new tasks are bulk-inserted.
+    Query count is O(rules), independent of the number of offenders.
+
+    `candidate_filter` optionally restricts the offenders considered
+    (used by services/automation_runner.py to evaluate one shard).
+
+    incremental=True only evaluates, per rule, the offenders whose trigger date
+    entered the window since the rule's watermark plus offenders/episodes changed
+    since then (updated_at, kept by the ORM and by the triggers in
+    services/change_tracking.py). New or edited rules get one full evaluation first.
+    Watermarks of rules that ran cleanly are advanced unless advance_watermarks=False.
     """
     print("Running Daily Automations (Dynamic Engine)...")
-    today = datetime.now().date()
-    
+    today = today or datetime.now().date()
+    run_started = datetime.utcnow()
+
     # Fetch active rules
     rules = db.query(models.AutomationRule).filter(models.AutomationRule.is_active == True).all()
-    
-    # Fetch all offenders
-    offenders = db.query(models.Offender).all()
-    
+    versions = {rule.rule_id: definition_version(rule) for rule in rules}
+
+    actions_count, failed = evaluate_rules(db, rules, today, candidate_filter, incremental)
+
+    if advance_watermarks:
+        advance_rule_watermarks(db, {rid: v for rid, v in versions.items() if rid not in failed}, today, run_started)
+
+    print(f"Automation Complete. Generated {actions_count} tasks based on {len(rules)} active rules.")
+    return actions_count
+
+def evaluate_rules(db: Session, rules, today, candidate_filter=None, incremental=False):
+    """
+    Runs each rule, committing per rule. Returns (tasks_created, failed_rule_ids).
+    """
     actions_count = 0
-    
-    for offender in offenders:
-        # Get active episode for context (Officer, Risk Level, etc.)
-        episode = db.query(models.SupervisionEpisode).filter(
-            models.SupervisionEpisode.offender_id == offender.offender_id,
-            models.SupervisionEpisode.status == 'Active'
-        ).first()
-        
-        # If no active supervision, skip? 
-        # Some rules might apply to 'Pending' intakes, but generally we need an officer Assignment.
-        # Use fallback if episode missing? For now, require episode or skip task assignment.
-        assigned_officer_id = episode.assigned_officer_id if episode else None
-        
-        for rule in rules:
-            try:
-                if check_trigger(rule, offender, today) and check_conditions(rule, offender, episode):
-                    if execute_action(db, rule, offender, episode, assigned_officer_id):
-                        actions_count += 1
-            except Exception as e:
-                print(f"Error processing rule {rule.name} for offender {offender.last_name}: {e}")
+    failed = set()
+    for rule in rules:
+        rule_id, name = rule.rule_id, rule.name
+        # Each rule commits on its own so one bad rule doesn't discard the others
+        try:
+            actions_count += run_rule(db, rule, today, candidate_filter, incremental)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            failed.add(rule_id)
+            print(f"Error processing rule {name}: {e}")
+    return actions_count, failed
+
+# --- Watermarks ---
 
+def definition_version(rule) -> str:
+    """
+    Hash of everything that decides which tasks a rule creates.
+    Editing any of it invalidates the rule's watermark (full backfill).
+    """
+    payload = json.dumps({
+        "trigger_field": rule.trigger_field,
+        "trigger_offset": rule.trigger_offset or 0,
+        "trigger_direction": rule.trigger_direction,
+        "conditions": rule.conditions or [],
+        "task_title": rule.task_title,
+        "due_offset": rule.due_offset or 0,
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def advance_rule_watermarks(db: Session, versions: dict, today, run_started):
+    """
+    Records a successful evaluation: {rule_id: definition_version at run start}.
+    """
+    for rule_id, version in versions.items():
+        db.query(models.AutomationRule).filter(models.AutomationRule.rule_id == rule_id).update({
+            models.AutomationRule.last_evaluated_date: today,
+            models.AutomationRule.last_evaluated_at: run_started,
+            models.AutomationRule.evaluated_version: version,
+        }, synchronize_session=False)
     db.commit()
-    print(f"Automation Complete. Generated {actions_count} tasks based on {len(rules)} active rules.")
+
+def incremental_filter(rule, today):
+    """
+    Candidate restriction for an incremental run, or None when the rule needs a
+    full evaluation (never evaluated, edited since, or the run date went backwards).
+    """
+    if (rule.last_evaluated_date is None or rule.last_evaluated_at is None
+            or rule.evaluated_version != definition_version(rule)
+            or rule.last_evaluated_date > today):
+        return None
+
+    # Target dates (last run, today] were not in any earlier window
+    new_window_start = max(rule.last_evaluated_date + timedelta(days=1), today - timedelta(days=CATCH_UP_DAYS))
+    if new_window_start <= today:
+        newly_opened = trigger_column(rule) >= trigger_window(rule, today, new_window_start)[0]
+    else:
+        newly_opened = false()
+
+    since = rule.last_evaluated_at
+    return or_(
+        newly_opened,
+        models.Offender.updated_at > since,
+        models.SupervisionEpisode.updated_at > since,
+        # Never stamped (rows from before the column existed): treat as changed
+        models.Offender.updated_at.is_(None),
+        models.SupervisionEpisode.updated_at.is_(None)
+    )
+
+def trigger_column(rule):
+    """
+    Returns the Offender date column a rule triggers on, or None if the
+    trigger is not a date field (e.g. event triggers like 'positive_ua').
+    """
+    column = getattr(models.Offender.__table__.c, rule.trigger_field or "", None)
+    if column is None or not isinstance(column.type, Date):
+        return None
+    return getattr(models.Offender, rule.trigger_field)
+
+def trigger_window(rule, today, window_start=None):
+    """
+    Converts the rule's target-date window [today - CATCH_UP_DAYS, today] (or
+    [window_start, today]) into the equivalent (start, end) range on the trigger field.
+    """
+    delta = timedelta(days=rule.trigger_offset or 0)
+    window_start = window_start or today - timedelta(days=CATCH_UP_DAYS)
+    if rule.trigger_direction == 'before':
+        # target = trigger - offset
+        return window_start + delta, today + delta
+    # 'after': target = trigger + offset
+    return window_start - delta, today - delta
+
+def execution_date(rule, trigger_date):
+    """
+    Date the rule SHOULD have fired for this trigger date.
+    """
+    delta = timedelta(days=rule.trigger_offset or 0)
+    if rule.trigger_direction == 'before':
+        return trigger_date - delta
+    return trigger_date + delta
+
+def due_date(rule, trigger_date):
+    """
+    Due date of the task a rule creates: execution date + due_offset days.
+    """
+    return execution_date(rule, trigger_date) + timedelta(days=rule.due_offset or 0)
+
+def fetch_candidates(db: Session, rule, today, *filters):
+    """
+    Offenders whose trigger date falls in the rule's window, joined with their
+    active, assigned supervision episode. Returns [(offender, episode)], one per offender.
+    `filters` are extra WHERE clauses (compiled conditions, shard, incremental); None entries are ignored.
+    """
+    column = trigger_column(rule)
+    if column is None:
+        return []
+    start, end = trigger_window(rule, today)
+    extra = [f for f in filters if f is not None]
+
+    rows = (
+        db.query(models.Offender, models.SupervisionEpisode)
+        .join(models.SupervisionEpisode, models.SupervisionEpisode.offender_id == models.Offender.offender_id)
+        .filter(
+            column >= start,
+            column <= end,
+            models.SupervisionEpisode.status == 'Active',
+            models.SupervisionEpisode.assigned_officer_id.isnot(None),
+            *extra
+        )
+        .all()
+    )
+
+    seen = set()
+    candidates = []
+    for offender, episode in rows:
+        if offender.offender_id in seen:
+            continue
+        seen.add(offender.offender_id)
+        candidates.append((offender, episode))
+    return candidates
+
+def match_rule(db: Session, rule, today, candidate_filter=None, incremental=False):
+    """
+    Offenders (with their active episode) that satisfy the rule's trigger window
+    and conditions today. Read-only. Returns [(offender, episode)].
+    """
+    compiled = rule_compiler.get_compiled(rule)
+    if trigger_column(rule) is None:
+        return []
+    since_filter = incremental_filter(rule, today) if incremental else None
+    return [
+        (offender, episode) for offender, episode in fetch_candidates(db, rule, today, compiled.sql_filter, candidate_filter, since_filter)
+        if compiled.matches(offender, episode)
+    ]
+
+def run_rule(db: Session, rule, today, candidate_filter=None, incremental=False) -> int:
+    """
+    Evaluates one rule against all offenders (or, incrementally, the ones that
+    may have changed) and bulk-creates the missing tasks.
+    Returns the number of tasks created.
+    """
+    matches = match_rule(db, rule, today, candidate_filter, incremental)
+    if not matches:
+        return 0
+
+    # Idempotency: claim (rule, episode, trigger date) in the automation_runs ledger;
+    # only the rows actually inserted get a task
+    fired_at = datetime.utcnow()
+    ledger_rows = {}
+    tasks = {}
+    for offender, episode in matches:
+        trigger_date = getattr(offender, rule.trigger_field)
+        if (episode.episode_id, trigger_date) in ledger_rows:
+            continue
+        task_id = uuid.uuid4()
+        ledger_rows[(episode.episode_id, trigger_date)] = {
+            "rule_id": rule.rule_id,
+            "rule_name": rule.name,
+            "episode_id": episode.episode_id,
+            "offender_id": offender.offender_id,
+            "trigger_date": trigger_date,
+            "task_id": task_id,
+            "fired_on": today,
+            "fired_at": fired_at,
+        }
+        tasks[task_id] = {
+            "task_id": task_id,
+            "episode_id": episode.episode_id,
+            "offender_id": offender.offender_id,
+            "title": rule.task_title,
+            "description": rule.task_description,
+            "due_date": due_date(rule, trigger_date),
+            "status": "Pending",
+            "is_parole_plan": rule.action_is_parole_plan,
+            "assigned_officer_id": episode.assigned_officer_id, # Assign to supervising officer
+            "created_by": episode.assigned_officer_id # System/Self assigned
+        }
+
+    claimed = claim_runs(db, rule, list(ledger_rows.values()))
+    new_tasks = [tasks[task_id] for task_id in claimed]
+    if new_tasks:
+        db.execute(insert(models.Task), new_tasks)
+    return len(new_tasks)
+
+def claim_runs(db: Session, rule, rows):
+    """
+    Bulk-inserts ledger rows, skipping keys that already fired.
+    Returns the task_ids of the rows that were inserted.
+    """
+    if not rows:
+        return set()
+    run = models.AutomationRun
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = (
+            dialect_insert(run)
+            .on_conflict_do_nothing(index_elements=['rule_id', 'episode_id', 'trigger_date'])
+            .returning(run.task_id)
+        )
+        return set(db.scalars(stmt, rows))
+
+    # Other dialects: look the keys up first (one query), then insert the rest
+    existing = set(
+        db.query(run.episode_id, run.trigger_date).filter(
+            run.rule_id == rule.rule_id,
+            run.episode_id.in_({r["episode_id"] for r in rows})
+        )
+    )
+    rows = [r for r in rows if (r["episode_id"], r["trigger_date"]) not in existing]
+    if rows:
+        db.execute(insert(run), rows)
+    return {r["task_id"] for r in rows}
 
 def check_trigger(rule, offender, today):
     """
     Check if the rule should trigger today (or if we missed it recently).
+    Per-offender equivalent of the SQL window used by fetch_candidates.
     """
     # Get the date field from offender
     trigger_date = getattr(offender, rule.trigger_field, None)
-    
+
     # Handle string dates if necessary
     if isinstance(trigger_date, str):
         try:
             trigger_date = datetime.strptime(trigger_date, "%Y-%m-%d").date()
         except ValueError:
             return False
-            
+
     if not trigger_date:
         return False
-        
-    # Calculate target date
-    delta = timedelta(days=rule.trigger_offset)
-    if rule.trigger_direction == 'before':
-        target_date = trigger_date - delta
-    else: # 'after'
-        target_date = trigger_date + delta
-        
-    # Trigger Logic: 
-    # Strict: target_date == today
-    # Catch-up: target_date <= today AND target_date > (today - 30 days) AND not executed?
-    # For this POC, let's use Catch-up window of 7 days to ensure we see results.
-    window_start = today - timedelta(days=7)
-    
+
+    # Trigger Logic:
+    # Catch-up window of 7 days to ensure we see results.
+    target_date = execution_date(rule, trigger_date)
+    window_start = today - timedelta(days=CATCH_UP_DAYS)
+
     return window_start <= target_date <= today
 
 def check_conditions(rule, offender, episode):
     """
     Check if offender meets custom conditions (e.g. Risk Level == High).
+    Conditions are compiled once per rule version (see services/rule_compiler.py).
     """
     if not rule.conditions:
         return True # No conditions = run for everyone matching trigger
-        
-    for condition in rule.conditions:
-        field = condition.get('field')
-        operator = condition.get('operator')
-        value = condition.get('value')
-        
-        # Determine value to check
-        # Fields can be on Offender or Episode
-        # e.g. 'risk_level' is usually on Episode
-        actual_value = None
-        
-        if field == 'risk_level' and episode:
-            actual_value = episode.risk_level_at_start # or current_risk_level
-        elif hasattr(offender, field):
-            actual_value = getattr(offender, field)
-        elif episode and hasattr(episode, field):
-             actual_value = getattr(episode, field)
-             
-        # Normalize for comparison
-        actual_str = str(actual_value) if actual_value is not None else ""
-        
-        # Compare
-        if operator == 'equals':
-            if actual_str.lower() != str(value).lower():
-                return False
-        elif operator == 'not_equals':
-             if actual_str.lower() == str(value).lower():
-                return False
-        # Add more operators as needed
-        
-    return True
-
-def execute_action(db, rule, offender, episode, officer_id):
-    """
-    Perform the action (Create Task).
-    Returns True if action was taken (task created), False if existed.
-    """
-    if not officer_id:
-        return False # Can't assign task
-        
-    # Check if task already exists (Idempotency)
-    # We match on Title + Episode ID
-    if episode:
-        exists = db.query(models.Task).filter(
-            models.Task.title == rule.task_title,
-            models.Task.episode_id == episode.episode_id
-        ).first()
-        if exists:
-            return False
-            
-    # Calculate Due Date
-    # Base it on the trigger target date to be accurate? 
-    # Or just today + due_offset?
-    # Requirement: "Due Date: Trigger + X days"
-    
-    # Re-calculate trigger base date
-    trigger_date_val = getattr(offender, rule.trigger_field, None)
-    if isinstance(trigger_date_val, str):
-         trigger_date_val = datetime.strptime(trigger_date_val, "%Y-%m-%d").date()
-    
-    # Recalculate execution date (when it SHOULD have fired)
-    delta = timedelta(days=rule.trigger_offset)
-    if rule.trigger_direction == 'before':
-        execution_date = trigger_date_val - delta
-    else:
-        execution_date = trigger_date_val + delta
-        
-    due_date = execution_date + timedelta(days=rule.due_offset)
-    
-    # Create Task
-    new_task = models.Task(
-        episode_id=episode.episode_id if episode else None,
-        title=rule.task_title,
-        description=rule.task_description,
-        due_date=due_date,
-        status="Pending",
-        assigned_officer_id=officer_id, # Assign to supervising officer
-        priority=rule.task_priority,
-        created_by=officer_id # System/Self assigned
-    )
-    db.add(new_task)
-    return True
+    return rule_compiler.get_compiled(rule).matches(offender, episode)
@@ -5,15 +5,20 @@ from fastapi.responses import StreamingResponse
 
 from . import models, database, auth
 from .database import engine, get_db
-from .routers import auth as auth_router, users, offenders, settings, dashboard, workflow, tasks, appointments, fees, assessments, automations, documents, programs
+from .routers import auth as auth_router, users, offenders, settings, dashboard, workflow, tasks, appointments, fees, assessments, automations, documents, programs, search
 
 # ... (omitted lines)
 
 
-from fastapi.staticfiles import StaticFiles
-
 models.Base.metadata.create_all(bind=engine)
 
+# Search index for databases created before it existed (no-op when present)
+from .services import offender_search_service, text_search_service, change_tracking, automation_events
+with engine.begin() as conn:
+    offender_search_service.ensure_search_index(conn)
+    text_search_service.ensure_search_index(conn)
+    change_tracking.ensure_change_triggers(conn)
+
 # Configure Structured Logging
 from contextvars import ContextVar
 import uuid
@@ -50,19 +55,33 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Parole Officer Dashboard API")
 
-# Mount Media (Static Files)
-import os
-os.makedirs("backend/media", exist_ok=True)
-app.mount("/media", StaticFiles(directory="backend/media"), name="media")
+# Uploaded files are served by GET /documents/{id}/content (authorized,
+# Range-aware); there is deliberately no public /media mount.
+
+# Middleware for Request IDs. Plain ASGI rather than @app.middleware("http"),
+# which re-buffers every body chunk through a memory stream and would drop
+# zero-copy file sends.
+class RequestIdMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = str(uuid.uuid4())
+        request_id_ref.set(request_id)
 
-# Middleware for Request IDs
-@app.middleware("http")
-async def request_id_middleware(request: Request, call_next):
-    request_id = str(uuid.uuid4())
-    request_id_ref.set(request_id)
-    response = await call_next(request)
-    response.headers["X-Request-ID"] = request_id
-    return response
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+app.add_middleware(RequestIdMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -71,6 +90,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Next-Cursor", "X-Total-Count", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
 # Global Exception Handler
@@ -107,6 +127,7 @@ app.include_router(assessments.router)
 app.include_router(automations.router)
 app.include_router(documents.router)
 app.include_router(programs.router)
+app.include_router(search.router)
 
 @app.get("/health")
 def health_check():
@@ -219,3 +240,8 @@ def startup_event():
                      existing_user.password_hash = target_hash
                      db.add(existing_user)
                      db.commit()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Drain queued automation events before the process exits
+    automation_events.get_event_bus().stop()
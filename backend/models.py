@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Boolean, Text, JSON, Float, Uuid as UUID
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Boolean, Text, JSON, Float, Index, UniqueConstraint, Uuid as UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
@@ -87,6 +87,7 @@ class Offender(Base):
     
     general_comments = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Change watermark for incremental automations
 
 # --- Program Management Module ---
 
@@ -179,6 +180,7 @@ class SupervisionEpisode(Base):
     risk_level_at_start = Column(String(20), nullable=False)
     current_risk_level = Column(String(20)) # Updated by Risk Assessments
     closing_reason = Column(String(100))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     offender = relationship("Offender")
     officer = relationship("Officer")
@@ -194,7 +196,7 @@ class Task(Base):
     description = Column(Text)
     category = Column(String(50))
     sub_category = Column(String(50))
-    due_date = Column(Date)
+    due_date = Column(Date, index=True)
     status = Column(String(20), default='Pending', index=True)
     is_parole_plan = Column(Boolean, default=False) # New field
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -309,6 +311,7 @@ class Document(Base):
     file_type = Column(String(100)) # MIME type
     category = Column(String(50), default='General') # General, Court, Note Attachment, Task Attachment
     file_size = Column(Integer) # Bytes
+    sha256 = Column(String(64), ForeignKey('document_blobs.sha256'), nullable=True, index=True) # NULL for legacy flat files
     
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
@@ -316,6 +319,60 @@ class Document(Base):
     uploaded_by = relationship("Officer")
     note = relationship("CaseNote", backref="documents")
     task = relationship("Task", backref="documents")
+    blob = relationship("DocumentBlob")
+
+    @property
+    def preview_status(self):
+        return self.blob.preview_status if self.blob is not None else None
+
+class UploadSession(Base):
+    # Resumable upload in progress (services/resumable_uploads.py)
+    __tablename__ = 'upload_sessions'
+    upload_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    offender_id = Column(UUID(as_uuid=True), ForeignKey('offenders.offender_id'), nullable=False, index=True)
+    uploaded_by_id = Column(UUID(as_uuid=True), ForeignKey('officers.officer_id'), nullable=True)
+    note_id = Column(UUID(as_uuid=True), ForeignKey('case_notes.note_id'), nullable=True)
+    task_id = Column(UUID(as_uuid=True), ForeignKey('tasks.task_id'), nullable=True)
+    file_name = Column(String(255), nullable=False)
+    file_type = Column(String(100))
+    category = Column(String(50), default='General')
+    total_size = Column(BigInteger) # Declared by the client, checked on commit when given
+    chunk_size = Column(Integer, nullable=False)
+    status = Column(String(20), default='open') # open, committing, committed
+    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.document_id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    chunks = relationship("UploadChunk", cascade="all, delete-orphan", order_by="UploadChunk.chunk_index")
+
+class UploadChunk(Base):
+    __tablename__ = 'upload_chunks'
+    upload_id = Column(UUID(as_uuid=True), ForeignKey('upload_sessions.upload_id', ondelete='CASCADE'), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow)
+
+class DocumentBlob(Base):
+    # Content-addressed file shared by every Document with the same bytes
+    __tablename__ = 'document_blobs'
+    sha256 = Column(String(64), primary_key=True)
+    storage_key = Column(String(500), nullable=False) # 'ab/cd/<sha256>'
+    backend = Column(String(20), nullable=False, default='local')
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Thumbnail / text extract (services/document_previews.py), stored next to the blob
+    preview_status = Column(String(20), nullable=False, default='pending', index=True) # pending, processing, ready, unsupported, failed
+    preview_error = Column(String(500))
+    has_thumbnail = Column(Boolean, nullable=False, default=False)
+    preview_updated_at = Column(DateTime)
+
+class DocumentText(Base):
+    # Text extract of a blob, full-text indexed (services/text_search_service.py)
+    __tablename__ = 'document_texts'
+    sha256 = Column(String(64), ForeignKey('document_blobs.sha256', ondelete='CASCADE'), primary_key=True)
+    content = Column(Text, nullable=False)
 
 class RiskAssessmentType(Base):
     __tablename__ = 'risk_assessment_types'
@@ -354,6 +411,10 @@ class RiskAssessment(Base):
 
 class RiskAssessmentAnswer(Base):
     __tablename__ = 'risk_assessment_answers'
+    __table_args__ = (
+        # One answer per question; target of the bulk upsert
+        UniqueConstraint('assessment_id', 'question_tag', name='uq_risk_assessment_answers_assessment_tag'),
+    )
     answer_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     assessment_id = Column(UUID(as_uuid=True), ForeignKey('risk_assessments.assessment_id'), index=True)
     question_tag = Column(String(50), ForeignKey('risk_assessment_questions.universal_tag'), index=True)
@@ -384,6 +445,37 @@ class SystemSettings(Base):
     value = Column(Text, nullable=False)
     description = Column(Text)
 
+class DashboardStatsRollup(Base):
+    __tablename__ = 'dashboard_stats_rollups'
+    rollup_id = Column(Integer, primary_key=True, autoincrement=True)
+    snapshot_date = Column(Date, nullable=False)
+    scope_type = Column(String(20), nullable=False) # system, location, officer
+    scope_id = Column(UUID(as_uuid=True), nullable=True) # officer_id / location_id, NULL for system
+
+    # Raw counts (same definitions as /dashboard/stats)
+    total_caseload = Column(Integer, default=0)
+    employed_count = Column(Integer, default=0)
+    violator_count = Column(Integer, default=0)
+    warrants_issued = Column(Integer, default=0)
+    pending_reviews = Column(Integer, default=0)
+    risk_low = Column(Integer, default=0)
+    risk_medium = Column(Integer, default=0)
+    risk_high = Column(Integer, default=0)
+
+    # Derived rates at snapshot time
+    compliance_rate = Column(Float)
+    employment_rate = Column(Float)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_dashboard_rollups_scope_date', 'scope_type', 'scope_id', 'snapshot_date'),
+        UniqueConstraint('snapshot_date', 'scope_type', 'scope_id', name='uq_dashboard_rollups_date_scope'),
+        # NULL scope_ids don't collide in the constraint above: one system row per date
+        Index('uq_dashboard_rollups_date_system', 'snapshot_date', 'scope_type', unique=True,
+              sqlite_where=scope_id.is_(None), postgresql_where=scope_id.is_(None)),
+    )
+
 class Territory(Base):
     __tablename__ = 'territories'
     zip_code = Column(String(10), primary_key=True)
@@ -478,6 +570,37 @@ class AutomationRule(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Incremental evaluation watermark (see automation.py)
+    last_evaluated_date = Column(Date) # 'today' of the last successful evaluation
+    last_evaluated_at = Column(DateTime) # UTC start of that run; changes after it are re-evaluated
+    evaluated_version = Column(String(40)) # Rule definition hash; a mismatch forces a full backfill
+
+class AutomationRun(Base):
+    __tablename__ = 'automation_runs'
+    # Ledger of rule firings: one row per (rule, episode, trigger date).
+    # The unique key is the automation engine's idempotency check and doubles as an audit trail.
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    rule_id = Column(Integer, ForeignKey('automation_rules.rule_id', ondelete='SET NULL'), nullable=True)
+    rule_name = Column(String(100)) # Snapshot, survives rule deletion
+    episode_id = Column(UUID(as_uuid=True), ForeignKey('supervision_episodes.episode_id'), nullable=False, index=True)
+    offender_id = Column(UUID(as_uuid=True), ForeignKey('offenders.offender_id'), index=True)
+    trigger_date = Column(Date, nullable=False) # Value of the rule's trigger field when it fired
+    task_id = Column(UUID(as_uuid=True), index=True) # No FK: officers may delete the task, the firing stays recorded
+    fired_on = Column(Date, nullable=False) # Run date
+    fired_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('rule_id', 'episode_id', 'trigger_date', name='uq_automation_runs_rule_episode_trigger'),
+    )
+
+class JobLock(Base):
+    __tablename__ = 'job_locks'
+    # One row per running job; the primary key makes acquisition atomic across processes
+    lock_name = Column(String(100), primary_key=True)
+    owner = Column(String(100), nullable=False) # host:pid:token of the holder
+    acquired_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False) # Stale locks (crashed runs) can be taken over
+
 
 
 
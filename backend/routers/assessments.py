@@ -3,8 +3,8 @@ from sqlalchemy.orm import Session
 from uuid import UUID
 from datetime import date
 from .. import database, models, schemas
-from ..services import risk_assessment_service
-from sqlalchemy import text
+from ..services import risk_assessment_service, assessment_rescore, instrument_service
+from ..services.instrument_runtime import instrument_cache, instrument_query
 
 router = APIRouter(
     prefix="/assessments",
@@ -45,20 +45,6 @@ def create_assessment_session(
     db.refresh(new_assessment)
     return new_assessment
 
-@router.post("/{assessment_id}/answers")
-def save_answer(
-    assessment_id: UUID, 
-    tag: str, 
-    value: str | int | bool | None, # Flexible body 
-    db: Session = Depends(database.get_db)
-):
-    """
-    Saves a single answer. Value is passed as a query or body param.
-    For simplicity in this POC, we'll accept it via a simple Pydantic model in a real app,
-    but here we'll just take it as a body dict or similar. 
-    """
-    pass # Defined properly below
-
 from pydantic import BaseModel
 from typing import Any
 
@@ -66,15 +52,45 @@ class AnswerRequest(BaseModel):
     tag: str
     value: Any
 
+class BatchAnswerRequest(BaseModel):
+    answers: dict[str, Any] # tag -> value
+
 @router.post("/{assessment_id}/save")
 def save_assessment_answer(
     assessment_id: UUID, 
     answer: AnswerRequest,
     db: Session = Depends(database.get_db)
 ):
-    risk_assessment_service.save_assessment_answer(db, assessment_id, answer.tag, answer.value)
+    try:
+        risk_assessment_service.save_assessment_answer(db, assessment_id, answer.tag, answer.value)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return {"status": "success"}
 
+@router.post("/{assessment_id}/answers")
+def save_assessment_answers(
+    assessment_id: UUID,
+    batch: BatchAnswerRequest,
+    include_score: bool = False,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Saves many answers at once (single upsert + commit).
+    With include_score=true the response also carries the recomputed score.
+    """
+    try:
+        saved = risk_assessment_service.save_assessment_answers(db, assessment_id, batch.answers)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response = {"status": "success", "saved": saved}
+    if include_score:
+        response["score"] = risk_assessment_service.calculate_score(db, assessment_id)
+    return response
+
 class SubmitRequest(BaseModel):
     final_risk_level: str | None = None
     override_reason: str | None = None
@@ -179,6 +195,14 @@ def delete_assessment_type(type_id: int, db: Session = Depends(database.get_db))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/rescore")
+def rescore_assessments(assessment_type: str = None, preview: bool = True, db: Session = Depends(database.get_db)):
+    """
+    Re-scores Completed assessments with the current matrices and option scores.
+    Defaults to preview (before/after report, nothing written); pass preview=false to apply.
+    """
+    return assessment_rescore.rescore_assessments(db, assessment_type=assessment_type, preview=preview)
+
 # --- NEW GENERIC ASSESSMENT ENGINE ENDPOINTS ---
 
 @router.post("/instruments", response_model=schemas.AssessmentInstrument)
@@ -250,140 +274,56 @@ def list_instruments(db: Session = Depends(database.get_db)):
     """
     List all Assessment Instruments.
     """
-    return db.query(models.AssessmentInstrument).all()
+    return instrument_query(db).all()
 
 @router.get("/instruments/{instrument_id}", response_model=schemas.AssessmentInstrument)
 def get_instrument(instrument_id: UUID, db: Session = Depends(database.get_db)):
     """
     Get a specific instrument by ID with full nested structure.
     """
-    instrument = db.query(models.AssessmentInstrument).filter(models.AssessmentInstrument.instrument_id == instrument_id).first()
+    instrument = instrument_query(db).filter(models.AssessmentInstrument.instrument_id == instrument_id).first()
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument not found")
     return instrument
 
-@router.put("/instruments/{instrument_id}", response_model=schemas.AssessmentInstrument)
-def update_instrument(instrument_id: UUID, instrument_data: schemas.AssessmentInstrumentCreate, db: Session = Depends(database.get_db)):
+class InstrumentScoreRequest(BaseModel):
+    answers: dict[str, Any] # item_id -> option value / label / id (list for Checkbox)
+    population: str | None = None # e.g. "Male"; defaults to the offender's gender
+    offender_id: UUID | None = None
+
+@router.post("/instruments/{instrument_id}/score")
+def score_instrument(instrument_id: UUID, request: InstrumentScoreRequest, db: Session = Depends(database.get_db)):
     """
-    Update a specific instrument.
-    Strategy: Full replacement of children (Domains, Items, Scoring Tables).
+    Scores a submission against the compiled instrument: total, domain subtotals,
+    levels from the population's scoring tables and recommendations.
     """
-    db_instrument = db.query(models.AssessmentInstrument).filter(models.AssessmentInstrument.instrument_id == instrument_id).first()
-    if not db_instrument:
+    compiled = instrument_cache.get(db, instrument_id)
+    if compiled is None:
         raise HTTPException(status_code=404, detail="Instrument not found")
 
-    # 1. Update Root Fields
-    db_instrument.name = instrument_data.name
-    db_instrument.version = instrument_data.version
-    db_instrument.target_populations = instrument_data.target_populations
-    db_instrument.scoring_method = instrument_data.scoring_method
-    db_instrument.is_active = instrument_data.is_active
-
-    # 2. Clear existing children
-    # Use raw SQL to ensure cascade deletion works regardless of ORM state
-    # A. Delete Scoring Tables
-    db.execute(
-        text("DELETE FROM scoring_tables WHERE instrument_id = :iid"),
-        {"iid": instrument_id}
-    )
-    
-    # B. Delete Options (via Items -> Domains)
-    db.execute(
-        text("""
-        DELETE FROM assessment_options 
-        WHERE item_id IN (
-            SELECT item_id FROM assessment_items 
-            WHERE domain_id IN (
-                SELECT domain_id FROM assessment_domains 
-                WHERE instrument_id = :iid
-            )
-        )
-        """),
-        {"iid": instrument_id}
-    )
+    population = request.population
+    if population is None and request.offender_id is not None:
+        population = db.query(models.Offender.gender).filter(models.Offender.offender_id == request.offender_id).scalar()
+    return compiled.score(request.answers, population)
 
-    # C. Delete Items (via Domains)
-    db.execute(
-        text("""
-        DELETE FROM assessment_items 
-        WHERE domain_id IN (
-            SELECT domain_id FROM assessment_domains 
-            WHERE instrument_id = :iid
-        )
-        """),
-        {"iid": instrument_id}
-    )
-
-    # D. Delete Domains
-    db.execute(
-        text("DELETE FROM assessment_domains WHERE instrument_id = :iid"),
-        {"iid": instrument_id}
-    )
-    db.flush()
-
-    # Map to track Old-UUID -> New-DB-UUID for domains (to fix scoring table references)
-    domain_id_map = {}
-
-    # 3. Re-create Domains & Items
-    for d in instrument_data.domains:
-        db_domain = models.AssessmentDomain(
-            instrument_id=db_instrument.instrument_id,
-            name=d.name,
-            order_index=d.order_index,
-            max_score=d.max_score
-        )
-        db.add(db_domain)
-        db.flush() # Generate new domain_id
-
-        # Track mapping if provided
-        if d.id:
-            domain_id_map[d.id] = db_domain.domain_id
-
-        for i in d.items:
-            db_item = models.AssessmentItem(
-                domain_id=db_domain.domain_id,
-                text=i.text,
-                control_type=i.control_type,
-                order_index=i.order_index,
-                custom_tags=i.custom_tags
-            )
-            db.add(db_item)
-            db.flush() 
-
-            for o in i.options:
-                db_option = models.AssessmentOption(
-                    item_id=db_item.item_id,
-                    label=o.label,
-                    value=o.value,
-                    points=o.points,
-                    order_index=o.order_index
-                )
-                db.add(db_option)
-
-    # 4. Re-create Scoring Tables
-    for st in instrument_data.scoring_tables:
-        # Resolve domain_id reference
-        target_domain_id = st.domain_id
-        if target_domain_id and target_domain_id in domain_id_map:
-            target_domain_id = domain_id_map[target_domain_id]
-        
-        # If the domain_id was not in the map but was provided, it might be dead or intended for Total (if None).
-        # Proceed with mapped ID.
+@router.put("/instruments/{instrument_id}", response_model=schemas.AssessmentInstrumentUpdateResult)
+def update_instrument(instrument_id: UUID, instrument_data: schemas.AssessmentInstrumentCreate, db: Session = Depends(database.get_db)):
+    """
+    Update a specific instrument.
+    Strategy: structural diff against the stored tree (matched by id); only the
+    changed rows are written and unchanged ids are kept. The response carries
+    the updated instrument and a `changes` report.
+    """
+    try:
+        changes = instrument_service.update_instrument(db, instrument_id, instrument_data)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-        db_table = models.ScoringTable(
-            instrument_id=db_instrument.instrument_id,
-            domain_id=target_domain_id,
-            population_filter=st.population_filter,
-            min_score=st.min_score,
-            max_score=st.max_score,
-            result_level=st.result_level,
-            recommendation=st.recommendation
-        )
-        db.add(db_table)
-        
-    db.commit()
-    db.refresh(db_instrument)
-    return db_instrument
+    result = schemas.AssessmentInstrumentUpdateResult.model_validate(instrument_query(db).filter(
+        models.AssessmentInstrument.instrument_id == instrument_id
+    ).populate_existing().first())
+    result.changes = changes
+    return result
 
 @router.delete("/instruments/{instrument_id}")
 def delete_instrument(instrument_id: UUID, db: Session = Depends(database.get_db)):
@@ -397,6 +337,7 @@ def delete_instrument(instrument_id: UUID, db: Session = Depends(database.get_db
     try:
         db.delete(instrument)
         db.commit()
+        instrument_cache.invalidate(instrument_id)
         return {"status": "success", "message": f"Deleted instrument {instrument_id}"}
     except Exception as e:
         db.rollback()
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date
 from uuid import UUID
 
 from ..database import get_db
 from ..models import AutomationRule
 from .. import schemas
+from ..services import rule_compiler, automation_events, automation_simulator
 
 router = APIRouter(
     prefix="/automations/rules",
@@ -17,12 +19,62 @@ def get_rules(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     rules = db.query(AutomationRule).offset(skip).limit(limit).all()
     return rules
 
+def _validate_rule(rule: schemas.AutomationRuleCreate):
+    # Reject rules the engine could not evaluate, instead of skipping them at run time
+    try:
+        rule_compiler.validate_conditions(rule.conditions)
+    except rule_compiler.RuleCompileError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if rule.trigger_direction not in ('before', 'after'):
+        raise HTTPException(status_code=422, detail="trigger_direction must be 'before' or 'after'")
+
 @router.post("/", response_model=schemas.AutomationRule)
 def create_rule(rule: schemas.AutomationRuleCreate, db: Session = Depends(get_db)):
+    _validate_rule(rule)
     db_rule = AutomationRule(**rule.dict())
     db.add(db_rule)
     db.commit()
     db.refresh(db_rule)
+    automation_events.invalidate_rules()
+    return db_rule
+
+@router.get("/dry-run")
+def dry_run_active_rules(today: Optional[date] = None, sample: int = 10, db: Session = Depends(get_db)):
+    """
+    Evaluates every active rule without writing: match counts, tasks that would be
+    created, sample offenders and per-rule evaluation time / query count.
+    """
+    return automation_simulator.simulate_rules(db, today=today, sample_size=sample)
+
+@router.post("/dry-run")
+def dry_run_draft_rule(rule: schemas.AutomationRuleCreate, today: Optional[date] = None, sample: int = 10, db: Session = Depends(get_db)):
+    """
+    Dry-runs an unsaved rule (e.g. from the builder) before it is created.
+    """
+    _validate_rule(rule)
+    draft = AutomationRule(**rule.dict())
+    return automation_simulator.simulate_rule(db, draft, today=today, sample_size=sample)
+
+@router.get("/{rule_id}/dry-run")
+def dry_run_rule(rule_id: int, today: Optional[date] = None, sample: int = 10, db: Session = Depends(get_db)):
+    try:
+        return automation_simulator.simulate_rules(db, rule_id=rule_id, today=today, sample_size=sample)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+@router.put("/{rule_id}", response_model=schemas.AutomationRule)
+def update_rule(rule_id: int, rule: schemas.AutomationRuleCreate, db: Session = Depends(get_db)):
+    db_rule = db.query(AutomationRule).filter(AutomationRule.rule_id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    _validate_rule(rule)
+
+    for key, value in rule.dict().items():
+        setattr(db_rule, key, value)
+    db.commit()
+    db.refresh(db_rule)
+    rule_compiler.invalidate(rule_id)
+    automation_events.invalidate_rules()
     return db_rule
 
 @router.delete("/{rule_id}", response_model=schemas.AutomationRule)
@@ -32,7 +84,8 @@ def delete_rule(rule_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Rule not found")
     db.delete(db_rule)
     db.commit()
-    return db_rule
+    rule_compiler.invalidate(rule_id)
+    automation_events.invalidate_rules()
     return db_rule
 
 
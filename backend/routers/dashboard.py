@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from typing import Optional
+from datetime import date
+from uuid import UUID
 
 from .. import models, schemas, auth
 from ..database import get_db
+from ..services.dashboard_cache import dashboard_cache
+from ..services.dashboard_service import scope_filters, compute_dashboard_counts, derive_rates
+from ..services import stats_rollup_service
 
 router = APIRouter(tags=["Dashboard"])
 
@@ -19,9 +23,6 @@ def get_dashboard_stats(
     # If parameters are passed, use them (Admin/Manager overrides).
     # If no parameters, default to current user's view if they are an officer.
     
-    # Check if current user is an officer
-    current_officer = db.query(models.Officer).filter(models.Officer.user_id == current_user.user_id).first()
-    
     # Logic: 
     # 1. If officer_id param is set, filter by that.
     # 2. If location_id param is set, filter by that.
@@ -44,115 +45,64 @@ def get_dashboard_stats(
     
     print(f"DEBUG_DASHBOARD: User='{current_user.username}' Fetching stats. OfficerFilter='{target_officer_id}' LocationFilter='{target_location_id}'")
 
-    # 2. Total Caseload (Active Episodes)
-    # We query SupervisionEpisodes. 
-    # To filter by location, we need to join Officers (assigned_officer) -> Location? 
-    # Or Offender -> Location? Usually specific to the Officer's location or the Territory.
-    # Let's assume Location filter applies to the Assigned Officer's location.
-    
-    query = db.query(models.SupervisionEpisode).filter(models.SupervisionEpisode.status == 'Active')
-    
-    if target_officer_id:
-        query = query.filter(models.SupervisionEpisode.assigned_officer_id == target_officer_id)
-    
-    if target_location_id:
-        query = query.join(models.Officer).filter(models.Officer.location_id == target_location_id)
-    
-    total_caseload = query.count()
-    active_offenders = total_caseload
-
-    # 3. Employment Rate
-    # Calculate % of ACTIVE caseload that is employed.
-    # We need to join Offender to check employment_status.
-    employment_query = db.query(models.Offender).join(models.SupervisionEpisode).filter(
-        models.SupervisionEpisode.status == 'Active'
-    )
-    
-    if target_officer_id:
-        employment_query = employment_query.filter(models.SupervisionEpisode.assigned_officer_id == target_officer_id)
-    
-    if target_location_id:
-        # Join Officer on Episode to check location
-        employment_query = employment_query.join(models.Officer, models.SupervisionEpisode.assigned_officer_id == models.Officer.officer_id).filter(models.Officer.location_id == target_location_id)
-        
-    # Count employed
-    # Assuming 'Employed' or 'Part-time' etc. Let's check typical values. usually 'Employed'.
-    # Filtering case-insensitive or exact 'Employed'
-    employed_count = employment_query.filter(models.Offender.employment_status == 'Employed').count()
-    
-    if total_caseload > 0:
-        employment_rate = round((employed_count / total_caseload) * 100, 1)
-    else:
-        employment_rate = 0.0
+    try:
+        scope_filters(target_officer_id, target_location_id) # validate ids before they become cache keys
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 4. Warrants Issued (Active/Pinned Violations)
-    warrants_query = db.query(models.CaseNote).filter(
-        models.CaseNote.type == 'Violation',
-        models.CaseNote.is_pinned == True
+    cache_key = (
+        str(UUID(str(target_officer_id))) if target_officer_id else None,
+        str(UUID(str(target_location_id))) if target_location_id else None
     )
-    # Join path: CaseNote -> Offender -> SupervisionEpisode -> Officer
-    warrants_query = warrants_query.join(models.Offender).join(models.SupervisionEpisode).filter(
-        models.SupervisionEpisode.status == 'Active'
+    return dashboard_cache.get_or_compute(
+        cache_key,
+        lambda: build_dashboard_stats(db, target_officer_id, target_location_id)
     )
-    
-    if target_officer_id:
-        warrants_query = warrants_query.filter(models.SupervisionEpisode.assigned_officer_id == target_officer_id)
-        
-    if target_location_id:
-        warrants_query = warrants_query.join(models.Officer, models.SupervisionEpisode.assigned_officer_id == models.Officer.officer_id).filter(models.Officer.location_id == target_location_id)
-    
-    warrants_issued = warrants_query.count()
 
-    # 5. Compliance Rate
-    if total_caseload > 0:
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        
-        violators_query = db.query(models.CaseNote.offender_id).filter(
-            models.CaseNote.type == 'Violation',
-            models.CaseNote.date >= thirty_days_ago
-        )
-        
-        violators_query = violators_query.join(models.Offender).join(models.SupervisionEpisode).filter(
-            models.SupervisionEpisode.status == 'Active'
-        )
-        
-        if target_officer_id:
-           violators_query = violators_query.filter(models.SupervisionEpisode.assigned_officer_id == target_officer_id)
-           
-        if target_location_id:
-            violators_query = violators_query.join(models.Officer, models.SupervisionEpisode.assigned_officer_id == models.Officer.officer_id).filter(models.Officer.location_id == target_location_id)
-        
-        violator_count = violators_query.distinct().count()
-        compliant_count = total_caseload - violator_count
-        compliance_rate = round((compliant_count / total_caseload) * 100, 1)
-    else:
-        compliance_rate = 100.0
+@router.get("/dashboard/cache-stats")
+def get_dashboard_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Hit/miss counters for the dashboard stats cache.
+    """
+    return dashboard_cache.stats()
+
+@router.get("/dashboard/trends")
+def get_dashboard_trends(
+    scope: str = "system", # system, location, officer
+    scope_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    interval: str = "day", # day, week, month
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Historical dashboard metrics from the nightly rollup table (default: last 12 months).
+    """
+    try:
+        points = stats_rollup_service.get_trends(db, scope, scope_id, start_date, end_date, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"scope": scope, "scope_id": scope_id, "interval": interval, "points": points}
+
+def build_dashboard_stats(db: Session, target_officer_id=None, target_location_id=None) -> schemas.DashboardStats:
+    counts = compute_dashboard_counts(db, target_officer_id, target_location_id)
+
+    total_caseload = counts["total_caseload"]
+    active_offenders = total_caseload
+
+    # 3. Employment Rate (% of ACTIVE caseload that is employed)
+    # 5. Compliance Rate (no violation in the last 30 days)
+    employment_rate, compliance_rate = derive_rates(counts)
+
+    # 4. Warrants Issued (Active/Pinned Violations)
+    warrants_issued = counts["warrants_issued"]
 
     # 6. Pending Reviews
-    pending_query = db.query(models.Task).filter(models.Task.status == 'Pending')
-    pending_query = pending_query.join(models.SupervisionEpisode) # Ensure linked to active work? Not necessarily, but for filters yes.
-    
-    if target_officer_id:
-        pending_query = pending_query.filter(models.SupervisionEpisode.assigned_officer_id == target_officer_id)
-        
-    if target_location_id:
-        pending_query = pending_query.join(models.Officer, models.SupervisionEpisode.assigned_officer_id == models.Officer.officer_id).filter(models.Officer.location_id == target_location_id)
-        
-    pending_reviews = pending_query.count()
+    pending_reviews = counts["pending_reviews"]
 
     # 7. Risk Distribution
-    risk_query = db.query(
-        models.SupervisionEpisode.risk_level_at_start,
-        func.count(models.SupervisionEpisode.risk_level_at_start)
-    ).filter(models.SupervisionEpisode.status == 'Active')
-    
-    if target_officer_id:
-        risk_query = risk_query.filter(models.SupervisionEpisode.assigned_officer_id == target_officer_id)
-        
-    if target_location_id:
-        risk_query = risk_query.join(models.Officer, models.SupervisionEpisode.assigned_officer_id == models.Officer.officer_id).filter(models.Officer.location_id == target_location_id)
-    
-    risk_counts = risk_query.group_by(models.SupervisionEpisode.risk_level_at_start).all()
+    risk_counts = [(level, counts[f"risk_{level.lower()}"]) for level in ("Low", "Medium", "High")]
     
     # Format for frontend
     levels = {
@@ -161,15 +111,9 @@ def get_dashboard_stats(
         "High": {"value": 0, "color": "#ef4444"}    # Red-500
     }
 
-    for risk_level, count in risk_counts:
-        # Normalize keys (Low Risk -> Low)
-        key = risk_level
-        if "Low" in risk_level: key = "Low"
-        elif "Medium" in risk_level or "Moderate" in risk_level: key = "Medium"
-        elif "High" in risk_level: key = "High"
-        
-        if key in levels:
-            levels[key]["value"] += count # Add, in case of slight string variations mapping to same bucket
+    # Buckets are already normalized in SQL (Low Risk -> Low, Moderate -> Medium)
+    for key, count in risk_counts:
+        levels[key]["value"] += count
     
     risk_distribution = [
         schemas.RiskDistributionItem(name=k, value=v["value"], color=v["color"])
@@ -1,25 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Request
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from uuid import UUID
-import shutil
-import os
-import uuid
 from datetime import datetime
 
-from .. import models, schemas
+from .. import models, schemas, auth
 from ..database import get_db
+from ..services import document_store, document_delivery, document_previews, resumable_uploads
 
 router = APIRouter(
     prefix="/documents",
     tags=["Documents"]
 )
 
-MEDIA_ROOT = "backend/media"
-
-# Ensure media directory exists
-os.makedirs(MEDIA_ROOT, exist_ok=True)
-
 @router.post("/upload", response_model=schemas.Document)
 async def upload_document(
     file: UploadFile = File(...),
@@ -30,36 +23,144 @@ async def upload_document(
     category: str = Form("General"),
     db: Session = Depends(get_db)
 ):
-    # 1. Save File to Disk
-    file_ext = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(MEDIA_ROOT, unique_filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    # 2. Create DB Record
-    new_doc = models.Document(
+    # Streamed to the content-addressed store off the event loop; identical
+    # files share one blob
+    return await document_store.save_upload(
+        db, file,
         offender_id=offender_id,
         uploaded_by_id=uploaded_by_id,
         note_id=note_id,
         task_id=task_id,
         file_name=file.filename,
-        file_path=file_path,  # Store relative or absolute path? Relative is better for portability if behind a static mount.
         file_type=file.content_type,
         category=category,
         uploaded_at=datetime.utcnow()
     )
-    
-    db.add(new_doc)
-    db.commit()
-    db.refresh(new_doc)
-    
-    return new_doc
+
+# --- Resumable uploads (see services/resumable_uploads.py) ---
+
+@router.post("/uploads", response_model=schemas.UploadSession)
+def create_upload_session(request: schemas.UploadSessionCreate, db: Session = Depends(get_db)):
+    fields = request.model_dump(exclude={"chunk_size"})
+    upload = resumable_uploads.create_session(db, chunk_size=request.chunk_size, **fields)
+    return resumable_uploads.describe(upload)
+
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSession)
+def get_upload_session(upload_id: UUID, db: Session = Depends(get_db)):
+    upload = db.query(models.UploadSession).filter(models.UploadSession.upload_id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return resumable_uploads.describe(upload)
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: UUID,
+    index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    # Raw request body, streamed to disk; re-sending a chunk replaces it
+    try:
+        chunk = await resumable_uploads.write_chunk(db, upload_id, index, request.stream(), x_chunk_sha256)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except resumable_uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {"chunk_index": chunk.chunk_index, "size": chunk.size, "sha256": chunk.sha256}
+
+@router.post("/uploads/{upload_id}/commit", response_model=schemas.Document)
+async def commit_upload(upload_id: UUID, request: schemas.UploadCommit, db: Session = Depends(get_db)):
+    try:
+        return await resumable_uploads.commit(db, upload_id, request.total_chunks, request.sha256)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except resumable_uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.delete("/uploads/{upload_id}")
+def abort_upload(upload_id: UUID, db: Session = Depends(get_db)):
+    try:
+        resumable_uploads.abort(db, upload_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"message": "Upload aborted"}
 
 @router.get("/offender/{offender_id}", response_model=List[schemas.Document])
 def get_offender_documents(offender_id: UUID, db: Session = Depends(get_db)):
-    return db.query(models.Document).filter(models.Document.offender_id == offender_id).order_by(models.Document.uploaded_at.desc()).all()
+    return (
+        db.query(models.Document)
+        .options(joinedload(models.Document.blob)) # preview_status
+        .filter(models.Document.offender_id == offender_id)
+        .order_by(models.Document.uploaded_at.desc())
+        .all()
+    )
+
+@router.get("/{document_id}/link")
+def get_document_link(
+    document_id: UUID,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Short-lived URL for <a>/<video> tags, which can't send the bearer token
+    doc = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not document_delivery.can_access(db, current_user, doc):
+        raise HTTPException(status_code=403, detail="Not allowed to view this document")
+    token = document_delivery.create_link_token(current_user, document_id)
+    return {
+        "url": f"/documents/{document_id}/content?token={token}",
+        "thumbnail_url": f"/documents/{document_id}/thumbnail?token={token}",
+        "expires_in": int(document_delivery.LINK_TTL.total_seconds())
+    }
+
+def _readable_document(document_id, token, bearer, db) -> models.Document:
+    # Either a link token for this document or a regular bearer token
+    if token:
+        user = document_delivery.user_from_link_token(db, token, document_id)
+    elif bearer:
+        user = auth.user_from_token(bearer, db)
+    else:
+        user = None
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    doc = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not document_delivery.can_access(db, user, doc):
+        raise HTTPException(status_code=403, detail="Not allowed to view this document")
+    return doc
+
+# Plain def (threadpool): the access checks query the database and, on S3,
+# content_response / thumbnail_response make blocking storage requests
+@router.api_route("/{document_id}/content", methods=["GET", "HEAD"])
+def get_document_content(
+    document_id: UUID,
+    request: Request,
+    token: Optional[str] = None,
+    bearer: Optional[str] = Depends(auth.optional_oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    doc = _readable_document(document_id, token, bearer, db)
+    try:
+        return document_delivery.content_response(request, doc)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/{document_id}/thumbnail")
+def get_document_thumbnail(
+    document_id: UUID,
+    request: Request,
+    token: Optional[str] = None,
+    bearer: Optional[str] = Depends(auth.optional_oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    doc = _readable_document(document_id, token, bearer, db)
+    if doc.blob is None or not doc.blob.has_thumbnail:
+        raise HTTPException(status_code=404, detail=f"No thumbnail (preview_status: {doc.preview_status})")
+    return document_delivery.thumbnail_response(request, doc)
 
 @router.delete("/{document_id}")
 def delete_document(document_id: UUID, db: Session = Depends(get_db)):
@@ -67,10 +168,6 @@ def delete_document(document_id: UUID, db: Session = Depends(get_db)):
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
         
-    # Delete file from disk
-    if os.path.exists(doc.file_path):
-        os.remove(doc.file_path)
-        
-    db.delete(doc)
-    db.commit()
+    # Unlinks the file only when no other document shares it
+    document_store.delete_document(db, doc)
     return {"message": "Document deleted"}
@@ -7,6 +7,7 @@ import random
 
 from .. import models, schemas
 from ..database import get_db
+from ..services import caseload_service, pagination, offender_search_service, automation_events
 
 router = APIRouter(tags=["Offenders"])
 
@@ -17,8 +18,22 @@ def get_offenders(
     search: Optional[str] = None,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db)
 ):
+    """
+    Paged caseload list.
+    Two paging modes are supported:
+    - page/limit (OFFSET based, legacy)
+    - cursor/limit (keyset on offenders.last_name, then episode_id). Start with
+      an empty `cursor=` and pass the `next_cursor` of the previous response.
+      The key spans the offenders / episodes join, so a page seeks on the
+      last_name index instead of skipping OFFSET rows, but no single composite
+      index serves the whole key.
+    next_cursor is only returned in cursor mode.
+    Set include_total=false to skip the COUNT(*) query.
+    """
     print(f"DEBUG: get_offenders called. Search='{search}'")
     query = db.query(models.SupervisionEpisode).options(
         joinedload(models.SupervisionEpisode.offender),
@@ -26,30 +41,55 @@ def get_offenders(
             joinedload(models.Residence.special_assignment),
             joinedload(models.Residence.contacts)
         )
-    )
+    ).join(models.SupervisionEpisode.offender)
     
     if search:
-        search_term = f"%{search.lower()}%"
-        from sqlalchemy import or_, func
-        query = query.join(models.SupervisionEpisode.offender).filter(
-            or_(
-                func.lower(models.Offender.first_name).like(search_term),
-                func.lower(models.Offender.last_name).like(search_term),
-                func.lower(models.Offender.badge_id).like(search_term)
-            )
-        )
+        query = query.filter(offender_search_service.search_filter(db, search))
 
     if officer_id:
         query = query.filter(models.SupervisionEpisode.assigned_officer_id == officer_id)
     elif location_id:
         query = query.join(models.Officer).filter(models.Officer.location_id == location_id)
         
-    # Calculate total for pagination metadata
-    total = query.count()
+    # Calculate total for pagination metadata (optional, it re-runs the full join)
+    total = query.count() if include_total else None
+
+    # Stable sort key shared by both paging modes. NULLS LAST explicitly: SQLite
+    # and Postgres disagree on the default, and the seek below must match it
+    # (legacy rows can hold a NULL last_name).
+    query = query.order_by(models.Offender.last_name.asc().nulls_last(), models.SupervisionEpisode.episode_id.asc())
     
     # Apply Pagination
-    offset = (page - 1) * limit
-    episodes = query.offset(offset).limit(limit).all()
+    cursor_mode = cursor is not None
+    if cursor_mode:
+        if cursor:
+            try:
+                last_name, episode_id = pagination.decode_cursor(cursor, 2)
+                query = query.filter(pagination.seek_after(
+                    models.Offender.last_name,
+                    models.SupervisionEpisode.episode_id,
+                    last_name,
+                    pagination.parse_uuid(episode_id),
+                    nulls_last=True
+                ))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        episodes = query.limit(limit).all()
+    else:
+        offset = (page - 1) * limit
+        episodes = query.offset(offset).limit(limit).all()
+
+    next_cursor = None
+    if cursor_mode and len(episodes) == limit:
+        last = episodes[-1]
+        next_cursor = pagination.encode_cursor(last.offender.last_name, last.episode_id)
+
+    # Resolve per-row lookups for the whole page in a fixed number of queries
+    offender_ids = [ep.offender_id for ep in episodes if ep.offender_id]
+    next_appts = caseload_service.get_next_appointments(db, offender_ids)
+    latest_assessments = caseload_service.get_latest_assessments(db, offender_ids)
+    active_programs = caseload_service.get_active_programs(db, offender_ids)
+    employments = caseload_service.get_employments(db, offender_ids)
     
     # Transform to match frontend expectation
     results = []
@@ -90,19 +130,11 @@ def get_offenders(
                     } for c in current_residence.contacts
                 ]
         
-            # Fetch next appointment
-        next_appt = db.query(models.Appointment).filter(
-            models.Appointment.offender_id == offender.offender_id,
-            models.Appointment.date_time > datetime.utcnow(),
-            models.Appointment.status == 'Scheduled'
-        ).order_by(models.Appointment.date_time.asc()).first()
-
+        # Next appointment (batched above)
+        next_appt = next_appts.get(offender.offender_id)
 
-        # Dynamic Risk Lookup for List View
-        latest_assessment = db.query(models.RiskAssessment).filter(
-            models.RiskAssessment.offender_id == offender.offender_id,
-            models.RiskAssessment.status == 'Completed'
-        ).order_by(models.RiskAssessment.date.desc()).first()
+        # Dynamic Risk Lookup for List View (batched above)
+        latest_assessment = latest_assessments.get(offender.offender_id)
 
         current_risk = "Unknown"
         if latest_assessment:
@@ -155,7 +187,7 @@ def get_offenders(
                     "end_date": emp.end_date.isoformat() if emp.end_date else None,
                     "is_current": emp.is_current,
                     "address": f"{emp.address_line_1 or ''}, {emp.city or ''}, {emp.state or ''} {emp.zip_code or ''}".strip(", ")
-                } for emp in offender.employments
+                } for emp in employments.get(offender.offender_id, [])
             ],
             "csed_date": offender.csed_date,
             # Field Mode specific fields
@@ -163,7 +195,7 @@ def get_offenders(
             "last_name": offender.last_name,
             "offender_number": offender.badge_id,
             "risk_level": current_risk,
-            "program": next((p.offering.program_name for p in db.query(models.ProgramEnrollment).options(joinedload(models.ProgramEnrollment.offering)).filter(models.ProgramEnrollment.offender_id == offender.offender_id, models.ProgramEnrollment.status == 'Active').limit(1)), "None Assigned"),
+            "program": active_programs.get(offender.offender_id, "None Assigned"),
             # Remove duplicate phone override
         })
         
@@ -171,9 +203,33 @@ def get_offenders(
         "data": results,
         "total": total,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
+@router.get("/offenders/search")
+def search_offenders(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Ranked, index-backed offender lookup by name or badge_id (prefix).
+    Lightweight rows for type-ahead search boxes.
+    """
+    matches = offender_search_service.search_offenders(db, q, limit)
+    return [
+        {
+            "id": str(offender.offender_id),
+            "name": f"{offender.last_name}, {offender.first_name}",
+            "badgeId": offender.badge_id,
+            "first_name": offender.first_name,
+            "last_name": offender.last_name,
+            "image": offender.image_url,
+            "score": round(float(score or 0), 4)
+        } for offender, score in matches
+    ]
+
 @router.post("/offenders", response_model=schemas.Offender)
 def create_offender(offender: schemas.OffenderCreate, db: Session = Depends(get_db)):
     # 1. Create Offender
@@ -415,9 +471,7 @@ def create_urinalysis(offender_id: UUID, ua: schemas.UrinalysisCreate, db: Sessi
 
     # Trigger Automation Check
     if new_ua.result == "Positive":
-       from . import automations
-       offender = db.query(models.Offender).filter(models.Offender.offender_id == offender_id).first()
-       automations.check_event_triggers("positive_ua", offender, db)
+       automation_events.publish("positive_ua", offender_id, db)
 
     return new_ua
 
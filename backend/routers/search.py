@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from uuid import UUID
+
+from .. import models, schemas, auth
+from ..database import get_db
+from ..services import document_delivery, text_search_service
+
+router = APIRouter(
+    prefix="/search",
+    tags=["Search"]
+)
+
+@router.get("/records", response_model=schemas.RecordSearchResults)
+def search_records(
+    q: str = Query(..., min_length=1),
+    offender_id: Optional[UUID] = None,
+    officer_id: Optional[UUID] = None, # active caseload of this officer
+    types: List[str] = Query(list(text_search_service.KINDS)),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Ranked full-text search over case notes and document text, per offender
+    or across a caseload, limited to the records the user may open (see
+    document_delivery.can_access). Snippets mark matches with <mark>; pass `next_cursor`
+    back as `cursor` for the next page.
+    """
+    unknown = set(types) - set(text_search_service.KINDS)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown types: {sorted(unknown)}")
+    viewer = document_delivery.viewer_for(db, current_user)
+    if officer_id is not None and viewer is not None and officer_id not in viewer.officer_ids:
+        raise HTTPException(status_code=403, detail="Not allowed to search this officer's caseload")
+    try:
+        hits, next_cursor = text_search_service.search(
+            db, q, offender_id=offender_id, officer_id=officer_id,
+            kinds=types, limit=limit, cursor=cursor, viewer=viewer
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": hits, "next_cursor": next_cursor}
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from .. import models, schemas, auth
 from ..database import get_db
+from ..services import pagination
 
 router = APIRouter(
     prefix="/tasks",
@@ -48,13 +49,24 @@ def create_task(
 
 @router.get("", response_model=List[schemas.Task])
 def get_tasks(
+    response: Response,
     assigned_to_user_id: Optional[str] = None,
     assigned_officer_id: Optional[str] = None, # New parameter for direct officer ID
     location_id: Optional[str] = None,
     status: Optional[str] = None,
     offender_id: Optional[str] = None, # Added
+    page: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     db: Session = Depends(get_db)
 ):
+    """
+    Task list. Without page/limit/cursor every matching task is returned (legacy).
+    Paging is opt-in and keeps the list body unchanged; metadata goes in headers:
+    - X-Next-Cursor: keyset cursor on (due_date, task_id) for the next page
+    - X-Total-Count: only when include_total=true
+    """
     query = db.query(models.Task)
     
     if location_id:
@@ -93,8 +105,37 @@ def get_tasks(
 
     if offender_id:
         query = query.filter(models.Task.offender_id == offender_id)
-        
-    return query.order_by(models.Task.due_date.asc(), models.Task.created_at.desc()).all()
+
+    if limit is None and page is None and cursor is None:
+        return query.order_by(models.Task.due_date.asc(), models.Task.created_at.desc()).all()
+
+    # Paged mode: stable keyset order (due_date, task_id), undated tasks last
+    limit = limit or 50
+    if include_total:
+        response.headers["X-Total-Count"] = str(query.count())
+
+    query = query.order_by(models.Task.due_date.asc().nulls_last(), models.Task.task_id.asc())
+
+    if cursor:
+        try:
+            due_date, task_id = pagination.decode_cursor(cursor, 2)
+            query = query.filter(pagination.seek_after(
+                models.Task.due_date,
+                models.Task.task_id,
+                pagination.parse_date(due_date),
+                pagination.parse_uuid(task_id),
+                nulls_last=True
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        query = query.offset(((page or 1) - 1) * limit)
+
+    tasks = query.limit(limit).all()
+    if len(tasks) == limit:
+        last = tasks[-1]
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(last.due_date, last.task_id)
+    return tasks
 
 @router.put("/{task_id}", response_model=schemas.Task)
 def update_task(
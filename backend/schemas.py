@@ -1032,11 +1032,14 @@ class DocumentCreate(DocumentBase):
 class Document(DocumentBase):
     document_id: UUID
     offender_id: UUID
-    uploaded_by_id: UUID
+    uploaded_by_id: Optional[UUID] = None
     note_id: Optional[UUID] = None
     task_id: Optional[UUID] = None
     file_path: str
+    file_size: Optional[int] = None
+    sha256: Optional[str] = None
     uploaded_at: datetime
+    preview_status: Optional[str] = None # pending, processing, ready, unsupported, failed
     
     # Optional nested objects for display
     # uploader: Optional[Officer] = None
@@ -1044,6 +1047,32 @@ class Document(DocumentBase):
     class Config:
         from_attributes = True
 
+class UploadSessionCreate(BaseModel):
+    offender_id: UUID
+    file_name: str
+    file_type: Optional[str] = None
+    category: Optional[str] = "General"
+    uploaded_by_id: Optional[UUID] = None
+    note_id: Optional[UUID] = None
+    task_id: Optional[UUID] = None
+    total_size: Optional[int] = None
+    chunk_size: Optional[int] = None
+
+class UploadSession(BaseModel):
+    upload_id: str
+    status: str
+    file_name: str
+    chunk_size: int
+    total_size: Optional[int] = None
+    received_chunks: List[int] = []
+    received_bytes: int = 0
+    expires_at: str
+    document_id: Optional[str] = None
+
+class UploadCommit(BaseModel):
+    total_chunks: int
+    sha256: Optional[str] = None # Whole-file checksum, verified when given
+
 # --- Urinalysis ---
 class UrinalysisCreate(BaseModel):
     date: date
@@ -1070,7 +1099,7 @@ class AssessmentOptionBase(BaseModel):
     order_index: int = 0
 
 class AssessmentOptionCreate(AssessmentOptionBase):
-    pass
+    option_id: Optional[UUID] = None # Existing option (updates keep it)
 
 class AssessmentOption(AssessmentOptionBase):
     option_id: UUID
@@ -1085,6 +1114,7 @@ class AssessmentItemBase(BaseModel):
     custom_tags: Optional[List[str]] = []
 
 class AssessmentItemCreate(AssessmentItemBase):
+    item_id: Optional[UUID] = None # Existing item (updates keep it)
     options: List[AssessmentOptionCreate] = []
 
 class AssessmentItem(AssessmentItemBase):
@@ -1101,6 +1131,7 @@ class AssessmentDomainBase(BaseModel):
 
 class AssessmentDomainCreate(AssessmentDomainBase):
     id: Optional[UUID] = None # For mapping during updates
+    domain_id: Optional[UUID] = None # Existing domain (same as id)
     items: List[AssessmentItemCreate] = []
 
 class AssessmentDomain(AssessmentDomainBase):
@@ -1119,7 +1150,7 @@ class ScoringTableBase(BaseModel):
     recommendation: Optional[str] = None
 
 class ScoringTableCreate(ScoringTableBase):
-    pass
+    table_id: Optional[UUID] = None # Existing table (updates keep it)
 
 class ScoringTable(ScoringTableBase):
     table_id: UUID
@@ -1146,4 +1177,22 @@ class AssessmentInstrument(AssessmentInstrumentBase):
     class Config:
         from_attributes = True
 
+class AssessmentInstrumentUpdateResult(AssessmentInstrument):
+    # {"instrument": [changed fields], "domains": {"inserted": n, "updated": n, "deleted": n}, ...}
+    changes: Dict[str, Any] = {}
+
+# --- Full-text search ---
+class RecordSearchHit(BaseModel):
+    kind: str # note, document
+    id: UUID
+    offender_id: Optional[UUID] = None
+    date: Optional[datetime] = None
+    title: Optional[str] = None # note type / file name
+    score: float
+    snippet: str # HTML-escaped, matches wrapped in <mark>
+
+class RecordSearchResults(BaseModel):
+    results: List[RecordSearchHit] = []
+    next_cursor: Optional[str] = None
+
 ProgramEnrollment.model_rebuild()
\ No newline at end of file
@@ -0,0 +1,355 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+import numpy as np
+from sqlalchemy import desc, func, update
+from sqlalchemy.orm import Session
+from .. import models
+from .scoring_plan import FALLBACK_LEVELS, scoring_plans
+
+logger = logging.getLogger(__name__)
+
+# Bulk re-scoring of Completed assessments after a scoring matrix or option scores
+# change. Works in chunks of assessments (keyset on assessment_id):
+# - answers are scored into an (assessment x question) NumPy matrix with the
+#   compiled scoring plans (services/scoring_plan.py), each distinct
+#   (question, value) once, and scattered into the matrix in one assignment;
+# - totals, category subtotals and levels are computed on the whole chunk;
+# - changed rows are written back with one bulk UPDATE per chunk.
+# Overridden assessments keep their final_risk_level. Offenders whose latest
+# assessment changes level get their active episode's current_risk_level updated;
+# no 'risk_level_change' automation event is published for a retroactive rescore.
+# preview=True computes the same report without writing.
+# Scoring edits (risk_assessment_service.update_type / update_question) call
+# schedule(). Applying without a preview is opt-in:
+# - "manual" (default): nothing runs; preview and apply with POST /assessments/rescore.
+# - "thread": one background thread with its own session; requests arriving
+#   while it runs are coalesced per type.
+# - "celery": backend.tasks.rescore_assessments.
+# - "sync": immediately, in the caller's thread (tests, scripts).
+# Pick with RESCORE_TRANSPORT.
+
+UNKNOWN = "Unknown"
+
+def risk_levels(plan, totals: np.ndarray) -> np.ndarray:
+    """
+    Vectorized ScoringPlan.risk_level.
+    """
+    if not plan.has_matrix:
+        conditions = [totals >= threshold for threshold, _ in FALLBACK_LEVELS]
+        return np.select(conditions, [level for _, level in FALLBACK_LEVELS], default="Low").astype(object)
+    labels = np.array([label or UNKNOWN for label in plan.labels] + [UNKNOWN], dtype=object)
+    index = np.searchsorted(np.asarray(plan.starts, dtype=np.int64), totals, side="right") - 1
+    index[index < 0] = len(labels) - 1 # below the first band
+    return labels[index]
+
+class ScoreMatrix:
+    """
+    Column layout shared by every plan compiled from the same catalog version.
+    """
+    def __init__(self, scorers: dict):
+        self.tags = list(scorers)
+        self.columns = {tag: i for i, tag in enumerate(self.tags)}
+        self.categories = sorted({s.category for s in scorers.values()})
+        # (question x category) one-hot membership
+        self.membership = np.zeros((len(self.tags), len(self.categories)), dtype=np.int64)
+        category_index = {c: i for i, c in enumerate(self.categories)}
+        for tag, scorer in scorers.items():
+            self.membership[self.columns[tag], category_index[scorer.category]] = 1
+
+    def score(self, scorers: dict, row_of: dict, answers):
+        """
+        answers: (assessment_id, tag, value) rows. Returns the score matrix, the
+        answered mask (for per-question details) and the category subtotals.
+        """
+        scores = np.zeros((len(row_of), len(self.tags)), dtype=np.int64)
+        answered = np.zeros(scores.shape, dtype=bool)
+        rows, columns, points = [], [], []
+        memo = {} # (column, value) -> points: each distinct answer is scored once
+        for assessment_id, tag, value in answers:
+            column = self.columns.get(tag)
+            if column is None:
+                continue # not in the question bank: ignored, as in calculate_score
+            try:
+                value_points = memo.get((column, value))
+                if value_points is None:
+                    value_points = memo[(column, value)] = scorers[tag].score(value)
+            except TypeError: # unhashable answer (list/dict)
+                value_points = scorers[tag].score(value)
+            rows.append(row_of[assessment_id])
+            columns.append(column)
+            points.append(value_points)
+        if rows:
+            scores[rows, columns] = points
+            answered[rows, columns] = True
+        return scores, answered, scores @ self.membership
+
+def _chunks(db: Session, assessment_type, chunk_size):
+    ra = models.RiskAssessment
+    last_id = None
+    while True:
+        query = db.query(
+            ra.assessment_id, ra.offender_id, ra.date, ra.assessment_type, ra.total_score,
+            ra.risk_level, ra.final_risk_level, ra.override_reason, ra.details
+        ).filter(ra.status == 'Completed')
+        if assessment_type is not None:
+            query = query.filter(ra.assessment_type == assessment_type)
+        if last_id is not None:
+            query = query.filter(ra.assessment_id > last_id)
+        rows = query.order_by(ra.assessment_id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].assessment_id
+
+def _latest_assessments(db: Session, offender_ids) -> dict:
+    """
+    offender_id -> assessment_id of the offender's most recent Completed assessment.
+    """
+    ra = models.RiskAssessment
+    latest = {}
+    offender_ids = list(offender_ids)
+    for start in range(0, len(offender_ids), 500):
+        ranked = (
+            db.query(
+                ra.offender_id.label("offender_id"),
+                ra.assessment_id.label("assessment_id"),
+                func.row_number().over(
+                    partition_by=ra.offender_id, order_by=(desc(ra.date), desc(ra.assessment_id))
+                ).label("rank")
+            )
+            .filter(ra.status == 'Completed', ra.offender_id.in_(offender_ids[start:start + 500]))
+            .subquery()
+        )
+        latest.update(db.query(ranked.c.offender_id, ranked.c.assessment_id).filter(ranked.c.rank == 1))
+    return latest
+
+def rescore_assessments(db: Session, assessment_type: str = None, preview: bool = False,
+                        chunk_size: int = 1000, sample_size: int = 50) -> dict:
+    """
+    Re-scores Completed assessments (optionally of one type) with the current
+    questions and scoring matrices. Returns the before/after diff report.
+    """
+    started = time.perf_counter()
+    report = {
+        "assessment_type": assessment_type,
+        "preview": preview,
+        "scanned": 0,
+        "changed": 0,
+        "level_changes": 0,
+        "offenders_changed": 0,
+        "transitions": {},
+        "changes": [],
+        "seconds": 0.0,
+    }
+    transitions = Counter()
+    new_final = {} # assessment_id -> (offender_id, before, after) for final level changes
+
+    layout = None
+    for rows in _chunks(db, assessment_type, chunk_size):
+        plans = {}
+        for name in {row.assessment_type for row in rows}:
+            plans[name] = scoring_plans.get(db, name)
+        scorers = next(iter(plans.values())).scorers
+        if layout is None or layout.tags != list(scorers):
+            layout = ScoreMatrix(scorers)
+
+        row_of = {row.assessment_id: i for i, row in enumerate(rows)}
+        answers = (
+            db.query(models.RiskAssessmentAnswer.assessment_id, models.RiskAssessmentAnswer.question_tag,
+                     models.RiskAssessmentAnswer.value)
+            .filter(models.RiskAssessmentAnswer.assessment_id.in_(list(row_of)))
+            .all()
+        )
+        scores, answered, category_scores = layout.score(scorers, row_of, answers)
+        totals = scores.sum(axis=1)
+
+        levels = np.empty(len(rows), dtype=object)
+        types = np.array([row.assessment_type for row in rows], dtype=object)
+        for name, plan in plans.items():
+            mask = types == name
+            levels[mask] = risk_levels(plan, totals[mask])
+
+        updates = []
+        for i, row in enumerate(rows):
+            total, level = int(totals[i]), levels[i]
+            columns = np.flatnonzero(answered[i])
+            details = {layout.tags[c]: int(scores[i, c]) for c in columns}
+            if total == row.total_score and level == row.risk_level and details == (row.details or {}):
+                continue
+
+            # Overrides stand; otherwise the applied level follows the calculated one
+            overridden = bool(row.override_reason) or (
+                row.final_risk_level is not None and row.final_risk_level != row.risk_level
+            )
+            final = row.final_risk_level if overridden else level
+            updates.append({
+                "assessment_id": row.assessment_id, "total_score": total, "risk_level": level,
+                "final_risk_level": final, "details": details,
+            })
+            if level != row.risk_level:
+                report["level_changes"] += 1
+                transitions[f"{row.risk_level} -> {level}"] += 1
+            if final != row.final_risk_level:
+                new_final[row.assessment_id] = (row.offender_id, row.final_risk_level, final)
+            if len(report["changes"]) < sample_size:
+                report["changes"].append({
+                    "assessment_id": str(row.assessment_id),
+                    "offender_id": str(row.offender_id),
+                    "assessment_type": row.assessment_type,
+                    "date": row.date.isoformat() if row.date else None,
+                    "before": {"total_score": row.total_score, "risk_level": row.risk_level,
+                               "final_risk_level": row.final_risk_level},
+                    "after": {"total_score": total, "risk_level": level, "final_risk_level": final,
+                              "category_scores": {c: int(v) for c, v in zip(layout.categories, category_scores[i]) if v}},
+                })
+
+        report["scanned"] += len(rows)
+        report["changed"] += len(updates)
+        if updates and not preview:
+            db.execute(update(models.RiskAssessment), updates)
+            db.commit()
+
+    # Offenders whose current level (their latest assessment) changes
+    changed_offenders = {}
+    if new_final:
+        latest = _latest_assessments(db, {offender_id for offender_id, _, _ in new_final.values()})
+        for assessment_id, (offender_id, _, final) in new_final.items():
+            if latest.get(offender_id) == assessment_id:
+                changed_offenders[offender_id] = final
+    report["offenders_changed"] = len(changed_offenders)
+
+    if changed_offenders and not preview:
+        episodes = (
+            db.query(models.SupervisionEpisode)
+            .filter(models.SupervisionEpisode.offender_id.in_(list(changed_offenders)))
+            .filter(models.SupervisionEpisode.status == 'Active')
+            .all()
+        )
+        for episode in episodes:
+            episode.current_risk_level = changed_offenders[episode.offender_id]
+        db.commit()
+
+    if preview:
+        db.rollback()
+    report["transitions"] = dict(transitions)
+    report["seconds"] = round(time.perf_counter() - started, 4)
+    return report
+
+# --- Automatic rescore after scoring edits ---
+
+def _run(session_factory, assessment_type):
+    db = session_factory()
+    try:
+        report = rescore_assessments(db, assessment_type=assessment_type)
+        logger.info(f"Rescored {assessment_type or 'all types'}: {report['changed']} changed, "
+                    f"{report['level_changes']} level changes")
+        return report
+    finally:
+        db.close()
+
+def _default_session_factory():
+    from ..database import SessionLocal
+    return SessionLocal
+
+class ThreadRescorer:
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._pending = set() # type names; None = every type
+        self._thread = None
+        self.runs = 0
+
+    def schedule(self, assessment_type=None):
+        with self._lock:
+            self._pending.add(assessment_type)
+            if None in self._pending:
+                self._pending = {None}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain, name="assessment-rescore", daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: float = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _drain(self):
+        session_factory = self._session_factory or _default_session_factory()
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                assessment_type = self._pending.pop()
+            try:
+                _run(session_factory, assessment_type)
+                self.runs += 1
+            except Exception as e:
+                logger.error(f"Rescore of {assessment_type or 'all types'} failed: {e}")
+
+class SyncRescorer:
+    """
+    Rescores immediately in the caller's thread with its own session.
+    """
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def schedule(self, assessment_type=None):
+        _run(self._session_factory or _default_session_factory(), assessment_type)
+
+    def flush(self, timeout: float = None): pass
+
+class CeleryRescorer:
+    """
+    Sends the rescore to the Celery worker (requires the Celery broker, see backend/tasks.py).
+    """
+    def schedule(self, assessment_type=None):
+        from ..tasks import rescore_assessments as rescore_task
+        rescore_task.delay(assessment_type)
+
+    def flush(self, timeout: float = None): pass
+
+class ManualRescorer:
+    """
+    Runs nothing; records what was requested (stale scores until POST /assessments/rescore).
+    """
+    def __init__(self):
+        self.requested = []
+
+    def schedule(self, assessment_type=None):
+        self.requested.append(assessment_type)
+
+    def flush(self, timeout: float = None): pass
+
+_TRANSPORTS = {"thread": ThreadRescorer, "sync": SyncRescorer, "celery": CeleryRescorer, "manual": ManualRescorer}
+_rescorer = None
+
+def get_rescorer():
+    global _rescorer
+    if _rescorer is None:
+        transport = os.getenv("RESCORE_TRANSPORT", "manual").lower()
+        if transport not in _TRANSPORTS:
+            logger.warning(f"Unknown RESCORE_TRANSPORT '{transport}', using manual")
+            transport = "manual"
+        _rescorer = _TRANSPORTS[transport]()
+    return _rescorer
+
+def set_rescorer(rescorer):
+    """
+    Replaces the active rescorer. Used by tests and scripts.
+    """
+    global _rescorer
+    _rescorer = rescorer
+
+def schedule(assessment_type: str = None):
+    """
+    Queues a rescore of one type's Completed assessments (None = every type).
+    Call after the scoring change is committed.
+    """
+    try:
+        get_rescorer().schedule(assessment_type)
+    except Exception as e:
+        logger.error(f"Could not schedule rescore of {assessment_type or 'all types'}: {e}")
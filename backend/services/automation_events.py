@@ -0,0 +1,227 @@
+import logging
+import os
+import queue
+import threading
+import time
+from . import automation_service
+
+logger = logging.getLogger(__name__)
+
+# Event bus for automation triggers ('positive_ua', 'risk_level_change', ...).
+# Request handlers call publish() and return; rules are evaluated elsewhere:
+# - "inprocess" (default): bounded queue + background thread that batches events,
+#   evaluates them against an in-memory rule index and bulk-inserts the tasks.
+# - "celery": events are sent to the backend.tasks.process_automation_events task.
+# - "sync": evaluated immediately in the caller's session (tests, scripts).
+# Pick with AUTOMATION_EVENT_TRANSPORT.
+
+RULE_INDEX_TTL = 60 # seconds; rule create/delete also invalidates the index
+
+class InProcessEventBus:
+    def __init__(self, session_factory=None, maxsize: int = 1000, batch_size: int = 100,
+                 batch_wait: float = 0.25, put_timeout: float = 1.0):
+        self._session_factory = session_factory
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.put_timeout = put_timeout
+        self._lock = threading.Lock() # worker thread and counters
+        self._thread = None
+        self._rule_index = None
+        self.published = 0
+        self.processed = 0
+        self.batches = 0
+        self.tasks_created = 0
+        self.inline = 0 # queue was full; evaluated in the caller's thread
+        self.errors = 0
+
+    def session_factory(self):
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="automation-events", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """
+        Drains the queue and stops the worker.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def publish(self, event_name: str, offender_id, db=None):
+        self.start()
+        event = (event_name, str(offender_id))
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            # Back-pressure: don't drop the event, evaluate it in the caller
+            logger.warning(f"Automation event queue full; evaluating '{event_name}' inline")
+            self._count(inline=1)
+            self._process([event])
+            return
+        self._count(published=1)
+
+    def flush(self, timeout: float = None):
+        """
+        Blocks until every published event has been processed.
+        """
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def invalidate_rules(self):
+        self._rule_index = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "transport": "inprocess",
+                "queued": self._queue.qsize(),
+                "published": self.published,
+                "processed": self.processed,
+                "batches": self.batches,
+                "tasks_created": self.tasks_created,
+                "inline": self.inline,
+                "errors": self.errors,
+            }
+
+    def _count(self, **deltas):
+        # Counters are bumped from the worker and, for inline events, from
+        # request threads; += on an attribute isn't atomic
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _index(self, db):
+        index = self._rule_index
+        if index is None or time.monotonic() - index.loaded_at > RULE_INDEX_TTL:
+            index = automation_service.RuleIndex.load(db)
+            self._rule_index = index
+        return index
+
+    def _process(self, events):
+        db = self.session_factory()()
+        try:
+            created = automation_service.evaluate_events(db, events, self._index(db))
+            self._count(tasks_created=created, batches=1)
+        except Exception as e:
+            db.rollback()
+            self._count(errors=1)
+            logger.error(f"Automation events failed ({len(events)} events): {e}")
+        finally:
+            db.close()
+        self._count(processed=len(events))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            # Collect whatever else arrives within batch_wait, up to batch_size
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+            try:
+                self._process(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+class SyncEventBus:
+    """
+    Evaluates each event immediately, in the publisher's session when given one.
+    """
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def publish(self, event_name: str, offender_id, db=None):
+        if db is not None:
+            automation_service.check_automations(db, event_name, offender_id)
+            return
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        own = self._session_factory()
+        try:
+            automation_service.check_automations(own, event_name, offender_id)
+        finally:
+            own.close()
+
+    def start(self): pass
+    def stop(self, timeout: float = 10): pass
+    def flush(self, timeout: float = None): pass
+    def invalidate_rules(self): pass
+    def stats(self) -> dict:
+        return {"transport": "sync"}
+
+class CeleryEventBus:
+    """
+    Sends events to the Celery worker (requires the Celery broker, see backend/tasks.py).
+    """
+    def publish(self, event_name: str, offender_id, db=None):
+        from ..tasks import process_automation_events
+        process_automation_events.delay([[event_name, str(offender_id)]])
+
+    def start(self): pass
+    def stop(self, timeout: float = 10): pass
+    def flush(self, timeout: float = None): pass
+    def invalidate_rules(self): pass # workers load rules per batch
+    def stats(self) -> dict:
+        return {"transport": "celery"}
+
+_TRANSPORTS = {"inprocess": InProcessEventBus, "sync": SyncEventBus, "celery": CeleryEventBus}
+_bus = None
+
+def get_event_bus():
+    global _bus
+    if _bus is None:
+        transport = os.getenv("AUTOMATION_EVENT_TRANSPORT", "inprocess").lower()
+        if transport not in _TRANSPORTS:
+            logger.warning(f"Unknown AUTOMATION_EVENT_TRANSPORT '{transport}', using inprocess")
+            transport = "inprocess"
+        _bus = _TRANSPORTS[transport]()
+    return _bus
+
+def set_event_bus(bus):
+    """
+    Replaces the active bus (stopping the previous one). Used by tests and scripts.
+    """
+    global _bus
+    if _bus is not None:
+        _bus.stop()
+    _bus = bus
+
+def publish(event_name: str, offender_id, db=None):
+    """
+    Publishes an automation event. Call after the triggering change is committed.
+    """
+    get_event_bus().publish(event_name, offender_id, db)
+
+def invalidate_rules():
+    get_event_bus().invalidate_rules()
@@ -0,0 +1,161 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from uuid import UUID
+from sqlalchemy import create_engine, event, func, text
+from sqlalchemy.orm import Session, sessionmaker
+from .. import models
+from .. import automation
+from . import job_lock
+
+# Sharded daily automation runs.
+# Offenders are partitioned by a hash of offender_id (the low 32 bits of the UUID,
+# which are random for uuid4) into N shards. Each shard is evaluated in its own
+# worker process with its own engine/session and commits independently, so a failed
+# shard can be re-run on its own (each firing is claimed once per rule, episode and
+# trigger date in the automation_runs ledger, see automation.py).
+# The whole run holds the 'daily_automations' job lock, renewed as each shard
+# finishes so a run longer than LOCK_TTL isn't overtaken by the next one.
+# Rule watermarks (incremental mode) are advanced by the coordinator, and only
+# when every shard succeeded, so a partial run is fully re-evaluated next time.
+
+LOCK_NAME = "daily_automations"
+LOCK_TTL = timedelta(hours=6) # must outlast the slowest single shard
+
+def shard_of(offender_id, shard_count: int) -> int:
+    """
+    Python equivalent of shard_filter(): which shard an offender belongs to.
+    """
+    return (UUID(str(offender_id)).int & 0xFFFFFFFF) % shard_count
+
+def _sqlite_shard(hex_id, shard_count):
+    if hex_id is None:
+        return None
+    return int(str(hex_id).replace('-', '')[-8:], 16) % shard_count
+
+def register_shard_function(engine):
+    """
+    SQLite has no hash function; expose offender_shard(id, n) on every connection.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("offender_shard", 2, _sqlite_shard, deterministic=True)
+
+def shard_filter(dialect_name: str, shard_index: int, shard_count: int):
+    """
+    WHERE clause selecting the offenders in one shard.
+    """
+    if shard_count <= 1:
+        return None
+    if dialect_name == 'sqlite':
+        return func.offender_shard(models.Offender.offender_id, shard_count) == shard_index
+    if dialect_name == 'postgresql':
+        return text(
+            "(('x' || right(replace(CAST(offenders.offender_id AS TEXT), '-', ''), 8))::bit(32)::bigint % :shard_count) = :shard_index"
+        ).bindparams(shard_count=shard_count, shard_index=shard_index)
+    raise ValueError(f"Sharded automation runs are not supported on {dialect_name}")
+
+def run_shard(database_url: str, today, shard_index: int, shard_count: int, incremental: bool = False) -> dict:
+    """
+    Worker entry point: evaluates every active rule for one shard.
+    Runs in a child process, so it builds its own engine and session.
+    """
+    started = time.perf_counter()
+    engine = create_engine(
+        database_url, connect_args={"check_same_thread": False} if "sqlite" in database_url else {}
+    )
+    register_shard_function(engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        rules = db.query(models.AutomationRule).filter(models.AutomationRule.is_active == True).all()
+        created, failed_rules = automation.evaluate_rules(
+            db, rules, today, shard_filter(engine.dialect.name, shard_index, shard_count), incremental
+        )
+    finally:
+        db.close()
+        engine.dispose()
+    return {
+        "shard": shard_index,
+        "tasks_created": created,
+        "failed_rules": sorted(failed_rules),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+def run_parallel_automations(db: Session, shard_count: int = 4, workers: int = None, only_shards=None,
+                             retries: int = 1, today=None, database_url: str = None, incremental: bool = False) -> dict:
+    """
+    Runs the daily automations across `shard_count` shards in a process pool.
+
+    only_shards: re-run just these shard indices (e.g. the ones that failed last night).
+                 Watermarks are not advanced by such partial runs.
+    retries:     how many times a failed shard is retried within this run.
+    incremental: see automation.run_daily_automations.
+
+    Returns {"shards": [...per-shard results...], "tasks_created", "seconds", "failed", "failed_rules"}.
+    Raises job_lock.LockNotAcquired if another run is in progress, or took the
+    lock over because a shard outlasted LOCK_TTL.
+    """
+    today = today or datetime.now().date()
+    database_url = database_url or db.get_bind().url.render_as_string(hide_password=False)
+    pending = sorted(set(only_shards)) if only_shards is not None else list(range(shard_count))
+    for index in pending:
+        if not 0 <= index < shard_count:
+            raise ValueError(f"Shard {index} out of range for {shard_count} shards")
+
+    started = time.perf_counter()
+    results = {}
+    attempts = {index: 0 for index in pending}
+
+    with job_lock.job_lock(db, LOCK_NAME, LOCK_TTL) as owner:
+        run_started = datetime.utcnow()
+        rules = db.query(models.AutomationRule).filter(models.AutomationRule.is_active == True).all()
+        versions = {rule.rule_id: automation.definition_version(rule) for rule in rules}
+
+        with ProcessPoolExecutor(max_workers=workers or min(shard_count, len(pending)) or 1) as pool:
+            while pending:
+                futures = {pool.submit(run_shard, database_url, today, index, shard_count, incremental): index for index in pending}
+                pending = []
+                for future in as_completed(futures):
+                    index = futures[future]
+                    if not job_lock.renew(db, LOCK_NAME, owner, LOCK_TTL):
+                        raise job_lock.LockNotAcquired(f"'{LOCK_NAME}' expired during shard {index} and was taken over")
+                    attempts[index] += 1
+                    try:
+                        results[index] = dict(future.result(), status="ok", attempts=attempts[index])
+                    except Exception as e:
+                        results[index] = {"shard": index, "tasks_created": 0, "failed_rules": [], "seconds": None,
+                                          "status": "failed", "error": str(e), "attempts": attempts[index]}
+                        if attempts[index] <= retries:
+                            pending.append(index)
+
+        shards = [results[index] for index in sorted(results)]
+        if only_shards is None and all(s["status"] == "ok" for s in shards):
+            failed_rules = {rule_id for s in shards for rule_id in s["failed_rules"]}
+            automation.advance_rule_watermarks(
+                db, {rid: v for rid, v in versions.items() if rid not in failed_rules}, today, run_started
+            )
+
+    return {
+        "shards": shards,
+        "tasks_created": sum(s["tasks_created"] for s in shards),
+        "seconds": round(time.perf_counter() - started, 3),
+        "failed": [s["shard"] for s in shards if s["status"] == "failed"],
+        "failed_rules": sorted({rule_id for s in shards for rule_id in s["failed_rules"]}),
+    }
+
+def format_report(report: dict) -> str:
+    lines = [f"{'shard':>5} {'status':>7} {'tasks':>6} {'seconds':>8} {'tries':>5}"]
+    for s in report["shards"]:
+        seconds = f"{s['seconds']:.3f}" if s["seconds"] is not None else "-"
+        lines.append(f"{s['shard']:>5} {s['status']:>7} {s['tasks_created']:>6} {seconds:>8} {s['attempts']:>5}")
+        if s.get("error"):
+            lines.append(f"      error: {s['error']}")
+    lines.append(f"Total: {report['tasks_created']} tasks in {report['seconds']:.3f}s")
+    if report["failed_rules"]:
+        lines.append(f"Rules with errors: {','.join(str(i) for i in report['failed_rules'])}")
+    if report["failed"]:
+        lines.append(f"Failed shards: {','.join(str(i) for i in report['failed'])} (re-run with --only)")
+    return "\n".join(lines)
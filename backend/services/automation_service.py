@@ -1,16 +1,22 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from types import SimpleNamespace
+from uuid import UUID
 from .. import models
+from . import rule_compiler
 import datetime
+import time
 
 def check_automations(db: Session, event_name: str, offender_id: str):
     """
-    Evaluates automation rules triggered by a specific event (e.g., 'positive_ua').
+    Evaluates automation rules triggered by a specific event (e.g., 'positive_ua'), synchronously.
+    Request handlers should publish through services/automation_events.py instead.
     """
     # Resolve offender object if ID is passed
-    if isinstance(offender_id, str) or isinstance(offender_id, models.UUID):
-        offender = db.query(models.Offender).filter(models.Offender.offender_id == offender_id).first()
+    if isinstance(offender_id, models.Offender):
+        offender = offender_id # Object passed
     else:
-        offender = offender_id # Assume object passed
+        offender = db.query(models.Offender).filter(models.Offender.offender_id == UUID(str(offender_id))).first()
         
     if not offender:
         print(f"DEBUG: Offender {offender_id} not found for automation check.")
@@ -18,103 +24,100 @@ def check_automations(db: Session, event_name: str, offender_id: str):
 
     print(f"DEBUG: Checking automations for event '{event_name}' on offender {offender.last_name}")
     
-    # 1. Fetch active rules for this trigger
-    rules = db.query(models.AutomationRule).filter(
-        models.AutomationRule.trigger_field == event_name,
-        models.AutomationRule.is_active == True
-    ).all()
-    
-    if not rules:
-        print("DEBUG: No rules found for this event.")
-        return
+    created = evaluate_events(db, [(event_name, offender)], RuleIndex.load(db, [event_name]))
+    if created:
+        print(f"DEBUG: {created} task(s) created for event '{event_name}'")
+
+class RuleIndex:
+    """
+    Active event rules grouped by trigger_field, with compiled conditions.
+    Holds plain snapshots (no ORM instances) so it can be shared across sessions/threads.
+    """
+    def __init__(self, by_trigger):
+        self.by_trigger = by_trigger
+        self.loaded_at = time.monotonic()
 
-    # 2. Evaluate Conditions & Execute Actions
-    for rule in rules:
-        is_match = True
-        for cond in rule.conditions:
-            field = cond.get('field')
-            operator = cond.get('operator')
-            value = cond.get('value')
-            
-            # Resolve actual value
-            actual_value = getattr(offender, field, None)
-            
-            # --- Condition Logic ---
+    @classmethod
+    def load(cls, db: Session, event_names=None):
+        query = db.query(models.AutomationRule).filter(models.AutomationRule.is_active == True)
+        if event_names is not None:
+            query = query.filter(models.AutomationRule.trigger_field.in_(list(event_names)))
+
+        by_trigger = {}
+        for rule in query.all():
             try:
-                # String Operations
-                if operator == 'equals':
-                    if str(actual_value) != str(value): is_match = False
-                elif operator == 'not_equals':
-                    if str(actual_value) == str(value): is_match = False
-                elif operator == 'contains':
-                    if value.lower() not in str(actual_value or '').lower(): is_match = False
-                elif operator == 'starts_with':
-                    if not str(actual_value or '').lower().startswith(value.lower()): is_match = False
-                elif operator == 'is_empty':
-                    if actual_value is not None and str(actual_value).strip() != '': is_match = False
-                elif operator == 'is_not_empty':
-                    if actual_value is None or str(actual_value).strip() == '': is_match = False
-                
-                # Numeric Operations
-                elif operator in ['num_equals', 'greater_than', 'less_than', 'is_between']:
-                    try:
-                        num_actual = float(actual_value or 0)
-                    except (ValueError, TypeError):
-                        num_actual = 0
-                        
-                    if operator == 'is_between':
-                         # Parse "X and Y" or "X-Y"
-                         val_str = str(value).lower().replace(' and ', ',').replace('-', ',')
-                         parts = [float(x.strip()) for x in val_str.split(',') if x.strip()]
-                         if len(parts) >= 2:
-                             if not (parts[0] <= num_actual <= parts[1]): is_match = False
-                         else:
-                             print(f"DEBUG: Invalid range format for is_between: {value}")
-                             is_match = False
-                    else:
-                        num_val = float(value or 0)
-                        if operator == 'num_equals' and num_actual != num_val: is_match = False
-                        elif operator == 'greater_than' and num_actual <= num_val: is_match = False
-                        elif operator == 'less_than' and num_actual >= num_val: is_match = False
-                
-                # Date Operations
-                elif operator in ['date_equals', 'is_before', 'is_after']:
-                    # Assuming actual_value is date object or ISO string, and value is YYYY-MM-DD
-                    date_val = datetime.datetime.strptime(value, "%Y-%m-%d").date()
-                    
-                    if actual_value:
-                        date_actual = actual_value if isinstance(actual_value, datetime.date) else datetime.datetime.strptime(str(actual_value)[:10], "%Y-%m-%d").date()
-                        
-                        if operator == 'date_equals' and date_actual != date_val: is_match = False
-                        elif operator == 'is_before' and date_actual >= date_val: is_match = False
-                        elif operator == 'is_after' and date_actual <= date_val: is_match = False
-                    else:
-                        is_match = False # Date required but missing
-                    
-            except Exception as e:
-                print(f"DEBUG: Error evaluating condition {field} {operator} {value}: {e}")
-                is_match = False
-                
-            if not is_match:
-                break
-                
-        if is_match:
-            print(f"DEBUG: Rule '{rule.name}' matched! Creating task...")
-            
-            # Create Task
-            # Calculate due date
-            due_date = datetime.datetime.utcnow() + datetime.timedelta(days=rule.due_offset)
-            
-            new_task = models.Task(
-                title=rule.task_title,
-                description=rule.task_description or f"Auto-generated from rule: {rule.name}",
-                priority=rule.task_priority,
-                status="Pending",
-                due_date=due_date,
-                offender_id=offender.offender_id,
-                assigned_officer_id=offender.assigned_officer_id, # Assign to their officer
-                category="Supervision",
-                is_parole_plan=rule.action_is_parole_plan # Added
+                compiled = rule_compiler.get_compiled(rule)
+            except rule_compiler.RuleCompileError as e:
+                print(f"DEBUG: Skipping invalid rule '{rule.name}': {e}")
+                continue
+            snapshot = SimpleNamespace(
+                rule_id=rule.rule_id, name=rule.name, task_title=rule.task_title,
+                task_description=rule.task_description, due_offset=rule.due_offset or 0,
+                action_is_parole_plan=rule.action_is_parole_plan
             )
-            db.add(new_task)
-            db.commit()
+            by_trigger.setdefault(rule.trigger_field, []).append((snapshot, compiled))
+        return cls(by_trigger)
+
+    def rules_for(self, event_name):
+        return self.by_trigger.get(event_name, [])
+
+def evaluate_events(db: Session, events, rule_index: RuleIndex) -> int:
+    """
+    Evaluates a batch of (event_name, offender or offender_id) events and bulk-inserts
+    the resulting tasks. Offenders and their active episodes are loaded in one query each.
+    Returns the number of tasks created.
+    """
+    events = [(name, target) for name, target in events if rule_index.rules_for(name)]
+    if not events:
+        return 0
+
+    offenders = {}
+    ids = set()
+    for _, target in events:
+        if isinstance(target, models.Offender):
+            offenders[target.offender_id] = target
+        else:
+            ids.add(UUID(str(target)))
+    ids -= set(offenders)
+    if ids:
+        for offender in db.query(models.Offender).filter(models.Offender.offender_id.in_(ids)):
+            offenders[offender.offender_id] = offender
+
+    # Active episode gives conditions their episode fields and the task its officer
+    episodes = {}
+    for episode in db.query(models.SupervisionEpisode).filter(
+        models.SupervisionEpisode.offender_id.in_(list(offenders)),
+        models.SupervisionEpisode.status == 'Active'
+    ).order_by(models.SupervisionEpisode.start_date.desc()):
+        episodes.setdefault(episode.offender_id, episode)
+
+    now = datetime.datetime.utcnow()
+    new_tasks = []
+    for event_name, target in events:
+        offender_id = target.offender_id if isinstance(target, models.Offender) else UUID(str(target))
+        offender = offenders.get(offender_id)
+        if not offender:
+            print(f"DEBUG: Offender {offender_id} not found for automation check.")
+            continue
+        episode = episodes.get(offender_id)
+
+        for rule, compiled in rule_index.rules_for(event_name):
+            if not compiled.matches(offender, episode):
+                continue
+            print(f"DEBUG: Rule '{rule.name}' matched! Creating task...")
+            new_tasks.append({
+                "title": rule.task_title,
+                "description": rule.task_description or f"Auto-generated from rule: {rule.name}",
+                "status": "Pending",
+                "due_date": (now + datetime.timedelta(days=rule.due_offset)).date(),
+                "offender_id": offender.offender_id,
+                "episode_id": episode.episode_id if episode else None,
+                "assigned_officer_id": episode.assigned_officer_id if episode else None, # Assign to their officer
+                "category": "Supervision",
+                "is_parole_plan": rule.action_is_parole_plan
+            })
+
+    if new_tasks:
+        db.execute(insert(models.Task), new_tasks)
+        db.commit()
+    return len(new_tasks)
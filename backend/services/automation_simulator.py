@@ -0,0 +1,154 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .. import models, automation
+from . import rule_compiler
+
+# Dry-run of automation rules: evaluates rules against the current data without
+# writing anything and reports, per rule, how many offenders match, how many tasks
+# would be created (not already in the automation_runs ledger), a sample of the
+# matched offenders, and the evaluation cost (wall time + SQL statements).
+
+@contextmanager
+def count_queries(db: Session):
+    counter = {"count": 0}
+    connection = db.connection()
+
+    def _count(*args):
+        counter["count"] += 1
+
+    event.listen(connection, "before_cursor_execute", _count)
+    try:
+        yield counter
+    finally:
+        event.remove(connection, "before_cursor_execute", _count)
+
+def _sample_row(rule, offender, episode, trigger_date=None):
+    return {
+        "offender_id": str(offender.offender_id),
+        "name": f"{offender.first_name} {offender.last_name}",
+        "badge_id": offender.badge_id,
+        "assigned_officer_id": str(episode.assigned_officer_id) if episode and episode.assigned_officer_id else None,
+        "trigger_date": trigger_date.isoformat() if trigger_date else None,
+        "due_date": automation.due_date(rule, trigger_date).isoformat() if trigger_date else None,
+    }
+
+def _event_matches(db: Session, rule):
+    """
+    Event rules have no date window: every supervised offender is a candidate
+    the next time the event fires.
+    """
+    compiled = rule_compiler.get_compiled(rule)
+    query = (
+        db.query(models.Offender, models.SupervisionEpisode)
+        .join(models.SupervisionEpisode, models.SupervisionEpisode.offender_id == models.Offender.offender_id)
+        .filter(models.SupervisionEpisode.status == 'Active')
+    )
+    if compiled.sql_filter is not None:
+        query = query.filter(compiled.sql_filter)
+    seen = set()
+    matches = []
+    for offender, episode in query:
+        if offender.offender_id in seen or not compiled.matches(offender, episode):
+            continue
+        seen.add(offender.offender_id)
+        matches.append((offender, episode))
+    return matches
+
+def simulate_rule(db: Session, rule, today=None, sample_size: int = 10) -> dict:
+    """
+    Dry-runs one rule (saved or a transient AutomationRule) and returns its report.
+    """
+    today = today or datetime.now().date()
+    result = {
+        "rule_id": rule.rule_id,
+        "name": rule.name,
+        "is_active": rule.is_active,
+        "trigger_type": "date" if automation.trigger_column(rule) is not None else "event",
+        "matches": 0,
+        "would_create": 0,
+        "already_fired": 0,
+        "sample": [],
+        "seconds": 0.0,
+        "queries": 0,
+        "error": None,
+    }
+
+    started = time.perf_counter()
+    with count_queries(db) as queries:
+        try:
+            if result["trigger_type"] == "date":
+                matches = automation.match_rule(db, rule, today)
+                keys = {(episode.episode_id, getattr(offender, rule.trigger_field)) for offender, episode in matches}
+                fired = set()
+                if keys and rule.rule_id is not None:
+                    run = models.AutomationRun
+                    fired = {tuple(row) for row in db.query(run.episode_id, run.trigger_date).filter(
+                        run.rule_id == rule.rule_id,
+                        run.episode_id.in_({episode_id for episode_id, _ in keys})
+                    )} & keys
+                result["matches"] = len(matches)
+                result["already_fired"] = len(fired)
+                result["would_create"] = len(keys) - len(fired)
+                result["sample"] = [
+                    _sample_row(rule, o, e, getattr(o, rule.trigger_field)) for o, e in matches[:sample_size]
+                ]
+            else:
+                # Per occurrence of the event; nothing is created by the daily run
+                matches = _event_matches(db, rule)
+                result["matches"] = len(matches)
+                result["would_create"] = None
+                result["sample"] = [_sample_row(rule, o, e) for o, e in matches[:sample_size]]
+        except rule_compiler.RuleCompileError as e:
+            result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    result["queries"] = queries["count"]
+
+    # Nothing above writes; make sure no pending state leaks into the session
+    db.rollback()
+    return result
+
+def simulate_rules(db: Session, rule_id: int = None, today=None, sample_size: int = 10) -> dict:
+    """
+    Dry-runs one saved rule (any status) or, without rule_id, every active rule.
+    Raises LookupError if rule_id does not exist.
+    """
+    today = today or datetime.now().date()
+    query = db.query(models.AutomationRule)
+    if rule_id is not None:
+        rules = query.filter(models.AutomationRule.rule_id == rule_id).all()
+        if not rules:
+            raise LookupError(f"Rule {rule_id} not found")
+    else:
+        rules = query.filter(models.AutomationRule.is_active == True).order_by(models.AutomationRule.rule_id).all()
+
+    reports = [simulate_rule(db, rule, today, sample_size) for rule in rules]
+    return {
+        "today": today.isoformat(),
+        "rules": reports,
+        "totals": {
+            "rules": len(reports),
+            "would_create": sum(r["would_create"] or 0 for r in reports),
+            "seconds": round(sum(r["seconds"] for r in reports), 4),
+            "queries": sum(r["queries"] for r in reports),
+            "errors": sum(1 for r in reports if r["error"]),
+        }
+    }
+
+def format_report(report: dict) -> str:
+    lines = [f"Dry run for {report['today']} (nothing written)",
+             f"{'rule':>5} {'name':<30} {'type':<6} {'matches':>8} {'create':>7} {'fired':>6} {'ms':>8} {'queries':>8}"]
+    for r in report["rules"]:
+        create = "-" if r["would_create"] is None else r["would_create"]
+        lines.append(
+            f"{str(r['rule_id']):>5} {r['name'][:30]:<30} {r['trigger_type']:<6} {r['matches']:>8} {create:>7} "
+            f"{r['already_fired']:>6} {r['seconds'] * 1000:>8.1f} {r['queries']:>8}"
+        )
+        if r["error"]:
+            lines.append(f"      error: {r['error']}")
+    totals = report["totals"]
+    lines.append(f"Total: {totals['would_create']} tasks from {totals['rules']} rules, "
+                 f"{totals['seconds'] * 1000:.1f} ms, {totals['queries']} queries")
+    return "\n".join(lines)
@@ -0,0 +1,94 @@
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func
+from datetime import datetime
+from .. import models
+
+# Batched per-page lookups for the caseload list.
+# Each helper takes the offender_ids of a whole page and resolves the
+# related rows in ONE query (ROW_NUMBER() window per offender), returning
+# a dict keyed by offender_id. Works on both SQLite (3.25+) and Postgres.
+
+def _latest_per_offender(db: Session, model, partition_col, order_by, *filters):
+    """
+    Returns {offender_id: row} keeping only the first row per offender
+    according to `order_by`.
+    """
+    ranked = (
+        db.query(
+            model,
+            func.row_number().over(partition_by=partition_col, order_by=order_by).label("rn")
+        )
+        .filter(*filters)
+        .subquery()
+    )
+    entity = aliased(model, ranked)
+    rows = db.query(entity).filter(ranked.c.rn == 1).all()
+    return {row.offender_id: row for row in rows}
+
+def get_next_appointments(db: Session, offender_ids):
+    """
+    Next scheduled (future) appointment per offender.
+    """
+    if not offender_ids:
+        return {}
+    return _latest_per_offender(
+        db,
+        models.Appointment,
+        models.Appointment.offender_id,
+        models.Appointment.date_time.asc(),
+        models.Appointment.offender_id.in_(offender_ids),
+        models.Appointment.date_time > datetime.utcnow(),
+        models.Appointment.status == 'Scheduled'
+    )
+
+def get_latest_assessments(db: Session, offender_ids):
+    """
+    Most recent Completed risk assessment per offender.
+    """
+    if not offender_ids:
+        return {}
+    return _latest_per_offender(
+        db,
+        models.RiskAssessment,
+        models.RiskAssessment.offender_id,
+        models.RiskAssessment.date.desc(),
+        models.RiskAssessment.offender_id.in_(offender_ids),
+        models.RiskAssessment.status == 'Completed'
+    )
+
+def get_active_programs(db: Session, offender_ids):
+    """
+    Program name of the active enrollment per offender.
+    """
+    if not offender_ids:
+        return {}
+    ranked = (
+        db.query(
+            models.ProgramEnrollment.offender_id.label("offender_id"),
+            models.ProgramOffering.program_name.label("program_name"),
+            func.row_number().over(
+                partition_by=models.ProgramEnrollment.offender_id,
+                order_by=models.ProgramEnrollment.start_date.desc()
+            ).label("rn")
+        )
+        .join(models.ProgramOffering, models.ProgramEnrollment.offering_id == models.ProgramOffering.offering_id)
+        .filter(
+            models.ProgramEnrollment.offender_id.in_(offender_ids),
+            models.ProgramEnrollment.status == 'Active'
+        )
+        .subquery()
+    )
+    rows = db.query(ranked.c.offender_id, ranked.c.program_name).filter(ranked.c.rn == 1).all()
+    return {offender_id: program_name for offender_id, program_name in rows}
+
+def get_employments(db: Session, offender_ids):
+    """
+    All employment records per offender (replaces the lazy `offender.employments` load).
+    """
+    grouped = {oid: [] for oid in offender_ids}
+    if not offender_ids:
+        return grouped
+    rows = db.query(models.Employment).filter(models.Employment.offender_id.in_(offender_ids)).all()
+    for emp in rows:
+        grouped.setdefault(emp.offender_id, []).append(emp)
+    return grouped
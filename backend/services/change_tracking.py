@@ -0,0 +1,117 @@
+import logging
+from sqlalchemy import event, text
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+# Database-side maintenance of the updated_at change watermarks that drive
+# incremental automation runs (automation.py). The ORM's onupdate only covers
+# writes made through SQLAlchemy models; these triggers also stamp raw SQL and
+# bulk INSERT / UPDATE statements that leave updated_at out.
+# - SQLite: AFTER INSERT / UPDATE triggers that set updated_at when the statement
+#   didn't (recursive_triggers is off, so the inner UPDATE doesn't re-fire).
+# - Postgres: one BEFORE INSERT OR UPDATE row trigger per table, created only
+#   when missing (pg_trigger), so worker startups do no DDL once it exists.
+# Timestamps are UTC with microseconds, like datetime.utcnow() from the ORM.
+
+TRACKED_TABLES = ("offenders", "supervision_episodes")
+
+_SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+def _sqlite_ddl(table: str) -> list:
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_stamp_insert AFTER INSERT ON {table}
+        WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE {table} SET updated_at = {_SQLITE_NOW} WHERE rowid = NEW.rowid;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_stamp_update AFTER UPDATE ON {table}
+        WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE {table} SET updated_at = {_SQLITE_NOW} WHERE rowid = NEW.rowid;
+        END
+        """,
+    ]
+
+POSTGRES_FUNCTION = """
+CREATE OR REPLACE FUNCTION stamp_updated_at() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.updated_at IS NULL
+       OR TG_OP = 'UPDATE' AND NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+        NEW.updated_at := now() AT TIME ZONE 'utc';
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+_NOW = {"sqlite": _SQLITE_NOW, "postgresql": "now() AT TIME ZONE 'utc'"}
+
+def _postgres_ddl(table: str) -> list:
+    return [
+        f"CREATE TRIGGER {table}_stamp_updated_at BEFORE INSERT OR UPDATE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION stamp_updated_at()",
+    ]
+
+def _postgres_has_trigger(connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM pg_trigger WHERE tgname = :name AND tgrelid = to_regclass(:table)"),
+        {"name": f"{table}_stamp_updated_at", "table": table}
+    ).first() is not None
+
+def _postgres_has_function(connection) -> bool:
+    return connection.execute(text("SELECT 1 FROM pg_proc WHERE proname = 'stamp_updated_at'")).first() is not None
+
+def _execute_guarded(connection, stmt: str):
+    # A failure (e.g. another worker creating the same trigger) is logged and
+    # rolled back to the savepoint instead of aborting startup
+    try:
+        with connection.begin_nested():
+            connection.execute(text(stmt))
+    except Exception as e:
+        logger.error(f"Could not create change trigger ({stmt.strip().splitlines()[0]}): {e}")
+
+def _ensure_table_triggers(connection, table: str):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        for stmt in _sqlite_ddl(table):
+            _execute_guarded(connection, stmt)
+    elif dialect == 'postgresql':
+        # Only DDL what is missing: repeated CREATE / DROP TRIGGER on every
+        # worker's startup would queue for ACCESS EXCLUSIVE locks on the tables
+        if _postgres_has_trigger(connection, table):
+            return
+        if not _postgres_has_function(connection):
+            _execute_guarded(connection, POSTGRES_FUNCTION)
+        for stmt in _postgres_ddl(table):
+            _execute_guarded(connection, stmt)
+
+def ensure_change_triggers(connection):
+    """
+    Idempotently creates the updated_at triggers for the connected dialect;
+    existing triggers are left alone. Errors are logged, not raised.
+    Other dialects rely on the ORM's onupdate only.
+    """
+    for table in TRACKED_TABLES:
+        _ensure_table_triggers(connection, table)
+
+def backfill(connection) -> int:
+    """
+    Stamps rows whose updated_at is NULL (written before the column existed) with
+    the current time. Not created_at: an old stamp would hide them from
+    `updated_at > watermark`, while now() only costs one extra (idempotent)
+    evaluation on the next incremental run. Returns the number of rows stamped.
+    """
+    now = _NOW.get(connection.dialect.name, "CURRENT_TIMESTAMP")
+    return sum(
+        connection.execute(text(f"UPDATE {table} SET updated_at = {now} WHERE updated_at IS NULL")).rowcount
+        for table in TRACKED_TABLES
+    )
+
+for _model in (models.Offender, models.SupervisionEpisode):
+    @event.listens_for(_model.__table__, "after_create")
+    def _create_change_triggers(target, connection, **kw):
+        _ensure_table_triggers(connection, target.name)
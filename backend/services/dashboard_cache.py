@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from sqlalchemy import event, inspect, select, or_
+from sqlalchemy.orm import Session
+from .. import models
+
+# In-process cache for /dashboard/stats keyed by (officer_id, location_id).
+# - Entries expire after DASHBOARD_STATS_TTL seconds (default 60).
+# - Identical concurrent misses are collapsed into one computation (single-flight).
+# - Committed writes that change dashboard inputs evict the affected keys
+#   (see the session listeners at the bottom of this module). ORM objects evict
+#   their owning officers' keys; bulk INSERT / UPDATE / DELETE statements on a
+#   dashboard table (automation task inserts, rescore updates) can't be traced
+#   to officers and evict everything.
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class StatsCache:
+    def __init__(self, ttl_seconds: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}      # key -> (expires_at, value)
+        self._inflight = {}     # key -> _Flight
+        self._generation = {}   # key -> int, bumped on eviction
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for `key`, or runs `compute()` once and caches it.
+        Callers arriving while `compute()` is running wait for that result.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+
+            flight = self._inflight.get(key)
+            if flight:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+                leader = True
+            generation = self._generation.get(key, 0)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                # Don't store a value computed from data that was invalidated mid-flight
+                if flight.error is None and self._generation.get(key, 0) == generation:
+                    self._entries[key] = (time.monotonic() + self.ttl_seconds, flight.result)
+            flight.done.set()
+        return flight.result
+
+    def evict(self, predicate):
+        """
+        Evicts every key for which predicate(key) is true.
+        """
+        with self._lock:
+            keys = set(self._entries) | set(self._inflight)
+            for key in keys:
+                if predicate(key):
+                    self._generation[key] = self._generation.get(key, 0) + 1
+                    if self._entries.pop(key, None) is not None:
+                        self.evictions += 1
+
+    def evict_officers(self, officer_ids):
+        """
+        Evicts keys whose numbers depend on the given officers' caseloads:
+        the officers' own keys plus every key not scoped to a single officer
+        (system-wide and per-location).
+        """
+        officer_ids = {str(o) for o in officer_ids if o is not None}
+        self.evict(lambda key: key[0] is None or key[0] in officer_ids)
+
+    def clear(self):
+        self.evict(lambda key: True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0
+            }
+
+dashboard_cache = StatsCache(ttl_seconds=float(os.getenv("DASHBOARD_STATS_TTL", "60")))
+
+# --- Write-driven invalidation ---
+
+_PENDING_KEY = "dashboard_cache_officers"
+_PENDING_ALL_KEY = "dashboard_cache_all"
+
+# Tables behind the dashboard numbers, for bulk statements
+BULK_TRACKED_TABLES = {
+    models.SupervisionEpisode.__tablename__, models.Offender.__tablename__,
+    models.CaseNote.__tablename__, models.Officer.__tablename__,
+    models.Task.__tablename__, models.RiskAssessment.__tablename__,
+}
+
+def _changed(obj, attr):
+    return inspect(obj).attrs[attr].history.has_changes()
+
+def _old_and_new(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    return list(history.deleted or []) + list(history.added or []) + list(history.unchanged or [])
+
+@event.listens_for(Session, "after_flush")
+def _collect_dashboard_changes(session, flush_context):
+    officer_ids = set()
+    episode_ids = set()
+    offender_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        is_new_or_deleted = obj in session.new or obj in session.deleted
+        if isinstance(obj, models.SupervisionEpisode):
+            if is_new_or_deleted or any(_changed(obj, a) for a in ("status", "assigned_officer_id", "risk_level_at_start", "offender_id")):
+                officer_ids.update(_old_and_new(obj, "assigned_officer_id"))
+        elif isinstance(obj, models.Offender):
+            if is_new_or_deleted or _changed(obj, "employment_status"):
+                offender_ids.add(obj.offender_id)
+        elif isinstance(obj, models.CaseNote):
+            if obj.type == 'Violation' or _changed(obj, "type") or _changed(obj, "is_pinned"):
+                offender_ids.add(obj.offender_id)
+        elif isinstance(obj, models.Officer):
+            if _changed(obj, "location_id"):
+                officer_ids.add(obj.officer_id)
+        elif isinstance(obj, models.Task):
+            if is_new_or_deleted or _changed(obj, "status") or _changed(obj, "episode_id"):
+                episode_ids.update(_old_and_new(obj, "episode_id"))
+
+    episode_ids.discard(None)
+    offender_ids.discard(None)
+    if episode_ids or offender_ids:
+        # Resolve owning officers inside the flush transaction (one small query)
+        conditions = []
+        if episode_ids:
+            conditions.append(models.SupervisionEpisode.episode_id.in_(episode_ids))
+        if offender_ids:
+            conditions.append(models.SupervisionEpisode.offender_id.in_(offender_ids))
+        rows = session.connection().execute(
+            select(models.SupervisionEpisode.assigned_officer_id).where(or_(*conditions))
+        )
+        officer_ids.update(r[0] for r in rows)
+
+    if officer_ids or episode_ids or offender_ids:
+        session.info.setdefault(_PENDING_KEY, set()).update(officer_ids)
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_changes(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is not None and table.name in BULK_TRACKED_TABLES:
+        orm_execute_state.session.info[_PENDING_ALL_KEY] = True
+
+@event.listens_for(Session, "after_commit")
+def _evict_after_commit(session):
+    officer_ids = session.info.pop(_PENDING_KEY, None)
+    if session.info.pop(_PENDING_ALL_KEY, False):
+        dashboard_cache.clear()
+    elif officer_ids is not None:
+        dashboard_cache.evict_officers(officer_ids)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_PENDING_ALL_KEY, None)
@@ -0,0 +1,201 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, case, and_, or_
+from datetime import datetime, timedelta
+from uuid import UUID
+from .. import models
+
+# Dashboard metric queries shared by the live /dashboard/stats endpoint
+# and the nightly rollup job (stats_rollup_service).
+
+COUNT_KEYS = [
+    "total_caseload", "employed_count", "risk_low", "risk_medium", "risk_high",
+    "warrants_issued", "violator_count", "pending_reviews"
+]
+
+def scope_filters(officer_id=None, location_id=None):
+    """
+    WHERE clauses on SupervisionEpisode for the dashboard officer/location filter.
+    Location applies to the assigned officer's location.
+    """
+    filters = []
+    try:
+        if officer_id:
+            filters.append(models.SupervisionEpisode.assigned_officer_id == UUID(str(officer_id)))
+        if location_id:
+            location_officers = select(models.Officer.officer_id).where(models.Officer.location_id == UUID(str(location_id)))
+            filters.append(models.SupervisionEpisode.assigned_officer_id.in_(location_officers))
+    except ValueError:
+        raise ValueError("Invalid officer_id or location_id")
+    return filters
+
+def _count_if(dialect_name, condition):
+    """
+    Conditional aggregate: COUNT(*) FILTER (WHERE ...) on Postgres, SUM(CASE ...) elsewhere.
+    """
+    if dialect_name == 'postgresql':
+        return func.count().filter(condition)
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def _risk_buckets(risk):
+    """
+    Normalizes free-text risk levels (Low Risk -> Low, Moderate -> Medium).
+    """
+    is_low = risk.like('%Low%')
+    is_medium = and_(~is_low, or_(risk.like('%Medium%'), risk.like('%Moderate%')))
+    is_high = and_(~is_low, ~risk.like('%Medium%'), ~risk.like('%Moderate%'), risk.like('%High%'))
+    return is_low, is_medium, is_high
+
+def _caseload_columns(dialect_name, caseload):
+    is_low, is_medium, is_high = _risk_buckets(caseload.c.risk_level)
+    return [
+        func.count().label("total_caseload"),
+        _count_if(dialect_name, caseload.c.employment_status == 'Employed').label("employed_count"),
+        _count_if(dialect_name, is_low).label("risk_low"),
+        _count_if(dialect_name, is_medium).label("risk_medium"),
+        _count_if(dialect_name, is_high).label("risk_high"),
+    ]
+
+def compute_dashboard_counts(db: Session, officer_id=None, location_id=None) -> dict:
+    """
+    Computes every raw dashboard count in ONE statement.
+    `caseload` CTE = active episodes in scope; violations/tasks are scalar subqueries against it.
+    """
+    dialect_name = db.get_bind().dialect.name
+    filters = scope_filters(officer_id, location_id)
+    episode = models.SupervisionEpisode
+
+    caseload = (
+        select(
+            episode.episode_id,
+            episode.offender_id,
+            episode.risk_level_at_start.label("risk_level"),
+            models.Offender.employment_status
+        )
+        .outerjoin(models.Offender, episode.offender_id == models.Offender.offender_id)
+        .where(episode.status == 'Active', *filters)
+        .cte("caseload")
+    )
+
+    warrants = (
+        select(func.count())
+        .select_from(models.CaseNote)
+        .join(caseload, caseload.c.offender_id == models.CaseNote.offender_id)
+        .where(models.CaseNote.type == 'Violation', models.CaseNote.is_pinned == True)
+        .scalar_subquery()
+    )
+
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    violators = (
+        select(func.count(models.CaseNote.offender_id.distinct()))
+        .join(caseload, caseload.c.offender_id == models.CaseNote.offender_id)
+        .where(models.CaseNote.type == 'Violation', models.CaseNote.date >= thirty_days_ago)
+        .scalar_subquery()
+    )
+
+    # Pending tasks count against any episode in scope (not only active ones)
+    pending = (
+        select(func.count())
+        .select_from(models.Task)
+        .join(episode, models.Task.episode_id == episode.episode_id)
+        .where(models.Task.status == 'Pending', *filters)
+        .scalar_subquery()
+    )
+
+    stmt = select(
+        *_caseload_columns(dialect_name, caseload),
+        warrants.label("warrants_issued"),
+        violators.label("violator_count"),
+        pending.label("pending_reviews")
+    ).select_from(caseload)
+
+    row = db.execute(stmt).one()
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+def compute_grouped_counts(db: Session, group_by: str) -> dict:
+    """
+    Same counts as compute_dashboard_counts, for every officer ('officer')
+    or every location ('location') at once. Four grouped statements in total.
+    Returns {group_id: counts}.
+    """
+    dialect_name = db.get_bind().dialect.name
+    episode = models.SupervisionEpisode
+    if group_by == 'officer':
+        group_col = episode.assigned_officer_id
+    elif group_by == 'location':
+        group_col = models.Officer.location_id
+    else:
+        raise ValueError(f"Unknown group_by: {group_by}")
+
+    def scoped(stmt):
+        if group_by == 'location':
+            stmt = stmt.outerjoin(models.Officer, episode.assigned_officer_id == models.Officer.officer_id)
+        return stmt
+
+    caseload = scoped(
+        select(
+            group_col.label("group_id"),
+            episode.offender_id,
+            episode.risk_level_at_start.label("risk_level"),
+            models.Offender.employment_status
+        )
+        .select_from(episode)
+        .outerjoin(models.Offender, episode.offender_id == models.Offender.offender_id)
+    ).where(episode.status == 'Active').cte("caseload")
+
+    results = {}
+
+    def bucket(group_id):
+        if group_id not in results:
+            results[group_id] = {key: 0 for key in COUNT_KEYS}
+        return results[group_id]
+
+    stmt = select(caseload.c.group_id, *_caseload_columns(dialect_name, caseload)).group_by(caseload.c.group_id)
+    for row in db.execute(stmt):
+        counts = bucket(row.group_id)
+        for key in ("total_caseload", "employed_count", "risk_low", "risk_medium", "risk_high"):
+            counts[key] = int(getattr(row, key) or 0)
+
+    warrants = (
+        select(caseload.c.group_id, func.count())
+        .select_from(models.CaseNote)
+        .join(caseload, caseload.c.offender_id == models.CaseNote.offender_id)
+        .where(models.CaseNote.type == 'Violation', models.CaseNote.is_pinned == True)
+        .group_by(caseload.c.group_id)
+    )
+    for group_id, count in db.execute(warrants):
+        bucket(group_id)["warrants_issued"] = int(count)
+
+    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    violators = (
+        select(caseload.c.group_id, func.count(models.CaseNote.offender_id.distinct()))
+        .select_from(models.CaseNote)
+        .join(caseload, caseload.c.offender_id == models.CaseNote.offender_id)
+        .where(models.CaseNote.type == 'Violation', models.CaseNote.date >= thirty_days_ago)
+        .group_by(caseload.c.group_id)
+    )
+    for group_id, count in db.execute(violators):
+        bucket(group_id)["violator_count"] = int(count)
+
+    pending = scoped(
+        select(group_col, func.count())
+        .select_from(models.Task)
+        .join(episode, models.Task.episode_id == episode.episode_id)
+    ).where(models.Task.status == 'Pending').group_by(group_col)
+    for group_id, count in db.execute(pending):
+        bucket(group_id)["pending_reviews"] = int(count)
+
+    results.pop(None, None) # unassigned episodes only count system-wide
+    return results
+
+def derive_rates(counts: dict):
+    """
+    Returns (employment_rate, compliance_rate) as percentages of the active caseload.
+    """
+    total = counts["total_caseload"]
+    if total > 0:
+        employment_rate = round((counts["employed_count"] / total) * 100, 1)
+        compliance_rate = round(((total - counts["violator_count"]) / total) * 100, 1)
+    else:
+        employment_rate = 0.0
+        compliance_rate = 100.0
+    return employment_rate, compliance_rate
@@ -0,0 +1,233 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import quote
+import anyio
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from .. import models, auth
+from . import document_previews, storage_backends
+
+# Authorized document downloads (GET /documents/{id}/content).
+# - Access: Admin/Manager see everything; officers see documents of offenders
+#   on their caseload (any episode) or that they uploaded; supervisors also see
+#   their team's caseloads (viewer_for, which also scopes /search/records).
+# - Browsers can't put a bearer token on <a>/<video> requests, so the UI asks
+#   GET /documents/{id}/link for a short-lived URL with a document-scoped token.
+# - Single byte ranges are honoured (206 / 416) for video seeking; the strong
+#   ETag is the content hash, so revalidation is a 304 without touching storage.
+# - Bytes are streamed in bounded pieces off the event loop, or handed to the
+#   server as a zero-copy (sendfile) send when it offers the ASGI
+#   "http.response.zerocopysend" extension.
+
+LINK_TTL = timedelta(minutes=5)
+LINK_TOKEN_TYPE = "doc_link" # auth.get_current_user refuses tokens with a typ
+STREAM_CHUNK_SIZE = 256 * 1024
+UNRESTRICTED_ROLES = ("Admin", "Manager")
+
+class Viewer:
+    """
+    What a restricted (non Admin/Manager) user may see: offenders with an
+    episode assigned to one of `officer_ids` (their own officer record, plus
+    their team for supervisors) and documents uploaded by `officer_id`.
+    """
+    def __init__(self, officer_id=None, officer_ids=()):
+        self.officer_id = officer_id
+        self.officer_ids = list(officer_ids)
+
+    def offenders(self):
+        return select(models.SupervisionEpisode.offender_id).where(
+            models.SupervisionEpisode.assigned_officer_id.in_(self.officer_ids)
+        )
+
+def viewer_for(db: Session, user: models.User) -> Optional[Viewer]:
+    """
+    None when the user sees every record, otherwise their Viewer.
+    """
+    role_name = db.query(models.Role.role_name).filter(models.Role.role_id == user.role_id).scalar()
+    if role_name in UNRESTRICTED_ROLES:
+        return None
+    officer = db.query(models.Officer).filter(models.Officer.user_id == user.user_id).first()
+    if officer is None:
+        return Viewer()
+    team = db.query(models.Officer.officer_id).filter(models.Officer.supervisor_id == officer.officer_id).all()
+    return Viewer(officer.officer_id, [officer.officer_id, *(officer_id for (officer_id,) in team)])
+
+def can_access(db: Session, user: models.User, doc: models.Document) -> bool:
+    viewer = viewer_for(db, user)
+    if viewer is None:
+        return True
+    if viewer.officer_id is not None and doc.uploaded_by_id == viewer.officer_id:
+        return True
+    return db.query(
+        viewer.offenders().where(models.SupervisionEpisode.offender_id == doc.offender_id).exists()
+    ).scalar()
+
+def create_link_token(user: models.User, document_id) -> str:
+    return jwt.encode(
+        {"sub": user.username, "typ": LINK_TOKEN_TYPE, "doc": str(document_id), "exp": datetime.utcnow() + LINK_TTL},
+        auth.SECRET_KEY, algorithm=auth.ALGORITHM
+    )
+
+def user_from_link_token(db: Session, token: str, document_id) -> Optional[models.User]:
+    try:
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("typ") != LINK_TOKEN_TYPE or payload.get("doc") != str(document_id) or not payload.get("sub"):
+        return None
+    return db.query(models.User).filter(models.User.username == payload["sub"]).first()
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+def parse_range(header: Optional[str], size: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, or None to send the whole
+    file (no header, malformed, or multiple ranges). Raises RangeNotSatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        if end == 0: # "bytes=-0"
+            raise RangeNotSatisfiable(header)
+        return max(size - end, 0), size - 1 # last N bytes
+    if end is None:
+        end = size - 1
+    elif end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+def etag_for(doc: models.Document, size: int, mtime: float = None) -> str:
+    if doc.sha256:
+        return f'"{doc.sha256}"'
+    return f'W/"{size:x}-{int(mtime or 0):x}"' # legacy flat file, no content hash
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in [c.removeprefix("W/") for c in candidates]
+
+class ContentResponse(Response):
+    """
+    Streams `length` bytes from offset `start` of a stored file.
+    """
+    def __init__(self, opener, start: int, length: int, local_path: str = None, **kwargs):
+        super().__init__(content=None, **kwargs)
+        self.opener = opener
+        self.start = start
+        self.length = length
+        self.local_path = local_path
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if self.local_path and "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.local_path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": self.start, "count": self.length, "more_body": False})
+            return
+
+        body = await anyio.to_thread.run_sync(self.opener, self.start, self.length)
+        try:
+            remaining = self.length
+            while remaining:
+                piece = await anyio.to_thread.run_sync(body.read, min(STREAM_CHUNK_SIZE, remaining))
+                if not piece:
+                    break
+                remaining -= len(piece)
+                await send({"type": "http.response.body", "body": piece, "more_body": remaining > 0})
+            if remaining:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await anyio.to_thread.run_sync(body.close)
+
+def _legacy_opener(path):
+    def opener(start, length):
+        f = open(path, "rb")
+        f.seek(start)
+        return f
+    return opener
+
+def content_response(request: Request, doc: models.Document, storage=None) -> Response:
+    """
+    200 / 206 / 304 / 416 response for a document, following the request's
+    Range, If-Range and If-None-Match headers.
+    """
+    storage = storage or storage_backends.get_storage()
+    mtime = None
+    if doc.sha256:
+        key = doc.file_path
+        local_path = storage.path(key) if hasattr(storage, "path") else None
+        # Fail before the headers go out rather than mid-body
+        if not (os.path.exists(local_path) if local_path else storage.exists(key)):
+            raise LookupError("Document file is missing")
+        size = doc.file_size if doc.file_size is not None else storage.size(key)
+        opener = lambda start, length: storage.open_range(key, start, length)
+    else:
+        try:
+            stat = os.stat(doc.file_path)
+        except (FileNotFoundError, TypeError):
+            raise LookupError("Document file is missing")
+        size, mtime = stat.st_size, stat.st_mtime
+        opener = _legacy_opener(doc.file_path)
+        local_path = doc.file_path
+
+    etag = etag_for(doc, size, mtime)
+    headers = {
+        "etag": etag,
+        "accept-ranges": "bytes",
+        "cache-control": "private, no-cache", # revalidate every time: access can be revoked
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or (if_range.strip() == etag and not etag.startswith("W/")):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+
+    headers["content-disposition"] = f"inline; filename*=UTF-8''{quote(doc.file_name or 'document')}"
+    media_type = doc.file_type or "application/octet-stream"
+    if byte_range is None:
+        return ContentResponse(opener, 0, size, local_path, status_code=200, headers=headers, media_type=media_type)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return ContentResponse(opener, start, end - start + 1, local_path, status_code=206, headers=headers, media_type=media_type)
+
+def thumbnail_response(request: Request, doc: models.Document, storage=None) -> Response:
+    """
+    The document's PNG thumbnail (a few KB, so sent in one piece), with the same
+    ETag revalidation as the content.
+    """
+    storage = storage or storage_backends.get_storage()
+    headers = {"etag": f'"{doc.sha256}.thumb"', "cache-control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    body = storage.open(document_previews.thumbnail_key(doc.sha256))
+    try:
+        return Response(body.read(), media_type="image/png", headers=headers)
+    finally:
+        body.close()
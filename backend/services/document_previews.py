@@ -0,0 +1,357 @@
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models
+from . import document_store, preview_renderers, storage_backends
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails and text extracts for uploaded documents, made after the upload
+# returns. One job per blob (identical uploads share the result); derivatives
+# are stored next to the blob as '<key>.thumb.png' and '<key>.txt' and
+# document_blobs.preview_status tracks pending -> processing -> ready /
+# unsupported / failed.
+# - "process" (default): a bounded queue feeding PREVIEW_WORKERS dispatcher
+#   threads, each running one render at a time in its own worker process, so a
+#   burst of uploads never occupies more than PREVIEW_WORKERS cores. A full
+#   queue leaves the blob 'pending' for sweep_pending() instead of blocking the
+#   request. Jobs are killed after PREVIEW_JOB_TIMEOUT seconds; that only
+#   touches the stuck job's process.
+# - "celery": jobs go to backend.tasks.generate_document_preview.
+# - "sync": rendered immediately in the caller's thread (tests, scripts).
+# Pick with PREVIEW_TRANSPORT.
+
+STALE_PROCESSING = timedelta(minutes=15)
+TIMEOUT_GRACE = 5 # seconds the pool waits past the in-worker alarm
+
+def thumbnail_key(sha256: str) -> str:
+    return f"{document_store.blob_key(sha256)}.thumb.png"
+
+def text_key(sha256: str) -> str:
+    return f"{document_store.blob_key(sha256)}.txt"
+
+def derivative_keys(sha256: str):
+    return (thumbnail_key(sha256), text_key(sha256))
+
+def _set_status(db: Session, sha256: str, status: str, expect=None, **values) -> bool:
+    blob = models.DocumentBlob
+    stmt = update(blob).where(blob.sha256 == sha256)
+    if expect is not None:
+        stmt = stmt.where(blob.preview_status == expect)
+    result = db.execute(
+        stmt.values(preview_status=status, preview_updated_at=datetime.utcnow(), **values),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+    return result.rowcount > 0
+
+def _put_bytes(storage, key: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=storage.tmp_dir, prefix="preview-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    storage.put_file(key, tmp_path)
+
+def generate(db: Session, storage, sha256: str, runner) -> str:
+    """
+    Claims a pending blob, renders it with runner(path, file_type, file_name)
+    and stores the derivatives. Returns the final status ('skipped' when the
+    blob was not pending).
+    """
+    if not _set_status(db, sha256, 'processing', expect='pending'):
+        return 'skipped'
+    try:
+        return _render_claimed(db, storage, sha256, runner)
+    except BaseException:
+        # Storage / database errors outside rendering: hand the claim back so the
+        # next sweep_pending() retries now, not after STALE_PROCESSING
+        db.rollback()
+        try:
+            _set_status(db, sha256, 'pending', expect='processing')
+        except Exception as e:
+            logger.error(f"Could not release preview claim on blob {sha256}: {e}")
+        raise
+
+def _render_claimed(db: Session, storage, sha256: str, runner) -> str:
+    doc = (db.query(models.Document.file_type, models.Document.file_name)
+           .filter(models.Document.sha256 == sha256).first())
+    file_type, file_name = doc if doc else (None, None)
+
+    key = document_store.blob_key(sha256)
+    local_path = storage.path(key) if hasattr(storage, "path") else None
+    download = None
+    try:
+        if local_path is None:
+            # Remote backend: the worker process needs a local copy
+            fd, download = tempfile.mkstemp(dir=storage.tmp_dir, prefix="preview-src-")
+            with os.fdopen(fd, "wb") as target:
+                body = storage.open(key)
+                try:
+                    shutil.copyfileobj(body, target, storage_backends.CHUNK_SIZE)
+                finally:
+                    body.close()
+            local_path = download
+
+        try:
+            thumbnail, text = runner(local_path, file_type, file_name)
+        except preview_renderers.UnsupportedFormat as e:
+            _set_status(db, sha256, 'unsupported', preview_error=str(e)[:500])
+            return 'unsupported'
+        except (preview_renderers.JobTimeout, FutureTimeout):
+            _set_status(db, sha256, 'failed', preview_error="Timed out")
+            return 'failed'
+        except Exception as e:
+            logger.warning(f"Preview failed for blob {sha256}: {e}")
+            _set_status(db, sha256, 'failed', preview_error=str(e)[:500] or type(e).__name__)
+            return 'failed'
+    finally:
+        if download is not None:
+            os.remove(download)
+
+    if thumbnail is not None:
+        _put_bytes(storage, thumbnail_key(sha256), thumbnail)
+    if text is not None:
+        _put_bytes(storage, text_key(sha256), text.encode("utf-8"))
+    try:
+        if text and text.strip():
+            db.merge(models.DocumentText(sha256=sha256, content=text)) # full-text index (text_search_service)
+        ready = _set_status(db, sha256, 'ready', expect='processing', has_thumbnail=thumbnail is not None, preview_error=None)
+    except IntegrityError:
+        db.rollback()
+        ready = False
+    if not ready:
+        # Last document was deleted while rendering
+        for derivative in derivative_keys(sha256):
+            storage.delete(derivative)
+        return 'skipped'
+    return 'ready'
+
+def read_text(sha256: str, storage=None):
+    """
+    The stored text extract, or None.
+    """
+    storage = storage or storage_backends.get_storage()
+    try:
+        body = storage.open(text_key(sha256))
+    except Exception as e:
+        if storage_backends._is_not_found(e):
+            return None
+        raise
+    try:
+        return body.read().decode("utf-8")
+    finally:
+        body.close()
+
+class ProcessPreviewPipeline:
+    def __init__(self, session_factory=None, max_workers: int = None, max_pending: int = None,
+                 job_timeout: float = None):
+        self._session_factory = session_factory
+        self.max_workers = max_workers or int(os.getenv("PREVIEW_WORKERS", "2"))
+        self.job_timeout = job_timeout or float(os.getenv("PREVIEW_JOB_TIMEOUT", "30"))
+        self._queue = queue.Queue(maxsize=max_pending or int(os.getenv("PREVIEW_QUEUE_SIZE", "32")))
+        self._lock = threading.Lock()
+        self._threads = []
+        self._local = threading.local() # the dispatcher thread's executor
+        self._executors = set()
+        self.scheduled = 0
+        self.deferred = 0 # queue was full; left pending for the sweep
+        self.results = {}
+
+    def session_factory(self):
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._run, name=f"document-previews-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+        with self._lock:
+            executors, self._executors = self._executors, set()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def schedule(self, sha256: str) -> bool:
+        self.start()
+        try:
+            self._queue.put_nowait(sha256)
+        except queue.Full:
+            logger.warning(f"Preview queue full; blob {sha256} stays pending")
+            self.deferred += 1
+            return False
+        self.scheduled += 1
+        return True
+
+    def flush(self, timeout: float = None):
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        return {
+            "transport": "process",
+            "workers": self.max_workers,
+            "queued": self._queue.qsize(),
+            "scheduled": self.scheduled,
+            "deferred": self.deferred,
+            **self.results,
+        }
+
+    def _pool(self):
+        executor = getattr(self._local, "executor", None)
+        if executor is None:
+            # spawn: the API process has threads, forking it is unsafe
+            executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+            self._local.executor = executor
+            with self._lock:
+                self._executors.add(executor)
+        return executor
+
+    def _recycle(self, executor):
+        # A job ignored its alarm (stuck in C code): the only way to stop it is
+        # to kill its process. Each dispatcher has its own, so no other job is hit.
+        self._local.executor = None
+        with self._lock:
+            self._executors.discard(executor)
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _render(self, path, file_type, file_name):
+        executor = self._pool()
+        future = executor.submit(preview_renderers.run_job, path, file_type, file_name, self.job_timeout)
+        try:
+            return future.result(timeout=self.job_timeout + TIMEOUT_GRACE)
+        except FutureTimeout:
+            self._recycle(executor)
+            raise
+
+    def _run(self):
+        while True:
+            sha256 = self._queue.get()
+            if sha256 is None:
+                self._queue.task_done()
+                return
+            db = self.session_factory()()
+            try:
+                status = generate(db, storage_backends.get_storage(), sha256, self._render)
+                with self._lock:
+                    self.results[status] = self.results.get(status, 0) + 1
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Preview job for blob {sha256} crashed: {e}")
+            finally:
+                db.close()
+                self._queue.task_done()
+
+def _render_inline(path, file_type, file_name):
+    return preview_renderers.run_job(path, file_type, file_name, float(os.getenv("PREVIEW_JOB_TIMEOUT", "30")))
+
+class SyncPreviewPipeline:
+    """
+    Renders immediately in the caller's thread with its own session.
+    """
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def schedule(self, sha256: str) -> bool:
+        if self._session_factory is None:
+            from ..database import SessionLocal
+            self._session_factory = SessionLocal
+        db = self._session_factory()
+        try:
+            generate(db, storage_backends.get_storage(), sha256, _render_inline)
+        finally:
+            db.close()
+        return True
+
+    def start(self): pass
+    def stop(self, timeout: float = 10): pass
+    def flush(self, timeout: float = None): pass
+    def stats(self) -> dict:
+        return {"transport": "sync"}
+
+class CeleryPreviewPipeline:
+    """
+    Sends jobs to the Celery worker (requires the Celery broker, see backend/tasks.py).
+    """
+    def schedule(self, sha256: str) -> bool:
+        from ..tasks import generate_document_preview
+        generate_document_preview.delay(sha256)
+        return True
+
+    def start(self): pass
+    def stop(self, timeout: float = 10): pass
+    def flush(self, timeout: float = None): pass
+    def stats(self) -> dict:
+        return {"transport": "celery"}
+
+_TRANSPORTS = {"process": ProcessPreviewPipeline, "sync": SyncPreviewPipeline, "celery": CeleryPreviewPipeline}
+_pipeline = None
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        transport = os.getenv("PREVIEW_TRANSPORT", "process").lower()
+        if transport not in _TRANSPORTS:
+            logger.warning(f"Unknown PREVIEW_TRANSPORT '{transport}', using process")
+            transport = "process"
+        _pipeline = _TRANSPORTS[transport]()
+    return _pipeline
+
+def set_pipeline(pipeline):
+    """
+    Replaces the active pipeline (stopping the previous one). Used by tests and scripts.
+    """
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+    _pipeline = pipeline
+
+def schedule(sha256: str) -> bool:
+    """
+    Queues preview generation for a blob. Call after the blob is committed and stored.
+    """
+    return get_pipeline().schedule(sha256)
+
+def sweep_pending(db: Session, pipeline=None, now: datetime = None) -> int:
+    """
+    Re-queues blobs left 'pending' (full queue, restart) or stuck in
+    'processing' (worker died). Returns the number scheduled.
+    """
+    pipeline = pipeline or get_pipeline()
+    now = now or datetime.utcnow()
+    blob = models.DocumentBlob
+    db.execute(
+        update(blob)
+        .where(blob.preview_status == 'processing', blob.preview_updated_at < now - STALE_PROCESSING)
+        .values(preview_status='pending'),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+    pending = [sha for (sha,) in db.query(blob.sha256).filter(blob.preview_status == 'pending').all()]
+    return sum(1 for sha in pending if pipeline.schedule(sha))
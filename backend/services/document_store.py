@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime
+from sqlalchemy import insert, update, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .. import models
+from . import document_previews, storage_backends
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed document store.
+# - Uploads are copied in chunks in a worker thread (never on the event loop)
+#   into a temp file while their SHA-256 is computed.
+# - Bytes live once per hash at 'ab/cd/<sha256>' in the storage backend
+#   (services/storage_backends.py); document_blobs.ref_count counts the
+#   Document rows pointing at it.
+# - A duplicate upload only bumps the count; deleting a document only removes
+#   the bytes (and their previews) when the last reference goes (purge_blob).
+# - New blobs are queued for thumbnail / text extraction
+#   (services/document_previews.py).
+
+CHUNK_SIZE = storage_backends.CHUNK_SIZE
+
+def blob_key(sha256: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def spool(source, tmp_dir: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Copies a file object to a temp file in chunks, hashing as it writes.
+    Returns (temp path, sha256 hex, size).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix="upload-")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+def acquire_blob(db: Session, sha256: str, size: int, storage) -> bool:
+    """
+    Adds one reference to the blob (creating its row if needed).
+    Returns True if the blob row is new, i.e. the bytes still have to be stored.
+    Not committed.
+    """
+    blob = models.DocumentBlob
+    row = {"sha256": sha256, "storage_key": blob_key(sha256), "backend": storage.name,
+           "size": size, "ref_count": 1, "created_at": datetime.utcnow()}
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = dialect_insert(blob).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sha256'], set_={"ref_count": blob.ref_count + 1}
+        ).returning(blob.ref_count)
+        return db.execute(stmt).scalar() == 1
+
+    updated = db.execute(
+        update(blob).where(blob.sha256 == sha256).values(ref_count=blob.ref_count + 1),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if updated:
+        return False
+    db.execute(insert(blob), [row])
+    return True
+
+def release_blob(db: Session, sha256: str) -> bool:
+    """
+    Drops one reference. Returns True when that was the last one; the row stays
+    at ref_count 0 until purge_blob() removes it together with the bytes.
+    Not committed.
+    """
+    blob = models.DocumentBlob
+    db.execute(
+        update(blob).where(blob.sha256 == sha256).values(ref_count=blob.ref_count - 1),
+        execution_options={"synchronize_session": False}
+    )
+    return db.query(blob.sha256).filter(blob.sha256 == sha256, blob.ref_count <= 0).first() is not None
+
+def purge_blob(db: Session, sha256: str, storage) -> bool:
+    """
+    Removes an unreferenced blob: its row, text extract, bytes and previews.
+    The bytes are deleted while the row's DELETE is still uncommitted, so a
+    concurrent upload of the same content waits on the row lock (SQLite: the
+    write lock) and then re-creates the blob and stores the bytes itself; an
+    upload that took its reference first makes the DELETE match nothing.
+    If the commit fails the row survives at ref_count 0, and the next upload
+    of that content stores the bytes again. Commits.
+    """
+    blob = models.DocumentBlob
+    removed = db.execute(
+        delete(blob).where(blob.sha256 == sha256, blob.ref_count <= 0),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if not removed:
+        db.rollback()
+        return False
+    db.execute(delete(models.DocumentText).where(models.DocumentText.sha256 == sha256),
+               execution_options={"synchronize_session": False})
+    try:
+        storage.delete(blob_key(sha256))
+        for derivative in document_previews.derivative_keys(sha256):
+            storage.delete(derivative)
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    return True
+
+def purge_released_blobs(db: Session, storage=None) -> int:
+    """
+    Purges blobs left at ref_count 0 (e.g. the process died between deleting a
+    document and purging its blob). Returns the number removed.
+    """
+    storage = storage or storage_backends.get_storage()
+    blob = models.DocumentBlob
+    released = [sha for (sha,) in db.query(blob.sha256).filter(blob.ref_count <= 0).all()]
+    db.commit()
+    return sum(1 for sha in released if purge_blob(db, sha, storage))
+
+def register(db: Session, storage, tmp_path, sha256, size, document_fields) -> models.Document:
+    """
+    Creates the Document for a spooled temp file, storing the bytes if the blob is new.
+    """
+    key = blob_key(sha256)
+    try:
+        is_new = acquire_blob(db, sha256, size, storage)
+        doc = models.Document(sha256=sha256, file_path=key, file_size=size, **document_fields)
+        db.add(doc)
+        db.commit()
+    except Exception:
+        db.rollback()
+        os.remove(tmp_path)
+        raise
+
+    # The bytes go in after the reference is committed: purge_blob() only
+    # deletes bytes of a row it removed, so it can't take them from under this
+    # document
+    if is_new or not storage.exists(key):
+        storage.put_file(key, tmp_path)
+    else:
+        os.remove(tmp_path)
+    if is_new:
+        document_previews.schedule(sha256)
+    db.refresh(doc)
+    return doc
+
+async def save_upload(db: Session, upload, storage=None, **document_fields) -> models.Document:
+    """
+    Stores an UploadFile and creates its Document row (deduplicated by content).
+    """
+    storage = storage or storage_backends.get_storage()
+    tmp_path, sha256, size = await run_in_threadpool(spool, upload.file, storage.tmp_dir)
+    return await run_in_threadpool(register, db, storage, tmp_path, sha256, size, document_fields)
+
+def delete_document(db: Session, doc: models.Document, storage=None):
+    """
+    Deletes the Document row; the bytes go with the last reference.
+    """
+    storage = storage or storage_backends.get_storage()
+    sha256, legacy_path = doc.sha256, doc.file_path
+    db.delete(doc)
+    db.flush()
+    last_reference = release_blob(db, sha256) if sha256 else False
+    db.commit()
+
+    if last_reference:
+        purge_blob(db, sha256, storage)
+    elif sha256 is None and legacy_path and os.path.exists(legacy_path):
+        # Flat file from before the content-addressed store
+        os.remove(legacy_path)
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+from types import MappingProxyType
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+from .. import models
+from .scoring_plan import compile_bands
+
+# Runtime for the generic AssessmentInstrument engine
+# (Instrument -> Domains -> Items -> Options, plus ScoringTables).
+# - load_instrument() fetches a whole instrument in a fixed number of queries
+#   (one per level, via selectinload) instead of lazy-loading the tree.
+# - compile_instrument() turns it into an immutable CompiledInstrument:
+#   per-item {option value/label/id -> points} maps grouped by domain, and
+#   score bands per population (population-specific tables before "All").
+# - instrument_cache keeps compiled instruments; any committed ORM write to the
+#   instrument tables (or invalidate()) drops them. INSTRUMENT_CACHE_TTL bounds
+#   staleness across worker processes.
+
+INSTRUMENT_MODELS = (
+    models.AssessmentInstrument, models.AssessmentDomain, models.AssessmentItem,
+    models.AssessmentOption, models.ScoringTable
+)
+
+def instrument_query(db: Session):
+    return db.query(models.AssessmentInstrument).options(
+        selectinload(models.AssessmentInstrument.domains)
+        .selectinload(models.AssessmentDomain.items)
+        .selectinload(models.AssessmentItem.options),
+        selectinload(models.AssessmentInstrument.scoring_tables),
+    )
+
+def load_instrument(db: Session, instrument_id):
+    """
+    Full instrument tree in five queries (instrument, domains, items, options, tables).
+    """
+    return instrument_query(db).filter(models.AssessmentInstrument.instrument_id == instrument_id).first()
+
+class Band:
+    __slots__ = ("level", "recommendation")
+
+    def __init__(self, level, recommendation):
+        self.level = level
+        self.recommendation = recommendation
+
+class CompiledItem:
+    __slots__ = ("item_id", "text", "control_type", "points")
+
+    def __init__(self, item):
+        self.item_id = str(item.item_id)
+        self.text = item.text
+        self.control_type = item.control_type
+        points = {}
+        for option in sorted(item.options, key=lambda o: o.order_index or 0):
+            # An answer may carry the option's value, label or id; first option wins
+            for key in (option.value, option.label, str(option.option_id)):
+                if key is not None:
+                    points.setdefault(str(key), option.points or 0)
+        self.points = MappingProxyType(points)
+
+    def score(self, value) -> int:
+        if value is None:
+            return 0
+        if isinstance(value, (list, tuple)): # Checkbox: every selected option counts
+            return sum(self.score(v) for v in value)
+        points = self.points.get(str(value))
+        if points is not None:
+            return points
+        if self.control_type == 'NumberInput':
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return 0
+        return 0
+
+class CompiledDomain:
+    __slots__ = ("domain_id", "name", "order_index", "max_score", "items")
+
+    def __init__(self, domain):
+        self.domain_id = str(domain.domain_id)
+        self.name = domain.name
+        self.order_index = domain.order_index or 0
+        self.max_score = domain.max_score
+        self.items = tuple(
+            CompiledItem(item) for item in sorted(domain.items, key=lambda i: i.order_index or 0)
+        )
+
+class CompiledInstrument:
+    def __init__(self, instrument):
+        self.instrument_id = str(instrument.instrument_id)
+        self.name = instrument.name
+        self.version = instrument.version
+        self.scoring_method = instrument.scoring_method
+        self.target_populations = tuple(instrument.target_populations or ())
+        self.domains = tuple(
+            CompiledDomain(d) for d in sorted(instrument.domains, key=lambda d: d.order_index or 0)
+        )
+        self.items = MappingProxyType({item.item_id: item for d in self.domains for item in d.items})
+        self.compiled_at = time.monotonic()
+
+        tables = list(instrument.scoring_tables)
+        populations = {t.population_filter for t in tables if t.population_filter not in (None, "", "All")}
+        self._bands = MappingProxyType({
+            population: self._compile_tables(tables, population) for population in populations | {None}
+        })
+
+    @staticmethod
+    def _compile_tables(tables, population):
+        """
+        {domain_id or None (total): (starts, bands)} for one population.
+        Tables for the population itself take precedence over "All" tables.
+        """
+        applicable = [t for t in tables if t.population_filter in (None, "", "All", population)]
+        applicable.sort(key=lambda t: (t.population_filter in (None, "", "All"), t.min_score))
+        compiled = {}
+        for scope in {str(t.domain_id) if t.domain_id else None for t in applicable}:
+            compiled[scope] = compile_bands([
+                {"label": Band(t.result_level, t.recommendation), "min": t.min_score, "max": t.max_score}
+                for t in applicable if (str(t.domain_id) if t.domain_id else None) == scope
+            ])
+        return MappingProxyType(compiled)
+
+    def band(self, score: int, domain_id: str = None, population: str = None):
+        bands = self._bands.get(population, self._bands[None])
+        starts, labels = bands.get(domain_id, ((), ()))
+        index = bisect_right(starts, score) - 1
+        return labels[index] if index >= 0 else None
+
+    def score(self, answers: dict, population: str = None) -> dict:
+        """
+        answers: {item_id: value}. Returns totals, per-domain subtotals, levels and
+        recommendations (total band first, then domains in order).
+        """
+        answers = {str(k): v for k, v in (answers or {}).items()}
+        total = 0
+        domains = []
+        recommendations = []
+        unanswered = []
+        for domain in self.domains:
+            subtotal = 0
+            for item in domain.items:
+                if item.item_id not in answers:
+                    unanswered.append(item.item_id)
+                    continue
+                subtotal += item.score(answers[item.item_id])
+            total += subtotal
+            band = self.band(subtotal, domain.domain_id, population)
+            domains.append({
+                "domain_id": domain.domain_id,
+                "name": domain.name,
+                "score": subtotal,
+                "max_score": domain.max_score,
+                "level": band.level if band else None,
+                "recommendation": band.recommendation if band else None,
+            })
+            if band and band.recommendation:
+                recommendations.append(band.recommendation)
+
+        band = self.band(total, None, population)
+        if band and band.recommendation:
+            recommendations.insert(0, band.recommendation)
+        return {
+            "instrument_id": self.instrument_id,
+            "instrument": self.name,
+            "population": population,
+            "total_score": total,
+            "risk_level": band.level if band else "Unknown",
+            "recommendation": band.recommendation if band else None,
+            "domains": domains,
+            "recommendations": recommendations,
+            "unanswered": unanswered,
+        }
+
+def compile_instrument(instrument) -> CompiledInstrument:
+    return CompiledInstrument(instrument)
+
+class InstrumentCache:
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._compiled = {}
+        self.compiles = 0
+
+    def invalidate(self, instrument_id=None):
+        with self._lock:
+            self._generation += 1
+            if instrument_id is None:
+                self._compiled = {}
+            else:
+                self._compiled.pop(str(instrument_id), None)
+
+    def get(self, db: Session, instrument_id):
+        """
+        Compiled instrument, or None if it does not exist.
+        """
+        key = str(instrument_id)
+        compiled = self._compiled.get(key)
+        if compiled is not None and time.monotonic() - compiled.compiled_at < self.ttl_seconds:
+            return compiled
+
+        generation = self._generation
+        instrument = load_instrument(db, instrument_id)
+        if instrument is None:
+            return None
+        compiled = compile_instrument(instrument)
+        with self._lock:
+            self.compiles += 1
+            if self._generation == generation:
+                self._compiled[key] = compiled
+        return compiled
+
+instrument_cache = InstrumentCache(ttl_seconds=float(os.getenv("INSTRUMENT_CACHE_TTL", "300")))
+
+# --- Invalidation on any committed write to the instrument tables ---
+
+_PENDING_KEY = "instrument_cache_dirty"
+
+@event.listens_for(Session, "after_flush")
+def _note_instrument_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, INSTRUMENT_MODELS):
+            session.info[_PENDING_KEY] = True
+            return
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        instrument_cache.invalidate()
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
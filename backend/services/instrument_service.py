@@ -0,0 +1,145 @@
+import uuid
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+from .. import models
+from .instrument_runtime import instrument_cache, load_instrument
+
+# Structural diff for instrument edits (PUT /assessments/instruments/{id}).
+# Domains, items, options and scoring tables are matched to the stored tree by
+# id (items and options may move between parents); only the rows that differ
+# are written, with one batched INSERT / UPDATE / DELETE per table. Ids of
+# unchanged rows survive the edit.
+
+INSTRUMENT_FIELDS = ("name", "version", "target_populations", "scoring_method", "is_active")
+DOMAIN_FIELDS = ("name", "order_index", "max_score")
+ITEM_FIELDS = ("domain_id", "text", "control_type", "order_index", "custom_tags")
+OPTION_FIELDS = ("item_id", "label", "value", "points", "order_index")
+TABLE_FIELDS = ("domain_id", "population_filter", "min_score", "max_score", "result_level", "recommendation")
+
+class _TableDiff:
+    def __init__(self, model, pk, fields, existing):
+        self.model = model
+        self.pk = pk
+        self.fields = fields
+        self.existing = {getattr(row, pk): row for row in existing}
+        self.claimed = set()
+        self.inserts = []
+        self.updates = []
+
+    def match(self, requested_id):
+        """
+        Claims the stored row with this id, if any (each row can be claimed once).
+        """
+        if requested_id in self.existing and requested_id not in self.claimed:
+            self.claimed.add(requested_id)
+            return requested_id
+        return None
+
+    def apply(self, row_id, values: dict):
+        """
+        Records an insert (row_id None) or the changed columns of a stored row.
+        Returns the row's id.
+        """
+        if row_id is None:
+            row_id = uuid.uuid4()
+            self.inserts.append({self.pk: row_id, **values})
+            return row_id
+        current = self.existing[row_id]
+        changed = {f: values[f] for f in self.fields if f in values and getattr(current, f) != values[f]}
+        if changed:
+            self.updates.append({self.pk: row_id, **changed})
+        return row_id
+
+    @property
+    def deletes(self):
+        return [row_id for row_id in self.existing if row_id not in self.claimed]
+
+    def summary(self) -> dict:
+        return {"inserted": len(self.inserts), "updated": len(self.updates), "deleted": len(self.deletes)}
+
+def update_instrument(db: Session, instrument_id, data) -> dict:
+    """
+    Applies `data` (schemas.AssessmentInstrumentCreate) to the stored instrument.
+    Returns the change report; raises LookupError if the instrument does not exist.
+    """
+    instrument = load_instrument(db, instrument_id)
+    if instrument is None:
+        raise LookupError("Instrument not found")
+
+    domains = list(instrument.domains)
+    items = [item for d in domains for item in d.items]
+    diffs = {
+        "domains": _TableDiff(models.AssessmentDomain, "domain_id", DOMAIN_FIELDS, domains),
+        "items": _TableDiff(models.AssessmentItem, "item_id", ITEM_FIELDS, items),
+        "options": _TableDiff(models.AssessmentOption, "option_id", OPTION_FIELDS,
+                              [o for item in items for o in item.options]),
+        "scoring_tables": _TableDiff(models.ScoringTable, "table_id", TABLE_FIELDS, instrument.scoring_tables),
+    }
+
+    changes = {"instrument": []}
+    for field in INSTRUMENT_FIELDS:
+        value = getattr(data, field)
+        if getattr(instrument, field) != value:
+            setattr(instrument, field, value)
+            changes["instrument"].append(field)
+
+    # Client-side ids of new domains -> stored ids (scoring tables may reference them)
+    domain_id_map = {}
+    domain_ids = set()
+    for d in data.domains:
+        requested = d.domain_id or d.id
+        domain_id = diffs["domains"].apply(
+            diffs["domains"].match(requested),
+            {"instrument_id": instrument.instrument_id, "name": d.name,
+             "order_index": d.order_index, "max_score": d.max_score}
+        )
+        domain_ids.add(domain_id)
+        if requested:
+            domain_id_map[requested] = domain_id
+
+        for i in d.items:
+            item_id = diffs["items"].apply(
+                diffs["items"].match(i.item_id),
+                {"domain_id": domain_id, "text": i.text, "control_type": i.control_type,
+                 "order_index": i.order_index, "custom_tags": i.custom_tags}
+            )
+            for o in i.options:
+                diffs["options"].apply(
+                    diffs["options"].match(o.option_id),
+                    {"item_id": item_id, "label": o.label, "value": o.value,
+                     "points": o.points, "order_index": o.order_index}
+                )
+
+    for st in data.scoring_tables:
+        target_domain_id = domain_id_map.get(st.domain_id, st.domain_id)
+        if target_domain_id is not None and target_domain_id not in domain_ids:
+            continue # its domain was removed: the table goes with it
+        diffs["scoring_tables"].apply(
+            diffs["scoring_tables"].match(st.table_id),
+            {"instrument_id": instrument.instrument_id, "domain_id": target_domain_id,
+             "population_filter": st.population_filter, "min_score": st.min_score,
+             "max_score": st.max_score, "result_level": st.result_level,
+             "recommendation": st.recommendation}
+        )
+
+    # Inserts parents first, deletes children first; moved rows are updated
+    # before their old parent is deleted
+    for key in ("domains", "items", "options", "scoring_tables"):
+        diff = diffs[key]
+        if diff.inserts:
+            db.execute(insert(diff.model), diff.inserts)
+        if diff.updates:
+            db.execute(update(diff.model), diff.updates)
+    for key in ("scoring_tables", "options", "items", "domains"):
+        diff = diffs[key]
+        if diff.deletes:
+            db.execute(
+                delete(diff.model).where(getattr(diff.model, diff.pk).in_(diff.deletes)),
+                execution_options={"synchronize_session": False}
+            )
+
+    db.commit()
+    instrument_cache.invalidate(instrument_id)
+    for key, diff in diffs.items():
+        changes[key] = diff.summary()
+    return changes
@@ -0,0 +1,82 @@
+import os
+import socket
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models
+
+# Database-level mutex for batch jobs (job_locks table). Works on any dialect:
+# acquiring inserts a row keyed by lock name, so a second holder hits the primary key.
+# Locks carry an expiry so a crashed run doesn't block the next night's run forever;
+# long runs renew() theirs as they make progress.
+
+class LockNotAcquired(RuntimeError):
+    pass
+
+def _owner_token() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def acquire(db: Session, name: str, ttl: timedelta):
+    """
+    Takes the lock `name`. Returns the owner token, or None if another holder has it.
+    """
+    now = datetime.utcnow()
+    # Take over stale locks
+    db.query(models.JobLock).filter(
+        models.JobLock.lock_name == name,
+        models.JobLock.expires_at < now
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    owner = _owner_token()
+    db.add(models.JobLock(lock_name=name, owner=owner, acquired_at=now, expires_at=now + ttl))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return owner
+
+def renew(db: Session, name: str, owner: str, ttl: timedelta) -> bool:
+    """
+    Pushes the expiry of a held lock to now + ttl. Returns False if `owner` no
+    longer holds it (it expired and another run took it over).
+    """
+    renewed = db.query(models.JobLock).filter(
+        models.JobLock.lock_name == name,
+        models.JobLock.owner == owner
+    ).update({"expires_at": datetime.utcnow() + ttl}, synchronize_session=False)
+    db.commit()
+    return renewed > 0
+
+def release(db: Session, name: str, owner: str):
+    db.query(models.JobLock).filter(
+        models.JobLock.lock_name == name,
+        models.JobLock.owner == owner
+    ).delete(synchronize_session=False)
+    db.commit()
+
+def holder(db: Session, name: str):
+    """
+    Returns the current JobLock row for `name` (or None).
+    """
+    return db.query(models.JobLock).filter(models.JobLock.lock_name == name).first()
+
+@contextmanager
+def job_lock(db: Session, name: str, ttl: timedelta = timedelta(hours=6)):
+    """
+    with job_lock(db, "daily_automations"): ...
+    Raises LockNotAcquired if the job is already running.
+    """
+    owner = acquire(db, name, ttl)
+    if owner is None:
+        current = holder(db, name)
+        since = f" since {current.acquired_at}" if current else ""
+        held_by = current.owner if current else "another run"
+        raise LockNotAcquired(f"'{name}' is already running ({held_by}{since})")
+    try:
+        yield owner
+    finally:
+        release(db, name, owner)
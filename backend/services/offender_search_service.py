@@ -0,0 +1,200 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import event, func, or_, case, select, table, column, literal_column, text, true
+import logging
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+# Offender name / badge search index.
+# - SQLite: FTS5 table `offender_search` using offenders as external content
+#   (keyed on the offenders rowid), kept in sync by AFTER INSERT/UPDATE/DELETE triggers.
+#   NOTE: VACUUM can renumber rowids of offenders; run rebuild_search_index() afterwards.
+# - Postgres: pg_trgm GIN index on lower(first_name || ' ' || last_name) plus a
+#   text_pattern_ops index on lower(badge_id) for prefix matching. Postgres maintains both.
+# Other dialects, and Postgres without pg_trgm (the role may not be allowed to
+# create extensions), fall back to the un-indexed LIKE scan.
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS offender_search USING fts5(
+        first_name, last_name, badge_id,
+        content='offenders', content_rowid='rowid', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS offenders_search_ai AFTER INSERT ON offenders BEGIN
+        INSERT INTO offender_search(rowid, first_name, last_name, badge_id)
+        VALUES (new.rowid, new.first_name, new.last_name, new.badge_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS offenders_search_ad AFTER DELETE ON offenders BEGIN
+        INSERT INTO offender_search(offender_search, rowid, first_name, last_name, badge_id)
+        VALUES ('delete', old.rowid, old.first_name, old.last_name, old.badge_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS offenders_search_au AFTER UPDATE OF first_name, last_name, badge_id ON offenders BEGIN
+        INSERT INTO offender_search(offender_search, rowid, first_name, last_name, badge_id)
+        VALUES ('delete', old.rowid, old.first_name, old.last_name, old.badge_id);
+        INSERT INTO offender_search(rowid, first_name, last_name, badge_id)
+        VALUES (new.rowid, new.first_name, new.last_name, new.badge_id);
+    END
+    """,
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_offenders_name_trgm ON offenders USING gin (lower((first_name || ' ') || last_name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_offenders_badge_prefix ON offenders (lower(badge_id) text_pattern_ops)",
+]
+
+_trigram_available = None # Postgres: pg_trgm installed (None = not checked yet)
+
+def ensure_search_index(connection):
+    """
+    Idempotently creates the search index for the connected dialect.
+    On SQLite the FTS table is back-filled the first time it is created.
+    On Postgres a statement that fails (e.g. no permission to create pg_trgm)
+    is logged and skipped; search then uses LIKE.
+    """
+    global _trigram_available
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        existed = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'offender_search'")
+        ).first()
+        for stmt in SQLITE_DDL:
+            connection.execute(text(stmt))
+        if not existed:
+            connection.execute(text("INSERT INTO offender_search(offender_search) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for stmt in POSTGRES_DDL:
+            try:
+                with connection.begin_nested():
+                    connection.execute(text(stmt))
+            except Exception as e:
+                logger.error(f"Could not create offender search index ({stmt}): {e}")
+        _trigram_available = None
+
+def rebuild_search_index(connection):
+    """
+    Rebuilds the SQLite FTS index from the offenders table (e.g. after VACUUM).
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("INSERT INTO offender_search(offender_search) VALUES ('rebuild')"))
+
+@event.listens_for(models.Offender.__table__, "after_create")
+def _create_search_index(target, connection, **kw):
+    ensure_search_index(connection)
+
+@event.listens_for(models.Offender.__table__, "before_drop")
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS offender_search"))
+
+# --- Query helpers ---
+
+_fts = table("offender_search", column("rowid"))
+_offenders_rowid = literal_column("offenders.rowid")
+_name_expr = func.lower(models.Offender.first_name + ' ' + models.Offender.last_name)
+
+def _fts_query(term: str) -> str:
+    """
+    Turns user input into an FTS5 query: every word becomes a quoted prefix
+    phrase, all of them required. "b-00" -> "b-00"* (matches badge B-0001).
+    """
+    words = [w.replace('"', '') for w in term.split()]
+    return " ".join(f'"{w}"*' for w in words if w)
+
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _dialect(db: Session) -> str:
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql' and not _has_trigram(db):
+        return 'like'
+    return dialect
+
+def _has_trigram(db: Session) -> bool:
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    return _trigram_available
+
+def search_filter(db: Session, term: str):
+    """
+    Returns a WHERE clause restricting a query (that includes the offenders table)
+    to offenders matching `term`, served by the search index.
+    """
+    term = (term or "").strip().lower()
+    dialect = _dialect(db)
+
+    if dialect == 'sqlite':
+        fts_q = _fts_query(term)
+        if not fts_q:
+            return true()
+        matches = select(_fts.c.rowid).where(literal_column("offender_search").op("MATCH")(fts_q))
+        return _offenders_rowid.in_(matches)
+
+    escaped = _like_escape(term)
+    if dialect == 'postgresql':
+        return or_(
+            _name_expr.op('%')(term),
+            _name_expr.like(f"%{escaped}%", escape="\\"),
+            func.lower(models.Offender.badge_id).like(f"{escaped}%", escape="\\")
+        )
+
+    search_term = f"%{escaped}%"
+    return or_(
+        func.lower(models.Offender.first_name).like(search_term, escape="\\"),
+        func.lower(models.Offender.last_name).like(search_term, escape="\\"),
+        func.lower(models.Offender.badge_id).like(search_term, escape="\\")
+    )
+
+def search_offenders(db: Session, term: str, limit: int = 20):
+    """
+    Ranked offender search. Returns [(Offender, score)] best match first.
+    Badge prefix matches outrank name matches.
+    """
+    term = (term or "").strip().lower()
+    if not term:
+        return []
+    dialect = _dialect(db)
+
+    if dialect == 'sqlite':
+        fts_q = _fts_query(term)
+        if not fts_q:
+            return []
+        # bm25: lower is better; weights = first_name, last_name, badge_id
+        rank = literal_column("bm25(offender_search, 1.0, 1.0, 4.0)")
+        rows = (
+            db.query(models.Offender, rank.label("score"))
+            .join(_fts, _fts.c.rowid == _offenders_rowid)
+            .filter(literal_column("offender_search").op("MATCH")(fts_q))
+            .order_by(rank.asc(), models.Offender.last_name.asc())
+            .limit(limit)
+            .all()
+        )
+        return [(offender, -score) for offender, score in rows]
+
+    if dialect == 'postgresql':
+        escaped = _like_escape(term)
+        badge_match = func.lower(models.Offender.badge_id).like(f"{escaped}%", escape="\\")
+        score = func.greatest(func.similarity(_name_expr, term), case((badge_match, 1.0), else_=0.0))
+        return (
+            db.query(models.Offender, score.label("score"))
+            .filter(or_(_name_expr.op('%')(term), _name_expr.like(f"%{escaped}%", escape="\\"), badge_match))
+            .order_by(score.desc(), models.Offender.last_name.asc())
+            .limit(limit)
+            .all()
+        )
+
+    rows = (
+        db.query(models.Offender)
+        .filter(search_filter(db, term))
+        .order_by(models.Offender.last_name.asc())
+        .limit(limit)
+        .all()
+    )
+    return [(offender, 0.0) for offender in rows]
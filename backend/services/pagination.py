@@ -0,0 +1,64 @@
+import base64
+import json
+import uuid
+from datetime import date
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination helpers.
+# A cursor is an opaque url-safe token holding the sort key of the last row
+# of the previous page, e.g. {"k": ["Smith", "<episode_id>"]}.
+
+def encode_cursor(*values) -> str:
+    """
+    Encodes the sort key of the last row into an opaque cursor string.
+    Dates and UUIDs are stored as strings.
+    """
+    key = [v.isoformat() if isinstance(v, date) else (str(v) if v is not None else None) for v in values]
+    raw = json.dumps({"k": key}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    Decodes a cursor back into its list of raw (string) sort key values.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key = data["k"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError("Invalid cursor")
+    return key
+
+def parse_uuid(value) -> uuid.UUID:
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+def parse_date(value):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def seek_after(sort_col, tiebreak_col, sort_val, tiebreak_val, nulls_last=False):
+    """
+    Builds the keyset predicate "(sort_col, tiebreak_col) > (sort_val, tiebreak_val)"
+    for an ascending sort. With nulls_last=True, NULL sort values are treated as
+    greater than every non-NULL value (matches ORDER BY ... NULLS LAST).
+    """
+    if sort_val is None:
+        return and_(sort_col.is_(None), tiebreak_col > tiebreak_val)
+
+    predicate = or_(
+        sort_col > sort_val,
+        and_(sort_col == sort_val, tiebreak_col > tiebreak_val)
+    )
+    if nulls_last:
+        predicate = or_(predicate, sort_col.is_(None))
+    return predicate
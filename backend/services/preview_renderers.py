@@ -0,0 +1,139 @@
+import io
+import os
+import signal
+import threading
+import zipfile
+from xml.etree import ElementTree
+
+# Thumbnail + text extract for one stored file. Runs inside the preview worker
+# processes (services/document_previews.py): plain functions, no DB or storage.
+# - images: Pillow
+# - PDF: pypdfium2 when installed (pip install pypdfium2), otherwise unsupported
+# - .docx: text from word/document.xml, embedded thumbnail or a text card
+# - plain text / CSV: text card
+
+THUMBNAIL_SIZE = (256, 256)
+TEXT_LIMIT = 1_000_000 # characters kept from the extract
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+TEXT_EXTENSIONS = (".txt", ".csv", ".md", ".log")
+
+class UnsupportedFormat(Exception):
+    pass
+
+class JobTimeout(Exception):
+    pass
+
+def _kind(file_type: str, file_name: str) -> str:
+    file_type = (file_type or "").lower()
+    ext = os.path.splitext(file_name or "")[1].lower()
+    if file_type.startswith("image/"):
+        return "image"
+    if file_type == "application/pdf" or ext == ".pdf":
+        return "pdf"
+    if ext == ".docx" or file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        return "docx"
+    if file_type.startswith("text/") or ext in TEXT_EXTENSIONS:
+        return "text"
+    raise UnsupportedFormat(f"No preview for {file_type or ext or 'unknown type'}")
+
+def _png(image) -> bytes:
+    from PIL import ImageOps
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA")
+    image.thumbnail(THUMBNAIL_SIZE)
+    out = io.BytesIO()
+    image.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+def text_card(text: str) -> bytes:
+    """
+    Page-shaped thumbnail with the first lines of the text.
+    """
+    from PIL import Image, ImageDraw
+    width, height = THUMBNAIL_SIZE[0] * 3 // 4, THUMBNAIL_SIZE[1]
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    y = 8
+    for line in text.splitlines():
+        while line and y < height - 12:
+            draw.text((8, y), line[:34], fill=60)
+            line = line[34:]
+            y += 11
+        if y >= height - 12:
+            break
+    return _png(image)
+
+def _render_image(path):
+    from PIL import Image
+    with Image.open(path) as image:
+        image.seek(0) # first frame of GIF / TIFF
+        return _png(image), None
+
+def _render_pdf(path):
+    try:
+        import pypdfium2
+    except ImportError:
+        raise UnsupportedFormat("PDF previews require pypdfium2 (pip install pypdfium2)")
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        page = pdf[0]
+        scale = THUMBNAIL_SIZE[1] / page.get_height()
+        thumbnail = _png(page.render(scale=scale).to_pil())
+        parts, length = [], 0
+        for index in range(len(pdf)):
+            text = pdf[index].get_textpage().get_text_range()
+            parts.append(text)
+            length += len(text)
+            if length >= TEXT_LIMIT:
+                break
+        return thumbnail, "\n".join(parts)[:TEXT_LIMIT]
+    finally:
+        pdf.close()
+
+def _render_docx(path):
+    from PIL import Image
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+        paragraphs = ("".join(t.text or "" for t in p.iter(f"{WORD_NS}t")) for p in root.iter(f"{WORD_NS}p"))
+        text = "\n".join(paragraphs)[:TEXT_LIMIT]
+        embedded = [n for n in archive.namelist() if n.lower().startswith("docprops/thumbnail.")]
+        if embedded:
+            with Image.open(io.BytesIO(archive.read(embedded[0]))) as image:
+                return _png(image), text
+    return text_card(text), text
+
+def _render_text(path):
+    with open(path, "rb") as f:
+        text = f.read(TEXT_LIMIT * 4).decode("utf-8", errors="replace")[:TEXT_LIMIT]
+    return text_card(text), text
+
+RENDERERS = {"image": _render_image, "pdf": _render_pdf, "docx": _render_docx, "text": _render_text}
+
+def render(path: str, file_type: str, file_name: str):
+    """
+    Returns (thumbnail PNG bytes or None, extracted text or None).
+    Raises UnsupportedFormat.
+    """
+    return RENDERERS[_kind(file_type, file_name)](path)
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+def run_job(path: str, file_type: str, file_name: str, timeout: float = None):
+    """
+    Worker-process entry point: render() bounded by `timeout` seconds (SIGALRM,
+    so only enforced in a process's main thread; the pool also times out the
+    future).
+    """
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return render(path, file_type, file_name)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
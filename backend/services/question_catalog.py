@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+import weakref
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .. import models
+
+# Versioned in-memory catalog of the risk assessment question bank.
+# - Loaded once (one query) and shared by every form open.
+# - assessment_type -> ordered questions is resolved once per type and memoized.
+# - create_question / update_question (and any ORM write to the questions table,
+#   via the after_commit listener below) bump the version; the next read rebuilds.
+# - QUESTION_CATALOG_TTL (seconds, default 300) bounds staleness across worker
+#   processes, which don't see each other's version bumps.
+# - Snapshots are kept per database (the session's bind), so sessions on
+#   different engines never read each other's question bank.
+
+class CatalogQuestion:
+    """
+    Immutable snapshot of a RiskAssessmentQuestion with pre-parsed fields.
+    """
+    __slots__ = (
+        "question_id", "universal_tag", "question_text", "input_type", "source_type",
+        "category", "scoring_note", "options", "tools"
+    )
+
+    def __init__(self, q):
+        self.question_id = q.question_id
+        self.universal_tag = q.universal_tag
+        self.question_text = q.question_text
+        self.input_type = q.input_type
+        self.source_type = q.source_type
+        self.category = q.category
+        self.scoring_note = q.scoring_note
+        self.options = _parse_options(q.options)
+        # 'ORAS|Static-99R' -> ('ORAS', 'Static-99R')
+        self.tools = tuple(tool.strip() for tool in (q.assessments_list or "").split("|"))
+
+    def applies_to(self, assessment_type: str) -> bool:
+        # A tool matches if it is part of the requested type ("ORAS" matches "ORAS-CST")
+        return any(tool in assessment_type for tool in self.tools)
+
+def _parse_options(options):
+    # Some older rows hold the options as a JSON-encoded string
+    if isinstance(options, str):
+        try:
+            return json.loads(options)
+        except ValueError:
+            return None
+    return options
+
+class CatalogSnapshot:
+    def __init__(self, version, questions):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.questions = tuple(questions)
+        self.by_tag = {q.universal_tag: q for q in self.questions}
+        self._by_type = {}
+        self._lock = threading.Lock()
+
+    def for_type(self, assessment_type: str):
+        assessment_type = assessment_type or ""
+        questions = self._by_type.get(assessment_type)
+        if questions is None:
+            questions = tuple(q for q in self.questions if q.applies_to(assessment_type))
+            with self._lock:
+                self._by_type[assessment_type] = questions
+        return questions
+
+class QuestionCatalog:
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshots = weakref.WeakKeyDictionary() # bind -> CatalogSnapshot
+        self.loads = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump(self):
+        """
+        Marks the catalog stale; the next read reloads it.
+        """
+        with self._lock:
+            self._version += 1
+
+    def get(self, db: Session) -> CatalogSnapshot:
+        bind = db.get_bind()
+        snapshot = self._snapshots.get(bind)
+        if (snapshot is not None and snapshot.version == self._version
+                and time.monotonic() - snapshot.loaded_at < self.ttl_seconds):
+            return snapshot
+
+        with self._lock:
+            version = self._version
+        questions = [
+            CatalogQuestion(q) for q in
+            db.query(models.RiskAssessmentQuestion).order_by(models.RiskAssessmentQuestion.question_id).all()
+        ]
+        snapshot = CatalogSnapshot(version, questions)
+        with self._lock:
+            self.loads += 1
+            # Don't publish a snapshot that was invalidated while loading
+            if self._version == version:
+                self._snapshots[bind] = snapshot
+        return snapshot
+
+    def for_type(self, db: Session, assessment_type: str):
+        return self.get(db).for_type(assessment_type)
+
+question_catalog = QuestionCatalog(ttl_seconds=float(os.getenv("QUESTION_CATALOG_TTL", "300")))
+
+# --- Invalidation on any committed write to the question bank ---
+
+_PENDING_KEY = "question_catalog_dirty"
+
+@event.listens_for(Session, "after_flush")
+def _note_question_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.RiskAssessmentQuestion):
+            session.info[_PENDING_KEY] = True
+            return
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        question_catalog.bump()
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
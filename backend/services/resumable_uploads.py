@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .. import models
+from . import document_store, storage_backends
+
+logger = logging.getLogger(__name__)
+
+# Resumable uploads for large files (body-cam clips, scanned packets):
+#   POST   /documents/uploads                       -> session (upload_id, chunk_size)
+#   PUT    /documents/uploads/{id}/chunks/{n}        raw bytes + X-Chunk-SHA256
+#   GET    /documents/uploads/{id}                   received chunks, to resume
+#   POST   /documents/uploads/{id}/commit            assemble -> Document
+#                                                    (a retry returns the same Document)
+# Chunks are streamed to <tmp_dir>/uploads/<upload_id>/<n>.part and checked
+# against their SHA-256; nothing is held in memory beyond one read buffer.
+# Sessions expire UPLOAD_SESSION_TTL_HOURS (default 24) after their last chunk
+# (committed ones: after the commit, so retries still get their Document);
+# cleanup_expired() removes them (Celery beat + opportunistically on create).
+# A session being committed is never removed under its commit.
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+SESSION_TTL = timedelta(hours=float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")))
+
+class UploadError(ValueError):
+    """
+    Client-side problem with a chunk or commit (bad checksum, missing chunks...).
+    """
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def session_dir(upload_id, storage=None) -> str:
+    storage = storage or storage_backends.get_storage()
+    return os.path.join(storage.tmp_dir, "uploads", str(upload_id))
+
+def chunk_path(upload_id, index: int, storage=None) -> str:
+    return os.path.join(session_dir(upload_id, storage), f"{index:06d}.part")
+
+def create_session(db: Session, chunk_size: int = None, **fields) -> models.UploadSession:
+    chunk_size = min(chunk_size or DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE)
+    cleanup_expired(db)
+    upload = models.UploadSession(
+        chunk_size=chunk_size,
+        status='open',
+        expires_at=datetime.utcnow() + SESSION_TTL,
+        **fields
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    os.makedirs(session_dir(upload.upload_id), exist_ok=True)
+    return upload
+
+def get_session(db: Session, upload_id) -> models.UploadSession:
+    upload = db.query(models.UploadSession).filter(models.UploadSession.upload_id == upload_id).first()
+    if upload is None:
+        raise LookupError("Upload session not found or expired")
+    # Expiry only closes sessions still taking chunks; a committing or committed
+    # one resolves to its Document (or a 409) until cleanup_expired() removes it
+    if upload.status == 'open' and upload.expires_at < datetime.utcnow():
+        raise LookupError("Upload session not found or expired")
+    return upload
+
+def get_open_session(db: Session, upload_id) -> models.UploadSession:
+    upload = get_session(db, upload_id)
+    if upload.status != 'open':
+        raise UploadError(f"Upload session is {upload.status}", status_code=409)
+    return upload
+
+async def write_chunk(db: Session, upload_id, index: int, stream, expected_sha256: str) -> models.UploadChunk:
+    """
+    Streams one chunk (async iterator of bytes) to its part file, verifying size and
+    checksum. Re-sending a chunk replaces it.
+    """
+    if not expected_sha256:
+        raise UploadError("X-Chunk-SHA256 header is required")
+    upload = await run_in_threadpool(get_open_session, db, upload_id)
+    if index < 0:
+        raise UploadError("Chunk index must be >= 0")
+
+    path = chunk_path(upload_id, index)
+    tmp_path = f"{path}.incoming"
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    target = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        async for piece in stream:
+            size += len(piece)
+            if size > upload.chunk_size:
+                raise UploadError(f"Chunk larger than the session chunk size ({upload.chunk_size} bytes)", 413)
+            digest.update(piece)
+            await run_in_threadpool(target.write, piece)
+    except BaseException:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    await run_in_threadpool(target.close)
+
+    if digest.hexdigest() != expected_sha256.lower():
+        os.remove(tmp_path)
+        raise UploadError(f"Checksum mismatch for chunk {index}", status_code=422)
+    os.replace(tmp_path, path)
+
+    return await run_in_threadpool(_record_chunk, db, upload, index, size, digest.hexdigest())
+
+def _record_chunk(db: Session, upload, index, size, sha256):
+    chunk = db.get(models.UploadChunk, (upload.upload_id, index))
+    if chunk is None:
+        chunk = models.UploadChunk(upload_id=upload.upload_id, chunk_index=index)
+        db.add(chunk)
+    chunk.size, chunk.sha256, chunk.received_at = size, sha256, datetime.utcnow()
+    upload.expires_at = datetime.utcnow() + SESSION_TTL # sliding expiry while chunks arrive
+    db.commit()
+    return chunk
+
+def describe(upload: models.UploadSession) -> dict:
+    received = [c.chunk_index for c in upload.chunks]
+    return {
+        "upload_id": str(upload.upload_id),
+        "status": upload.status,
+        "file_name": upload.file_name,
+        "chunk_size": upload.chunk_size,
+        "total_size": upload.total_size,
+        "received_chunks": received,
+        "received_bytes": sum(c.size for c in upload.chunks),
+        "expires_at": upload.expires_at.isoformat(),
+        "document_id": str(upload.document_id) if upload.document_id else None,
+    }
+
+class _PartsReader:
+    """
+    File-like view over the part files in order, read in bounded pieces.
+    """
+    def __init__(self, paths):
+        self._paths = list(paths)
+        self._current = None
+
+    def read(self, size=-1):
+        while self._paths or self._current:
+            if self._current is None:
+                self._current = open(self._paths.pop(0), "rb")
+            data = self._current.read(size)
+            if data:
+                return data
+            self._current.close()
+            self._current = None
+        return b""
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+
+def _committed_document(db: Session, upload) -> models.Document:
+    if upload.status == 'committed' and upload.document_id is not None:
+        doc = db.get(models.Document, upload.document_id)
+        if doc is not None:
+            return doc
+    raise UploadError(f"Upload session is {upload.status}", status_code=409)
+
+def _claim(db: Session, upload_id) -> bool:
+    """
+    open -> committing, atomically; False if another commit got there first.
+    """
+    session = models.UploadSession
+    claimed = db.execute(
+        update(session).where(session.upload_id == upload_id, session.status == 'open')
+        .values(status='committing'),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.commit()
+    return claimed > 0
+
+def _release(db: Session, upload_id):
+    db.rollback()
+    session = models.UploadSession
+    db.execute(
+        update(session).where(session.upload_id == upload_id, session.status == 'committing')
+        .values(status='open'),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+
+def _commit(db: Session, upload_id, total_chunks: int, sha256: str = None) -> models.Document:
+    upload = get_session(db, upload_id)
+    if upload.status != 'open':
+        # A retry after a lost response gets the document it already made
+        return _committed_document(db, upload)
+    received = {c.chunk_index: c for c in upload.chunks}
+    missing = [i for i in range(total_chunks) if i not in received]
+    if missing:
+        raise UploadError(f"Missing chunks: {missing[:20]}", status_code=409)
+    extra = sorted(i for i in received if i >= total_chunks)
+    if extra:
+        raise UploadError(f"Chunks beyond total_chunks: {extra[:20]}", status_code=409)
+    size = sum(c.size for c in received.values())
+    if upload.total_size is not None and size != upload.total_size:
+        raise UploadError(f"Received {size} bytes, expected {upload.total_size}", status_code=409)
+
+    # Only one concurrent commit of a session gets past here
+    if not _claim(db, upload_id):
+        db.refresh(upload)
+        return _committed_document(db, upload)
+    try:
+        doc = _assemble(db, upload, total_chunks, sha256)
+    except BaseException:
+        _release(db, upload_id)
+        raise
+    db.refresh(upload)
+    upload.status = 'committed'
+    upload.document_id = doc.document_id
+    upload.expires_at = datetime.utcnow() + SESSION_TTL # retry window for a lost response
+    db.query(models.UploadChunk).filter(models.UploadChunk.upload_id == upload.upload_id).delete()
+    db.commit()
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+    return doc
+
+def _assemble(db: Session, upload, total_chunks: int, sha256: str = None) -> models.Document:
+    storage = storage_backends.get_storage()
+    reader = _PartsReader(chunk_path(upload.upload_id, i) for i in range(total_chunks))
+    try:
+        tmp_path, file_sha256, file_size = document_store.spool(reader, storage.tmp_dir)
+    finally:
+        reader.close()
+    if sha256 and sha256.lower() != file_sha256:
+        os.remove(tmp_path)
+        raise UploadError("Checksum mismatch for the assembled file", status_code=422)
+
+    return document_store.register(db, storage, tmp_path, file_sha256, file_size, {
+        "offender_id": upload.offender_id,
+        "uploaded_by_id": upload.uploaded_by_id,
+        "note_id": upload.note_id,
+        "task_id": upload.task_id,
+        "file_name": upload.file_name,
+        "file_type": upload.file_type,
+        "category": upload.category,
+        "uploaded_at": datetime.utcnow(),
+    })
+
+async def commit(db: Session, upload_id, total_chunks: int, sha256: str = None) -> models.Document:
+    """
+    Assembles chunks 0..total_chunks-1 into the document store and creates the
+    Document (same record as POST /documents/upload). Committing an already
+    committed session returns its Document again.
+    """
+    return await run_in_threadpool(_commit, db, upload_id, total_chunks, sha256)
+
+def abort(db: Session, upload_id):
+    upload = db.query(models.UploadSession).filter(models.UploadSession.upload_id == upload_id).first()
+    if upload is None:
+        raise LookupError("Upload session not found")
+    db.delete(upload)
+    db.commit()
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+
+def cleanup_expired(db: Session, now: datetime = None) -> int:
+    """
+    Deletes expired open sessions with their chunks, and committed sessions past
+    their expiry. Sessions in 'committing' are skipped while their assemble may
+    still be running; one left behind by a crashed commit goes a further
+    SESSION_TTL later. Returns the number of sessions removed.
+    """
+    now = now or datetime.utcnow()
+    session = models.UploadSession
+    expired = db.query(session).filter(
+        session.expires_at < now,
+        or_(session.status != 'committing', session.expires_at < now - SESSION_TTL)
+    ).all()
+    for upload in expired:
+        shutil.rmtree(session_dir(upload.upload_id), ignore_errors=True)
+        db.delete(upload)
+    if expired:
+        db.commit()
+        logger.info(f"Removed {len(expired)} expired upload sessions")
+    return len(expired)
@@ -1,9 +1,22 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from datetime import datetime, timedelta
 from .. import models
 import json
-from . import automation_service
+import uuid
+from . import assessment_rescore, automation_events
+from .question_catalog import question_catalog
+from .scoring_plan import QuestionScorer, scoring_plans
+
+LOOKBACK_SETTING = 'assessment_lookback_days'
+DEFAULT_LOOKBACK_DAYS = 30
+
+# Edits to these fields change stored scores, so they request a rescore
+# (applied only if RESCORE_TRANSPORT opts in; see assessment_rescore)
+QUESTION_SCORING_FIELDS = {'options', 'input_type', 'universal_tag'}
+TYPE_SCORING_FIELDS = {'scoring_matrix'}
 
 def initialize_assessment(db: Session, offender_id: str, assessment_type: str):
     """
@@ -13,23 +26,12 @@ def initialize_assessment(db: Session, offender_id: str, assessment_type: str):
     3. Looking up 'Dynamic' answers from recent assessments (Look-Back logic).
     """
 
-    # 1. Fetch Questions
-    # In a real scenario, we might want a more robust 'LIKE' or array check
-    # For now, we fetch all and filter in python or use a simple LIKE
-    all_questions = db.query(models.RiskAssessmentQuestion).all()
-    
-    # Updated filtering logic to handle "ORAS-CST" matching "ORAS"
-    questions = []
-    for q in all_questions:
-        allowed_tools = (q.assessments_list or "").split("|")
-        # specific check: if any allowed tool (e.g. "ORAS") is part of the requested type (e.g. "ORAS-CST")
-        if any(tool.strip() in assessment_type for tool in allowed_tools):
-            questions.append(q)
+    # 1. Questions for this type, from the in-memory catalog (no query in steady state)
+    questions = question_catalog.for_type(db, assessment_type)
     
     form_schema = []
     
     # Convert string uuid to object if needed
-    import uuid
     if isinstance(offender_id, str):
         try:
             offender_id_obj = uuid.UUID(offender_id)
@@ -42,9 +44,13 @@ def initialize_assessment(db: Session, offender_id: str, assessment_type: str):
     if not offender:
         raise ValueError("Offender not found")
 
-    # 30 Day Lookback Date
-    lookback_date = datetime.utcnow().date() - timedelta(days=30)
-    
+    # 2. Most recent answer per dynamic tag within the look-back window (one query)
+    dynamic_tags = [q.universal_tag for q in questions if q.source_type == 'dynamic']
+    recent_answers = {}
+    if dynamic_tags:
+        lookback_date = datetime.utcnow().date() - timedelta(days=get_lookback_days(db))
+        recent_answers = recent_dynamic_answers(db, offender_id_obj, dynamic_tags, lookback_date)
+
     for q in questions:
         field_data = {
             "universal_tag": q.universal_tag,
@@ -77,49 +83,107 @@ def initialize_assessment(db: Session, offender_id: str, assessment_type: str):
 
         # B. Dynamic Data (Recent Answers)
         elif q.source_type == 'dynamic':
-            # Find the most recent answer for this tag from THIS offender
-            recent_answer = (
-                db.query(models.RiskAssessmentAnswer)
-                .join(models.RiskAssessment, models.RiskAssessmentAnswer.assessment_id == models.RiskAssessment.assessment_id)
-                .filter(models.RiskAssessment.offender_id == offender_id_obj)
-                .filter(models.RiskAssessment.date >= lookback_date)
-                .filter(models.RiskAssessmentAnswer.question_tag == q.universal_tag)
-                .order_by(desc(models.RiskAssessment.date))
-                .first()
-            )
-            
-            if recent_answer and recent_answer.value is not None:
-                field_data['value'] = recent_answer.value
+            recent = recent_answers.get(q.universal_tag)
+            if recent and recent[0] is not None:
+                value, assessment_date = recent
+                field_data['value'] = value
                 field_data['is_imported'] = True
-                field_data['source_note'] = f"Imported from Assessment on {recent_answer.assessment.date}"
+                field_data['source_note'] = f"Imported from Assessment on {assessment_date}"
 
         form_schema.append(field_data)
 
     return form_schema
 
+def get_lookback_days(db: Session) -> int:
+    """
+    Look-back window for dynamic answers, from SystemSettings 'assessment_lookback_days'.
+    """
+    setting = db.query(models.SystemSettings).filter(models.SystemSettings.key == LOOKBACK_SETTING).first()
+    try:
+        days = int(setting.value) if setting else DEFAULT_LOOKBACK_DAYS
+    except ValueError:
+        days = DEFAULT_LOOKBACK_DAYS
+    return max(days, 0)
+
+def recent_dynamic_answers(db: Session, offender_id, tags, since) -> dict:
+    """
+    Latest answer per question tag for this offender from assessments dated on or
+    after `since`. Returns {tag: (value, assessment_date)}.
+    One query: ROW_NUMBER() partitioned by tag, newest assessment first.
+    """
+    ranked = (
+        db.query(
+            models.RiskAssessmentAnswer.question_tag.label("tag"),
+            models.RiskAssessmentAnswer.value.label("value"),
+            models.RiskAssessment.date.label("date"),
+            func.row_number().over(
+                partition_by=models.RiskAssessmentAnswer.question_tag,
+                order_by=(desc(models.RiskAssessment.date), desc(models.RiskAssessment.assessment_id))
+            ).label("rank")
+        )
+        .join(models.RiskAssessment, models.RiskAssessmentAnswer.assessment_id == models.RiskAssessment.assessment_id)
+        .filter(models.RiskAssessment.offender_id == offender_id)
+        .filter(models.RiskAssessment.date >= since)
+        .filter(models.RiskAssessmentAnswer.question_tag.in_(list(tags)))
+        .subquery()
+    )
+    rows = db.query(ranked.c.tag, ranked.c.value, ranked.c.date).filter(ranked.c.rank == 1)
+    return {tag: (value, assessment_date) for tag, value, assessment_date in rows}
+
 def save_assessment_answer(db: Session, assessment_id: str, tag: str, value):
     """
     Saves or updates a single answer.
     """
-    # Check if answer exists
-    existing = (
-        db.query(models.RiskAssessmentAnswer)
-        .filter(models.RiskAssessmentAnswer.assessment_id == assessment_id)
-        .filter(models.RiskAssessmentAnswer.question_tag == tag)
-        .first()
-    )
-    
-    if existing:
-        existing.value = value
-    else:
-        new_answer = models.RiskAssessmentAnswer(
-            assessment_id=assessment_id,
-            question_tag=tag,
-            value=value
+    save_assessment_answers(db, assessment_id, {tag: value})
+
+def save_assessment_answers(db: Session, assessment_id, answers: dict) -> int:
+    """
+    Saves or updates many answers ({tag: value}) in one statement:
+    INSERT ... ON CONFLICT (assessment_id, question_tag) DO UPDATE, then one commit.
+    Raises LookupError for an unknown assessment, ValueError for unknown question tags.
+    """
+    if isinstance(assessment_id, str):
+        assessment_id = uuid.UUID(assessment_id)
+    exists = db.query(models.RiskAssessment.assessment_id).filter(models.RiskAssessment.assessment_id == assessment_id).first()
+    if not exists:
+        raise LookupError("Assessment not found")
+    if not answers:
+        return 0
+
+    unknown = set(answers) - set(question_catalog.get(db).by_tag)
+    if unknown:
+        # The catalog may predate a question added by another process
+        question_catalog.bump()
+        unknown -= set(question_catalog.get(db).by_tag)
+    if unknown:
+        raise ValueError(f"Unknown question tags: {', '.join(sorted(unknown))}")
+
+    answer = models.RiskAssessmentAnswer
+    rows = [{"assessment_id": assessment_id, "question_tag": tag, "value": value} for tag, value in answers.items()]
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = dialect_insert(answer)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['assessment_id', 'question_tag'],
+            set_={"value": stmt.excluded.value}
         )
-        db.add(new_answer)
-    
+        db.execute(stmt, rows)
+    else:
+        # Other dialects: one lookup, then update the existing rows and insert the rest
+        existing = {
+            a.question_tag: a for a in
+            db.query(answer).filter(answer.assessment_id == assessment_id, answer.question_tag.in_(list(answers)))
+        }
+        for row in rows:
+            if row["question_tag"] in existing:
+                existing[row["question_tag"]].value = row["value"]
+            else:
+                db.add(answer(**row))
+
     db.commit()
+    return len(rows)
 
 def calculate_score(db: Session, assessment_id: str) -> dict:
     """
@@ -127,89 +191,33 @@ def calculate_score(db: Session, assessment_id: str) -> dict:
     Uses RiskAssessmentType scoring matrix if available.
     Returns: {"total_score": int, "risk_level": str, "details": dict}
     """
-    # 1. Get Assessment and Type
     assessment = db.query(models.RiskAssessment).filter(models.RiskAssessment.assessment_id == assessment_id).first()
     if not assessment:
         raise ValueError("Assessment not found")
 
-    assessment_type_obj = db.query(models.RiskAssessmentType).filter(models.RiskAssessmentType.name == assessment.assessment_type).first()
+    # Compiled per type: cached until a question or the type changes
+    plan = scoring_plans.get(db, assessment.assessment_type)
 
-    answers = db.query(models.RiskAssessmentAnswer).filter(models.RiskAssessmentAnswer.assessment_id == assessment_id).all()
-    
-    total_score = 0
-    details = {}
-    category_scores = {}
-    
-    for ans in answers:
-        question = db.query(models.RiskAssessmentQuestion).filter(models.RiskAssessmentQuestion.universal_tag == ans.question_tag).first()
-        if not question:
+    answers = [
+        (answer.question_tag, answer.value) for answer in
+        db.query(models.RiskAssessmentAnswer.question_tag, models.RiskAssessmentAnswer.value)
+        .filter(models.RiskAssessmentAnswer.assessment_id == assessment.assessment_id)
+        .all()
+    ]
+
+    # Questions the cached catalog doesn't know yet (e.g. added by another worker)
+    extra = {}
+    for tag in dict.fromkeys(tag for tag, _ in answers):
+        if tag in plan.scorers:
             continue
-            
-        score_val = 0
-        
-        # Logic A: If Question has 'options' with 'value', iterate to find selected value's weight
-        if question.options and isinstance(question.options, list):
-            # ans.value might be string "Yes" or value 1 depending on frontend. 
-            # Assuming frontend sends the "value" or we match label.
-            # Let's assume frontend sends the raw value (e.g., "Yes" or 1).
-            
-            # Find matching option
-            selected_option = next((opt for opt in question.options if opt.get("label") == ans.value or opt.get("value") == ans.value), None)
-            if selected_option and "score" in selected_option:
-                 score_val = int(selected_option["score"])
-            # Fallback: if 'value' in option is numeric, use it? For now assume explicit 'score' key or use 'value' if int.
-            elif selected_option and isinstance(selected_option.get("value"), int):
-                score_val = selected_option["value"]
-                
-        # Logic B: If input_type is integer, add it directly (e.g. number of prior arrests)
-        elif question.input_type == 'integer':
-            try:
-                score_val = int(ans.value)
-            except (ValueError, TypeError):
-                score_val = 0
-                
-        # Logic C: Boolean (True=1, False=0) - Simple default
-        elif question.input_type == 'boolean':
-             if str(ans.value).lower() in ['true', '1', 'yes']:
-                 score_val = 1
-        
-        total_score += score_val
-        details[ans.question_tag] = score_val
-        
-        # Category Subtotals
-        cat = question.category or "General"
-        if cat not in category_scores:
-            category_scores[cat] = 0
-        category_scores[cat] += score_val
-
-    # Determine Risk Level dynamically
-    risk_level = "Unknown"
-    
-    if assessment_type_obj and assessment_type_obj.scoring_matrix:
-        # Dynamic Lookup
-        matrix = assessment_type_obj.scoring_matrix
-        # Sort matrix by min to ensure correct matching order if needed, but simple iteration works 
-        # structure: [{"label": "Low", "min": 0, "max": 14}, ...]
-        for rule in matrix:
-            min_val = rule.get("min", -999)
-            max_val = rule.get("max", 999)
-            if min_val <= total_score <= max_val:
-                risk_level = rule.get("label", "Unknown")
-                break
-    else:
-        # Fallback Hardcoded Logic
-        risk_level = "Low"
-        if total_score >= 15:
-            risk_level = "High"
-        elif total_score >= 8:
-            risk_level = "Medium"
-        
-    return {
-        "total_score": total_score,
-        "risk_level": risk_level,
-        "details": details,
-        "category_scores": category_scores
-    }
+        question = db.query(models.RiskAssessmentQuestion).filter(models.RiskAssessmentQuestion.universal_tag == tag).first()
+        if question is not None:
+            extra[tag] = QuestionScorer(question)
+    if extra:
+        question_catalog.bump()
+        plan = plan.with_scorers(extra)
+
+    return plan.score(answers)
 
 def submit_assessment(
     db: Session, 
@@ -253,9 +261,9 @@ def submit_assessment(
 
     # Trigger Automations
     try:
-        automation_service.check_automations(db, "risk_level_change", assessment.offender_id)
+        automation_events.publish("risk_level_change", assessment.offender_id, db)
         # Also trigger specific level event?
-        # e.g. automation_service.check_automations(db, f"risk_{assessment.final_risk_level.lower()}", assessment.offender_id)
+        # e.g. automation_events.publish(f"risk_{assessment.final_risk_level.lower()}", assessment.offender_id, db)
     except Exception as e:
         print(f"Error triggering automations: {e}")
 
@@ -277,6 +285,10 @@ def update_question(db: Session, question_id: int, data: dict):
             setattr(q, key, value)
     
     db.commit()
+    question_catalog.bump()
+    if QUESTION_SCORING_FIELDS & set(data):
+        # Scorers are shared by every type: any type's assessments may use the question
+        assessment_rescore.schedule(None)
     db.refresh(q)
     return q
 
@@ -284,6 +296,7 @@ def create_question(db: Session, data: dict):
     new_q = models.RiskAssessmentQuestion(**data)
     db.add(new_q)
     db.commit()
+    question_catalog.bump()
     db.refresh(new_q)
     return new_q
 
@@ -300,6 +313,9 @@ def update_type(db: Session, type_id: int, data: dict):
             setattr(t, key, value)
             
     db.commit()
+    scoring_plans.bump()
+    if TYPE_SCORING_FIELDS & set(data):
+        assessment_rescore.schedule(t.name)
     db.refresh(t)
     return t
 
@@ -312,6 +328,7 @@ def create_type(db: Session, data: dict):
     new_t = models.RiskAssessmentType(**data)
     db.add(new_t)
     db.commit()
+    scoring_plans.bump()
     db.refresh(new_t)
     return new_t
 
@@ -322,5 +339,6 @@ def delete_type(db: Session, type_id: int):
         
     db.delete(t)
     db.commit()
+    scoring_plans.bump()
     return {"status": "success", "message": f"Assessment Type '{t.name}' deleted"}
 
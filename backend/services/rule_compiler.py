@@ -0,0 +1,288 @@
+import datetime
+import hashlib
+import json
+import threading
+from sqlalchemy import func, and_, or_, true, Date, Integer, Float, Numeric, String, Text
+from .. import models
+
+# Compiles AutomationRule.conditions (JSON list of {field, operator, value}) once
+# into a Python predicate and, where every condition maps onto a column, an
+# equivalent SQLAlchemy WHERE clause. Compiled rules are cached per rule_id and
+# recompiled when the rule's definition changes (version = hash of the conditions).
+#
+# Condition semantics (shared by the daily engine and event triggers):
+# - 'risk_level' reads the episode's risk_level_at_start; other fields are read
+#   from the offender first, then the episode. Missing values compare as "".
+# - Text operators are case-insensitive. is_empty / is_not_empty ignore
+#   surrounding spaces only (SQL trim()'s default), not tabs or newlines.
+# - Numeric operators treat missing / non-numeric values as 0.
+# - Date operators never match a missing date.
+
+TEXT_OPERATORS = {"equals", "not_equals", "contains", "starts_with", "is_empty", "is_not_empty"}
+NUMERIC_OPERATORS = {"num_equals", "greater_than", "less_than", "is_between"}
+DATE_OPERATORS = {"date_equals", "is_before", "is_after"}
+OPERATORS = TEXT_OPERATORS | NUMERIC_OPERATORS | DATE_OPERATORS
+
+class RuleCompileError(ValueError):
+    """
+    Raised when a rule's conditions cannot be compiled (unknown operator, bad value).
+    """
+
+class CompiledRule:
+    def __init__(self, version, predicate, sql_filter):
+        self.version = version
+        self._predicate = predicate
+        # None when at least one condition can only be evaluated in Python
+        self.sql_filter = sql_filter
+
+    def matches(self, offender, episode=None) -> bool:
+        return self._predicate(offender, episode)
+
+# --- Value parsing (done once, at compile time) ---
+
+def _parse_number(value, position):
+    try:
+        return float(value or 0)
+    except (ValueError, TypeError):
+        raise RuleCompileError(f"Condition {position}: '{value}' is not a number")
+
+def _parse_range(value, position):
+    # "X and Y", "X-Y" or "X,Y"
+    val_str = str(value or "").lower().replace(' and ', ',').replace('-', ',')
+    try:
+        parts = [float(x.strip()) for x in val_str.split(',') if x.strip()]
+    except ValueError:
+        parts = []
+    if len(parts) < 2:
+        raise RuleCompileError(f"Condition {position}: invalid range '{value}' (expected 'X and Y')")
+    return parts[0], parts[1]
+
+def _parse_date(value, position):
+    try:
+        return datetime.datetime.strptime(str(value), "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        raise RuleCompileError(f"Condition {position}: '{value}' is not a date (YYYY-MM-DD)")
+
+def _as_number(actual):
+    try:
+        return float(actual or 0)
+    except (ValueError, TypeError):
+        return 0
+
+def _as_date(actual):
+    if actual is None or actual == "":
+        return None
+    if isinstance(actual, datetime.datetime):
+        return actual.date()
+    if isinstance(actual, datetime.date):
+        return actual
+    try:
+        return datetime.datetime.strptime(str(actual)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+# --- Field resolution ---
+
+def _getter(field):
+    if field == 'risk_level':
+        return lambda offender, episode: episode.risk_level_at_start if episode else None
+
+    def get(offender, episode):
+        if hasattr(offender, field):
+            return getattr(offender, field)
+        if episode is not None and hasattr(episode, field):
+            return getattr(episode, field)
+        return None
+    return get
+
+def _column(field):
+    if field == 'risk_level':
+        return models.SupervisionEpisode.risk_level_at_start
+    if field in models.Offender.__table__.c:
+        return getattr(models.Offender, field)
+    if hasattr(models.Offender, field):
+        return None # relationship / property: Python only
+    if field in models.SupervisionEpisode.__table__.c:
+        return getattr(models.SupervisionEpisode, field)
+    return None
+
+# --- Operator compilation ---
+
+def _compile_text(operator, value, get):
+    target = str(value if value is not None else "").lower()
+
+    def text_of(offender, episode):
+        actual = get(offender, episode)
+        return str(actual).lower() if actual is not None else ""
+
+    if operator == 'equals':
+        return lambda o, e: text_of(o, e) == target
+    if operator == 'not_equals':
+        return lambda o, e: text_of(o, e) != target
+    if operator == 'contains':
+        return lambda o, e: target in text_of(o, e)
+    if operator == 'starts_with':
+        return lambda o, e: text_of(o, e).startswith(target)
+    if operator == 'is_empty':
+        return lambda o, e: text_of(o, e).strip(' ') == ''
+    return lambda o, e: text_of(o, e).strip(' ') != ''
+
+def _compile_text_sql(operator, value, col):
+    if not isinstance(col.type, (String, Text)):
+        return None
+    target = str(value if value is not None else "").lower()
+    lowered = func.lower(col)
+    is_blank = or_(col.is_(None), func.trim(col) == '')
+
+    if operator == 'equals':
+        return or_(col.is_(None), lowered == '') if target == '' else lowered == target
+    if operator == 'not_equals':
+        return and_(col.isnot(None), lowered != '') if target == '' else or_(col.is_(None), lowered != target)
+    if operator in ('contains', 'starts_with'):
+        if target == '':
+            return true()
+        if operator == 'contains':
+            return lowered.contains(target, autoescape=True)
+        return lowered.startswith(target, autoescape=True)
+    if operator == 'is_empty':
+        return is_blank
+    return ~is_blank
+
+def _compile_numeric(operator, value, get, position):
+    if operator == 'is_between':
+        low, high = _parse_range(value, position)
+        return (lambda o, e: low <= _as_number(get(o, e)) <= high), (low, high)
+    number = _parse_number(value, position)
+    if operator == 'num_equals':
+        return (lambda o, e: _as_number(get(o, e)) == number), number
+    if operator == 'greater_than':
+        return (lambda o, e: _as_number(get(o, e)) > number), number
+    return (lambda o, e: _as_number(get(o, e)) < number), number
+
+def _compile_numeric_sql(operator, parsed, col):
+    if not isinstance(col.type, (Integer, Float, Numeric)):
+        return None
+    actual = func.coalesce(col, 0)
+    if operator == 'is_between':
+        return actual.between(*parsed)
+    if operator == 'num_equals':
+        return actual == parsed
+    if operator == 'greater_than':
+        return actual > parsed
+    return actual < parsed
+
+def _compile_date(operator, value, get, position):
+    target = _parse_date(value, position)
+
+    def compare(offender, episode):
+        actual = _as_date(get(offender, episode))
+        if actual is None:
+            return False
+        if operator == 'date_equals':
+            return actual == target
+        if operator == 'is_before':
+            return actual < target
+        return actual > target
+    return compare, target
+
+def _compile_date_sql(operator, target, col):
+    if not isinstance(col.type, Date):
+        return None
+    if operator == 'date_equals':
+        return col == target
+    if operator == 'is_before':
+        return col < target
+    return col > target
+
+def compile_conditions(conditions, version=None) -> CompiledRule:
+    """
+    Compiles a conditions list. Raises RuleCompileError on the first invalid condition.
+    """
+    if conditions is None:
+        conditions = []
+    if not isinstance(conditions, list):
+        raise RuleCompileError("Conditions must be a list")
+
+    predicates = []
+    clauses = []
+    for position, condition in enumerate(conditions, start=1):
+        if not isinstance(condition, dict):
+            raise RuleCompileError(f"Condition {position}: expected an object with field, operator and value")
+        field = condition.get('field')
+        operator = condition.get('operator')
+        value = condition.get('value')
+        if not field or not isinstance(field, str):
+            raise RuleCompileError(f"Condition {position}: field is required")
+        if operator not in OPERATORS:
+            raise RuleCompileError(f"Condition {position}: unknown operator '{operator}'")
+
+        get = _getter(field)
+        col = _column(field)
+        if operator in TEXT_OPERATORS:
+            predicates.append(_compile_text(operator, value, get))
+            clause = _compile_text_sql(operator, value, col) if col is not None else None
+        elif operator in NUMERIC_OPERATORS:
+            predicate, parsed = _compile_numeric(operator, value, get, position)
+            predicates.append(predicate)
+            clause = _compile_numeric_sql(operator, parsed, col) if col is not None else None
+        else:
+            predicate, parsed = _compile_date(operator, value, get, position)
+            predicates.append(predicate)
+            clause = _compile_date_sql(operator, parsed, col) if col is not None else None
+        clauses.append(clause)
+
+    def matches(offender, episode=None):
+        return all(predicate(offender, episode) for predicate in predicates)
+
+    if any(clause is None for clause in clauses):
+        sql_filter = None
+    else:
+        sql_filter = and_(true(), *clauses)
+    return CompiledRule(version, matches, sql_filter)
+
+def rule_version(rule) -> str:
+    """
+    Change version of a rule's conditions: edits to the JSON produce a new version.
+    """
+    payload = json.dumps(rule.conditions or [], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def validate_conditions(conditions):
+    """
+    Save-time check used by the automations router (create, update, draft
+    dry-run). Raises RuleCompileError.
+    """
+    compile_conditions(conditions)
+
+# --- Cache ---
+
+_cache = {}   # rule_id -> CompiledRule
+_lock = threading.Lock()
+
+def get_compiled(rule) -> CompiledRule:
+    """
+    Returns the compiled form of `rule`, compiling on first use or after the
+    rule's conditions changed. Raises RuleCompileError for invalid rules.
+    """
+    version = rule_version(rule)
+    key = rule.rule_id
+    with _lock:
+        compiled = _cache.get(key)
+    if compiled is not None and compiled.version == version:
+        return compiled
+
+    compiled = compile_conditions(rule.conditions, version)
+    if key is not None:
+        with _lock:
+            _cache[key] = compiled
+    return compiled
+
+def invalidate(rule_id=None):
+    """
+    Drops one rule (or every rule) from the compiled cache.
+    """
+    with _lock:
+        if rule_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(rule_id, None)
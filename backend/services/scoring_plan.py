@@ -0,0 +1,250 @@
+import copy
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_right
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .. import models
+from .question_catalog import question_catalog, _parse_options
+
+logger = logging.getLogger(__name__)
+
+# Compiled scoring plans for calculate_score, one per RiskAssessmentType.
+# - Every question in the bank becomes a scorer: an {option label/value -> score}
+#   hash map, or an integer/boolean handler, plus its category.
+# - The type's scoring_matrix becomes sorted interval bounds searched with bisect;
+#   overlapping bands keep the original first-match-wins order.
+# - Plans are rebuilt when the question catalog version changes or a type is
+#   edited (explicit bump() or the after_commit listener below).
+# - Like the catalog, plans are kept per database (the session's bind).
+
+FALLBACK_LEVELS = ((15, "High"), (8, "Medium")) # used when the type has no matrix
+
+class QuestionScorer:
+    __slots__ = ("tag", "category", "score")
+
+    def __init__(self, question):
+        self.tag = question.universal_tag
+        self.category = question.category or "General"
+        options = _parse_options(question.options)
+
+        if options and isinstance(options, list):
+            lookup = {}
+            for opt in options:
+                if not isinstance(opt, dict):
+                    continue
+                if "score" in opt:
+                    points = _option_points(self.tag, opt)
+                elif isinstance(opt.get("value"), int):
+                    points = int(opt["value"])
+                else:
+                    points = 0
+                # First matching option wins, as with the old linear scan
+                for key in (opt.get("label"), opt.get("value")):
+                    try:
+                        lookup.setdefault(key, points)
+                    except TypeError: # unhashable option value
+                        pass
+            self.score = _option_handler(lookup)
+        elif question.input_type == 'integer':
+            self.score = _integer_handler
+        elif question.input_type == 'boolean':
+            self.score = _boolean_handler
+        else:
+            self.score = _zero_handler
+
+def _option_points(tag, opt) -> int:
+    # One bad score must not break scoring for the whole catalog
+    try:
+        return int(opt["score"])
+    except (TypeError, ValueError):
+        logger.warning(f"Question {tag}: option {opt.get('label')!r} has invalid score {opt['score']!r}; scoring it 0")
+        return 0
+
+def _option_handler(lookup):
+    def score(value):
+        try:
+            return lookup.get(value, 0)
+        except TypeError: # unhashable answer (list/dict) matches no option
+            return 0
+    return score
+
+def _integer_handler(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+def _boolean_handler(value):
+    return 1 if str(value).lower() in ('true', '1', 'yes') else 0
+
+def _zero_handler(value):
+    return 0
+
+def _bound(value, default):
+    if value is None:
+        return default
+    return float(value)
+
+def compile_bands(matrix):
+    """
+    Turns [{"label", "min", "max"}, ...] into (starts, labels) such that the level
+    for an integer score is labels[bisect_right(starts, score) - 1].
+    A score covered by several bands gets the first one listed, like the old loop.
+    """
+    ranges = []
+    for rule in matrix or []:
+        if not isinstance(rule, dict):
+            continue
+        try:
+            # Scores are integers: [min, max] covers ceil(min) .. floor(max)
+            low = math.ceil(_bound(rule.get("min"), -999))
+            high = math.floor(_bound(rule.get("max"), 999))
+        except (TypeError, ValueError):
+            continue
+        if low <= high:
+            ranges.append((low, high, rule.get("label", "Unknown")))
+
+    points = sorted({low for low, _, _ in ranges} | {high + 1 for _, high, _ in ranges})
+    starts, labels = [], []
+    for point in points:
+        label = next((lbl for low, high, lbl in ranges if low <= point <= high), None)
+        if labels and labels[-1] == label:
+            continue # merge neighbouring segments with the same level
+        starts.append(point)
+        labels.append(label)
+    return starts, labels
+
+class ScoringPlan:
+    def __init__(self, assessment_type, scorers, matrix):
+        self.assessment_type = assessment_type
+        self.scorers = scorers # shared {tag: QuestionScorer} for the catalog snapshot
+        self.has_matrix = bool(matrix)
+        self.starts, self.labels = compile_bands(matrix)
+
+    def risk_level(self, total_score) -> str:
+        if not self.has_matrix:
+            for threshold, level in FALLBACK_LEVELS:
+                if total_score >= threshold:
+                    return level
+            return "Low"
+        index = bisect_right(self.starts, total_score) - 1
+        if index < 0:
+            return "Unknown"
+        return self.labels[index] or "Unknown"
+
+    def with_scorers(self, extra) -> "ScoringPlan":
+        """
+        Copy of the plan that also scores the questions in `extra` ({tag: QuestionScorer}).
+        """
+        plan = copy.copy(self)
+        plan.scorers = {**self.scorers, **extra}
+        return plan
+
+    def score(self, answers) -> dict:
+        """
+        answers: iterable of (question_tag, value). Tags not in the bank are skipped.
+        """
+        total_score = 0
+        details = {}
+        category_scores = {}
+        for tag, value in answers:
+            scorer = self.scorers.get(tag)
+            if scorer is None:
+                continue
+            points = scorer.score(value)
+            total_score += points
+            details[tag] = points
+            category_scores[scorer.category] = category_scores.get(scorer.category, 0) + points
+
+        return {
+            "total_score": total_score,
+            "risk_level": self.risk_level(total_score),
+            "details": details,
+            "category_scores": category_scores
+        }
+
+def compile_scorers(questions) -> dict:
+    return {q.universal_tag: QuestionScorer(q) for q in questions}
+
+def compile_plan(questions, assessment_type) -> ScoringPlan:
+    """
+    Builds a plan from question rows (or catalog entries) and a RiskAssessmentType (or None).
+    """
+    return ScoringPlan(
+        assessment_type.name if assessment_type is not None else None,
+        compile_scorers(questions),
+        assessment_type.scoring_matrix if assessment_type is not None else None
+    )
+
+class ScoringPlanCache:
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._types_version = 0
+        self._scorers = (None, {}) # (catalog snapshot, scorers)
+        self._plans = weakref.WeakKeyDictionary() # bind -> {type name: (snapshot, types version, loaded_at, plan)}
+        self.builds = 0
+
+    def bump(self):
+        """
+        Marks every plan stale (assessment type added, edited or deleted).
+        """
+        with self._lock:
+            self._types_version += 1
+            self._plans = weakref.WeakKeyDictionary()
+
+    def _scorers_for(self, snapshot):
+        compiled_for, scorers = self._scorers
+        if compiled_for is not snapshot:
+            scorers = compile_scorers(snapshot.questions)
+            self._scorers = (snapshot, scorers)
+        return scorers
+
+    def get(self, db: Session, assessment_type: str) -> ScoringPlan:
+        bind = db.get_bind()
+        snapshot = question_catalog.get(db)
+        types_version = self._types_version
+        plans = self._plans
+        cached = plans.get(bind, {}).get(assessment_type)
+        if (cached is not None and cached[0] is snapshot and cached[1] == types_version
+                and time.monotonic() - cached[2] < self.ttl_seconds):
+            return cached[3]
+
+        type_obj = db.query(models.RiskAssessmentType).filter(models.RiskAssessmentType.name == assessment_type).first()
+        plan = ScoringPlan(
+            assessment_type,
+            self._scorers_for(snapshot),
+            type_obj.scoring_matrix if type_obj is not None else None
+        )
+        with self._lock:
+            self.builds += 1
+            if self._types_version == types_version:
+                plans.setdefault(bind, {})[assessment_type] = (snapshot, types_version, time.monotonic(), plan)
+        return plan
+
+scoring_plans = ScoringPlanCache(ttl_seconds=float(os.getenv("QUESTION_CATALOG_TTL", "300")))
+
+# --- Invalidation on any committed write to the assessment types ---
+
+_PENDING_KEY = "scoring_plans_dirty"
+
+@event.listens_for(Session, "after_flush")
+def _note_type_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.RiskAssessmentType):
+            session.info[_PENDING_KEY] = True
+            return
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        scoring_plans.bump()
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
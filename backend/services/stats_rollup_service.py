@@ -0,0 +1,150 @@
+import logging
+from sqlalchemy import insert, delete, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import Session
+from datetime import datetime, date, timedelta
+from uuid import UUID
+from .. import models
+from . import dashboard_service
+
+logger = logging.getLogger(__name__)
+
+# Nightly snapshot of the dashboard metrics into dashboard_stats_rollups,
+# one row per (snapshot_date, scope): system-wide, per location, per officer.
+# /dashboard/trends reads history from this table instead of rescanning
+# case_notes and supervision_episodes.
+# The counts come from live data, so a rollup can only be taken for today:
+# there is no history to rebuild a past date from.
+
+SCOPE_TYPES = ("system", "location", "officer")
+
+def _rollup_row(snapshot_date, scope_type, scope_id, counts, created_at):
+    employment_rate, compliance_rate = dashboard_service.derive_rates(counts)
+    return {
+        "snapshot_date": snapshot_date,
+        "scope_type": scope_type,
+        "scope_id": scope_id,
+        "compliance_rate": compliance_rate,
+        "employment_rate": employment_rate,
+        "created_at": created_at,
+        **{key: counts[key] for key in dashboard_service.COUNT_KEYS}
+    }
+
+def _upsert(db: Session, rows):
+    """
+    Writes rollup rows, replacing any already stored for the same
+    (snapshot_date, scope). Not committed.
+    """
+    rollup = models.DashboardStatsRollup
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        for row in rows:
+            stmt = dialect_insert(rollup).values(row)
+            replace = {key: stmt.excluded[key] for key in row if key not in ("snapshot_date", "scope_type", "scope_id")}
+            if row["scope_id"] is None:
+                # NULLs never conflict in the unique constraint; the system row
+                # has its own partial unique index
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['snapshot_date', 'scope_type'],
+                    index_where=rollup.scope_id.is_(None), set_=replace
+                )
+            else:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['snapshot_date', 'scope_type', 'scope_id'], set_=replace
+                )
+            db.execute(stmt)
+        return
+
+    db.execute(
+        delete(rollup).where(rollup.snapshot_date.in_({row["snapshot_date"] for row in rows})),
+        execution_options={"synchronize_session": False}
+    )
+    db.execute(insert(rollup), rows)
+
+def run_daily_stats_rollup(db: Session, snapshot_date: date = None, today: date = None) -> int:
+    """
+    Snapshots the current dashboard metrics for every scope.
+    Re-running for the same date replaces that date's rows.
+    Raises ValueError for any date but today (UTC).
+    Returns the number of rollup rows written.
+    """
+    today = today or datetime.utcnow().date()
+    snapshot_date = snapshot_date or today
+    if snapshot_date != today:
+        raise ValueError(f"Rollups are computed from live data; cannot snapshot {snapshot_date} on {today}")
+
+    now = datetime.utcnow()
+    rows = [_rollup_row(snapshot_date, "system", None, dashboard_service.compute_dashboard_counts(db), now)]
+    for scope_type in ("location", "officer"):
+        grouped = dashboard_service.compute_grouped_counts(db, scope_type)
+        rows.extend(_rollup_row(snapshot_date, scope_type, scope_id, counts, now) for scope_id, counts in grouped.items())
+
+    rollup = models.DashboardStatsRollup
+    _upsert(db, rows)
+    # Scopes that no longer have a caseload drop out of the day's snapshot
+    db.execute(
+        delete(rollup).where(
+            rollup.snapshot_date == snapshot_date,
+            rollup.scope_id.isnot(None),
+            tuple_(rollup.scope_type, rollup.scope_id).notin_(
+                [(row["scope_type"], row["scope_id"]) for row in rows if row["scope_id"] is not None]
+            )
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+    logger.info(f"Stats rollup for {snapshot_date}: {len(rows)} rows")
+    return len(rows)
+
+def get_trends(db: Session, scope_type: str = "system", scope_id=None, start: date = None, end: date = None, interval: str = "day"):
+    """
+    Returns rollup points for one scope between start and end (inclusive).
+    interval='month' keeps the last snapshot of each month; 'week' the last of each ISO week.
+    """
+    if scope_type not in SCOPE_TYPES:
+        raise ValueError(f"scope must be one of {', '.join(SCOPE_TYPES)}")
+    if interval not in ("day", "week", "month"):
+        raise ValueError("interval must be day, week or month")
+    if scope_type != "system" and not scope_id:
+        raise ValueError(f"scope_id is required for scope '{scope_type}'")
+
+    end = end or datetime.utcnow().date()
+    start = start or (end - timedelta(days=365))
+
+    query = db.query(models.DashboardStatsRollup).filter(
+        models.DashboardStatsRollup.scope_type == scope_type,
+        models.DashboardStatsRollup.snapshot_date >= start,
+        models.DashboardStatsRollup.snapshot_date <= end
+    )
+    if scope_type == "system":
+        query = query.filter(models.DashboardStatsRollup.scope_id.is_(None))
+    else:
+        try:
+            query = query.filter(models.DashboardStatsRollup.scope_id == UUID(str(scope_id)))
+        except ValueError:
+            raise ValueError("Invalid scope_id")
+
+    rollups = query.order_by(models.DashboardStatsRollup.snapshot_date.asc()).all()
+
+    if interval != "day":
+        # Keep the last snapshot in each period (rows are date-ordered)
+        periods = {}
+        for r in rollups:
+            key = (r.snapshot_date.year, r.snapshot_date.month) if interval == "month" else r.snapshot_date.isocalendar()[:2]
+            periods[key] = r
+        rollups = list(periods.values())
+
+    return [
+        {
+            "date": r.snapshot_date.isoformat(),
+            "total_caseload": r.total_caseload,
+            "compliance_rate": r.compliance_rate,
+            "employment_rate": r.employment_rate,
+            "warrants_issued": r.warrants_issued,
+            "pending_reviews": r.pending_reviews,
+            "risk_distribution": {"Low": r.risk_low, "Medium": r.risk_medium, "High": r.risk_high}
+        } for r in rollups
+    ]
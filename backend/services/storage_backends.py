@@ -0,0 +1,135 @@
+import os
+import threading
+
+# Pluggable blob storage for uploaded documents. Keys are relative paths
+# ("ab/cd/<sha256>"); backends only store and fetch bytes, reference counting
+# lives in services/document_store.py.
+# - "local" (default): files under DOCUMENT_STORAGE_ROOT (backend/media).
+# - "s3": any S3-compatible service (AWS, MinIO, ...) through boto3, configured
+#   with S3_BUCKET, S3_PREFIX and S3_ENDPOINT_URL (+ the usual AWS_* credentials).
+# Pick with DOCUMENT_STORAGE.
+
+CHUNK_SIZE = 1024 * 1024
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str = "backend/media"):
+        self.root = root
+        self.tmp_dir = os.path.join(root, ".tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key: str, local_path: str):
+        """
+        Moves a finished temp file into place (atomic on the same filesystem).
+        """
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(local_path, target)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def open(self, key: str):
+        return open(self.path(key), "rb")
+
+    def open_range(self, key: str, start: int, length: int):
+        """
+        File object positioned at `start`; the caller reads at most `length` bytes.
+        """
+        f = open(self.path(key), "rb")
+        f.seek(start)
+        return f
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+class S3Storage:
+    """
+    S3-compatible backend. `client` is a boto3 S3 client (or anything with the
+    same put_object / head_object / get_object / delete_object calls).
+    """
+    name = "s3"
+
+    def __init__(self, bucket: str, client, prefix: str = "", tmp_dir: str = None):
+        self.bucket = bucket
+        self.client = client
+        self.prefix = prefix.strip("/")
+        self.tmp_dir = tmp_dir or os.path.join("backend", "media", ".tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_file(self, key: str, local_path: str):
+        with open(local_path, "rb") as body:
+            self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=body)
+        os.remove(local_path)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+
+    def size(self, key: str) -> int:
+        return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))["ContentLength"]
+
+    def open(self, key: str):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+
+    def open_range(self, key: str, start: int, length: int):
+        byte_range = f"bytes={start}-{start + length - 1}"
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key), Range=byte_range)["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    @classmethod
+    def from_env(cls):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("DOCUMENT_STORAGE=s3 requires boto3 (pip install boto3)")
+        client = boto3.client("s3", endpoint_url=os.getenv("S3_ENDPOINT_URL") or None)
+        return cls(os.environ["S3_BUCKET"], client, prefix=os.getenv("S3_PREFIX", ""))
+
+def _is_not_found(error) -> bool:
+    # botocore ClientError carries the HTTP status in error.response
+    response = getattr(error, "response", None) or {}
+    code = str(response.get("Error", {}).get("Code", ""))
+    return code in ("404", "NoSuchKey", "NotFound") or isinstance(error, (FileNotFoundError, KeyError))
+
+_storage = None
+_lock = threading.Lock()
+
+def get_storage():
+    global _storage
+    with _lock:
+        if _storage is None:
+            backend = os.getenv("DOCUMENT_STORAGE", "local").lower()
+            if backend == "s3":
+                _storage = S3Storage.from_env()
+            else:
+                _storage = LocalStorage(os.getenv("DOCUMENT_STORAGE_ROOT", "backend/media"))
+        return _storage
+
+def set_storage(storage):
+    """
+    Replaces the active backend. Used by tests and scripts.
+    """
+    global _storage
+    with _lock:
+        _storage = storage
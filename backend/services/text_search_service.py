@@ -0,0 +1,292 @@
+import html
+import logging
+from typing import Optional
+from sqlalchemy import event, func, select, table, column, literal_column, text, and_, or_, true, false
+from sqlalchemy.orm import Session
+from .. import models
+from . import pagination
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over case notes and document text extracts.
+# - SQLite: FTS5 tables `case_note_search` (external content: case_notes) and
+#   `document_text_search` (external content: document_texts), keyed on the
+#   base table's rowid and kept in sync by AFTER INSERT/UPDATE/DELETE triggers.
+#   NOTE: VACUUM can renumber rowids; run rebuild_search_index() afterwards.
+# - Postgres: GIN indexes on to_tsvector('english', content); Postgres keeps them current.
+# Other dialects fall back to an un-indexed LIKE scan.
+# document_texts is filled by the preview pipeline (services/document_previews.py).
+# Results are ranked (score desc), highlighted with <mark> (the rest of the
+# snippet is HTML-escaped) and paged with a keyset cursor on (score, kind, id).
+
+KINDS = ("document", "note") # tie-break order
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+def _fts_ddl(fts: str, base: str) -> list:
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            content, content='{base}', content_rowid='rowid'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {base}_search_ai AFTER INSERT ON {base} BEGIN
+            INSERT INTO {fts}(rowid, content) VALUES (new.rowid, new.content);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {base}_search_ad AFTER DELETE ON {base} BEGIN
+            INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.rowid, old.content);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {base}_search_au AFTER UPDATE OF content ON {base} BEGIN
+            INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.rowid, old.content);
+            INSERT INTO {fts}(rowid, content) VALUES (new.rowid, new.content);
+        END
+        """,
+    ]
+
+# base table -> FTS table
+SQLITE_INDEXES = {"case_notes": "case_note_search", "document_texts": "document_text_search"}
+
+POSTGRES_DDL = {
+    "case_notes": "CREATE INDEX IF NOT EXISTS ix_case_notes_content_fts ON case_notes USING gin (to_tsvector('english'::regconfig, content))",
+    "document_texts": "CREATE INDEX IF NOT EXISTS ix_document_texts_content_fts ON document_texts USING gin (to_tsvector('english'::regconfig, content))",
+}
+
+def _ensure_table_index(connection, base: str):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        fts = SQLITE_INDEXES[base]
+        existed = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+        ).first()
+        for stmt in _fts_ddl(fts, base):
+            connection.execute(text(stmt))
+        if not existed:
+            connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        try:
+            connection.execute(text(POSTGRES_DDL[base]))
+        except Exception as e:
+            logger.error(f"Could not create full-text index on {base}: {e}")
+            raise
+
+def ensure_search_index(connection):
+    """
+    Idempotently creates the note / document text indexes for the connected
+    dialect. On SQLite each FTS table is back-filled the first time it is created.
+    """
+    for base in SQLITE_INDEXES:
+        _ensure_table_index(connection, base)
+
+def rebuild_search_index(connection):
+    """
+    Rebuilds the SQLite FTS indexes from their tables (e.g. after VACUUM).
+    """
+    if connection.dialect.name == 'sqlite':
+        for fts in SQLITE_INDEXES.values():
+            connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+for _model in (models.CaseNote, models.DocumentText):
+    @event.listens_for(_model.__table__, "after_create")
+    def _create_search_index(target, connection, **kw):
+        _ensure_table_index(connection, target.name)
+
+    @event.listens_for(_model.__table__, "before_drop")
+    def _drop_search_index(target, connection, **kw):
+        if connection.dialect.name == 'sqlite':
+            connection.execute(text(f"DROP TABLE IF EXISTS {SQLITE_INDEXES[target.name]}"))
+
+# --- Query helpers ---
+
+def _fts_query(term: str) -> str:
+    """
+    User input -> FTS5 query: every word a quoted prefix phrase, all required.
+    """
+    words = [w.replace('"', '') for w in term.split()]
+    return " ".join(f'"{w}"*' for w in words if w)
+
+def highlight(snippet: str) -> str:
+    escaped = html.escape(snippet or "", quote=False)
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+def _like_snippet(content: str, words, width: int = 160) -> str:
+    lowered = content.lower()
+    first = min((lowered.find(w) for w in words if w in lowered), default=0)
+    start = max(first - width // 4, 0)
+    piece = content[start:start + width]
+    for w in words:
+        index, parts = 0, []
+        lower_piece = piece.lower()
+        while (found := lower_piece.find(w, index)) >= 0:
+            parts.append(piece[index:found] + _MARK_START + piece[found:found + len(w)] + _MARK_END)
+            index = found + len(w)
+        piece = "".join(parts) + piece[index:]
+    return ("…" if start else "") + piece + ("…" if start + width < len(content) else "")
+
+class _Source:
+    def __init__(self, kind, model, id_col, date_col, title_col, content_model):
+        self.kind = kind
+        self.model = model
+        self.id_col = id_col
+        self.date_col = date_col
+        self.title_col = title_col
+        self.content_model = content_model # table holding `content`
+
+    def from_clause(self):
+        if self.content_model is self.model:
+            return self.model.__table__
+        return self.model.__table__.join(
+            self.content_model.__table__, self.content_model.sha256 == self.model.sha256
+        )
+
+SOURCES = {
+    "note": _Source("note", models.CaseNote, models.CaseNote.note_id, models.CaseNote.date,
+                    models.CaseNote.type, models.CaseNote),
+    "document": _Source("document", models.Document, models.Document.document_id, models.Document.uploaded_at,
+                        models.Document.file_name, models.DocumentText),
+}
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+def _matches(db: Session, source: _Source, term: str, scope):
+    """
+    Select of (id, offender_id, date, title, score, snippet) for one source,
+    higher score = better match.
+    """
+    dialect = _dialect(db)
+    content = source.content_model.content
+    base = source.content_model.__tablename__
+    columns = [
+        source.id_col.label("id"),
+        source.model.offender_id.label("offender_id"),
+        source.date_col.label("date"),
+        source.title_col.label("title"),
+    ]
+
+    if dialect == 'sqlite':
+        fts = SQLITE_INDEXES[base]
+        fts_table = table(fts, column("rowid"))
+        return (
+            select(*columns,
+                   literal_column(f"-bm25({fts})").label("score"),
+                   literal_column(f"snippet({fts}, 0, char(2), char(3), '…', 16)").label("snippet"))
+            .select_from(source.from_clause().join(fts_table, fts_table.c.rowid == literal_column(f"{base}.rowid")))
+            .where(literal_column(fts).op("MATCH")(_fts_query(term)))
+            .where(scope(source))
+        )
+
+    if dialect == 'postgresql':
+        config = literal_column("'english'::regconfig")
+        query = func.websearch_to_tsquery(config, term)
+        vector = func.to_tsvector(config, content)
+        options = f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxFragments=2, MaxWords=24, MinWords=8"
+        return (
+            select(*columns,
+                   func.ts_rank_cd(vector, query).label("score"),
+                   func.ts_headline(config, content, query, options).label("snippet"))
+            .select_from(source.from_clause())
+            .where(vector.op("@@")(query))
+            .where(scope(source))
+        )
+
+    words = term.lower().split()
+    return (
+        select(*columns, literal_column("0.0").label("score"), content.label("snippet"))
+        .select_from(source.from_clause())
+        .where(and_(*[func.lower(content).contains(w, autoescape=True) for w in words]))
+        .where(scope(source))
+    )
+
+def _scope(offender_id=None, officer_id=None, viewer=None):
+    """
+    source -> WHERE clause for the requested filter, limited to what `viewer`
+    (document_delivery.Viewer, None = unrestricted) may see.
+    """
+    def clause(source: _Source):
+        col = source.model.offender_id
+        conditions = []
+        if offender_id is not None:
+            conditions.append(col == offender_id)
+        if officer_id is not None:
+            conditions.append(col.in_(select(models.SupervisionEpisode.offender_id).where(
+                models.SupervisionEpisode.assigned_officer_id == officer_id,
+                models.SupervisionEpisode.status == 'Active'
+            )))
+        if viewer is not None:
+            allowed = col.in_(viewer.offenders())
+            if source.kind == "document" and viewer.officer_id is not None:
+                allowed = or_(allowed, models.Document.uploaded_by_id == viewer.officer_id)
+            conditions.append(allowed)
+        return and_(true(), *conditions)
+    return clause
+
+def _after(sub, kind: str, cursor):
+    """
+    Keyset predicate for ORDER BY score DESC, kind, id (kind is constant per source).
+    """
+    if cursor is None:
+        return true()
+    score, cursor_kind, cursor_id = cursor
+    if kind > cursor_kind:
+        tie = true()
+    elif kind == cursor_kind:
+        tie = sub.c.id > cursor_id
+    else:
+        tie = false()
+    return or_(sub.c.score < score, and_(sub.c.score == score, tie))
+
+def search(db: Session, term: str, offender_id=None, officer_id=None, kinds=KINDS,
+           limit: int = 20, cursor: Optional[str] = None, viewer=None):
+    """
+    Ranked search across case notes and document text, for one offender,
+    an officer's active caseload, or everything `viewer` may see
+    (document_delivery.viewer_for; None = unrestricted).
+    Returns (hits, next_cursor). Raises ValueError on a malformed cursor.
+    """
+    term = (term or "").strip()
+    if not term or (_dialect(db) == 'sqlite' and not _fts_query(term)):
+        return [], None
+
+    position = None
+    if cursor:
+        score, kind, item_id = pagination.decode_cursor(cursor, 3)
+        try:
+            position = (float(score), kind, pagination.parse_uuid(item_id))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+    scope = _scope(offender_id, officer_id, viewer)
+    words = term.lower().split()
+    hits = []
+    for kind in sorted(k for k in kinds if k in SOURCES):
+        sub = _matches(db, SOURCES[kind], term, scope).subquery()
+        rows = db.execute(
+            select(sub).where(_after(sub, kind, position))
+            .order_by(sub.c.score.desc(), sub.c.id.asc())
+            .limit(limit + 1)
+        ).all()
+        for row in rows:
+            snippet = row.snippet
+            if _MARK_START not in (snippet or ""):
+                snippet = _like_snippet(snippet or "", words)
+            hits.append({
+                "kind": kind,
+                "id": row.id,
+                "offender_id": row.offender_id,
+                "date": row.date,
+                "title": row.title,
+                "score": float(row.score or 0),
+                "snippet": highlight(snippet),
+            })
+
+    hits.sort(key=lambda h: (-h["score"], h["kind"], h["id"].hex))
+    page = hits[:limit]
+    next_cursor = None
+    if len(hits) > limit:
+        last = page[-1]
+        next_cursor = pagination.encode_cursor(repr(last["score"]), last["kind"], last["id"])
+    return page, next_cursor
@@ -18,6 +18,22 @@ celery_app.conf.beat_schedule = {
         "task": "backend.tasks.generate_daily_warrant_check",
         "schedule": crontab(hour=2, minute=0), # Run at 2:00 AM
     },
+    "generate-daily-stats-rollup": {
+        "task": "backend.tasks.generate_daily_stats_rollup",
+        "schedule": crontab(hour=1, minute=0), # Run at 1:00 AM
+    },
+    "cleanup-expired-uploads": {
+        "task": "backend.tasks.cleanup_expired_uploads",
+        "schedule": crontab(minute=15), # Hourly
+    },
+    "purge-released-blobs": {
+        "task": "backend.tasks.purge_released_blobs",
+        "schedule": crontab(minute=45), # Hourly
+    },
+    "sweep-document-previews": {
+        "task": "backend.tasks.sweep_document_previews",
+        "schedule": crontab(minute="*/10"),
+    },
 }
 celery_app.conf.timezone = 'UTC'
 
@@ -29,6 +45,79 @@ def generate_daily_warrant_check():
     print(f"[{datetime.utcnow()}] Running daily warrant check...")
     return "Warrant check completed"
 
+@celery_app.task
+def generate_daily_stats_rollup():
+    """
+    Snapshots dashboard metrics (system / location / officer) for trend charts.
+    """
+    from .database import SessionLocal
+    from .services import stats_rollup_service
+
+    db = SessionLocal()
+    try:
+        count = stats_rollup_service.run_daily_stats_rollup(db)
+    finally:
+        db.close()
+    return f"Stats rollup completed ({count} rows)"
+
+@celery_app.task
+def process_automation_events(events):
+    """
+    Celery transport for services/automation_events.py: evaluates a batch of
+    [event_name, offender_id] pairs.
+    """
+    from .database import SessionLocal
+    from .services import automation_service
+    db = SessionLocal()
+    try:
+        rule_index = automation_service.RuleIndex.load(db, {name for name, _ in events})
+        return automation_service.evaluate_events(db, [tuple(e) for e in events], rule_index)
+    finally:
+        db.close()
+
+@celery_app.task
+def rescore_assessments(assessment_type=None):
+    """
+    Bulk re-score of Completed assessments after a scoring change (see services/assessment_rescore.py).
+    """
+    from .database import SessionLocal
+    from .services import assessment_rescore
+    db = SessionLocal()
+    try:
+        report = assessment_rescore.rescore_assessments(db, assessment_type=assessment_type)
+    finally:
+        db.close()
+    report["changes"] = report["changes"][:10]
+    return report
+
+@celery_app.task
+def cleanup_expired_uploads():
+    """
+    Removes abandoned resumable upload sessions and their chunk files.
+    """
+    from .database import SessionLocal
+    from .services import resumable_uploads
+    db = SessionLocal()
+    try:
+        count = resumable_uploads.cleanup_expired(db)
+    finally:
+        db.close()
+    return f"Removed {count} expired upload sessions"
+
+@celery_app.task
+def purge_released_blobs():
+    """
+    Removes document blobs whose last reference was deleted but never purged.
+    """
+    from .database import SessionLocal
+    from .services import document_store
+    db = SessionLocal()
+    try:
+        count = document_store.purge_released_blobs(db)
+    finally:
+        db.close()
+    return f"Purged {count} document blobs"
+
 def assign_onboarding_tasks(episode_id: str, db: Session):
     """
     Assigns onboarding tasks to an offender based on their supervision episode.
@@ -64,3 +153,31 @@ def assign_onboarding_tasks(episode_id: str, db: Session):
     db.commit()
     db.refresh(task)
     return task
+
+@celery_app.task
+def generate_document_preview(sha256):
+    """
+    Thumbnail + text extract for one document blob (PREVIEW_TRANSPORT=celery).
+    """
+    from .database import SessionLocal
+    from .services import document_previews, storage_backends, preview_renderers
+    db = SessionLocal()
+    try:
+        return document_previews.generate(db, storage_backends.get_storage(), sha256, preview_renderers.run_job)
+    finally:
+        db.close()
+
+@celery_app.task
+def sweep_document_previews():
+    """
+    Re-queues previews left pending by a full queue or a restart, and waits for them.
+    """
+    from .database import SessionLocal
+    from .services import document_previews
+    db = SessionLocal()
+    try:
+        count = document_previews.sweep_pending(db)
+    finally:
+        db.close()
+    document_previews.get_pipeline().flush()
+    return f"Scheduled {count} document previews"
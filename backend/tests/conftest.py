@@ -13,6 +13,11 @@ from backend.main import app
 from backend.database import get_db
 from backend.models import Base
 from backend import models
+from backend.services.dashboard_cache import dashboard_cache
+from backend.services import automation_events, document_previews
+from backend.services.question_catalog import question_catalog
+from backend.services.scoring_plan import scoring_plans
+from backend.services.instrument_runtime import instrument_cache
 
 # Use in-memory SQLite for tests
 SQLALCHEMY_DATABASE_URL = "sqlite://"
@@ -25,6 +30,11 @@ engine = create_engine(
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Evaluate automation events inline, in the request's session
+automation_events.set_event_bus(automation_events.SyncEventBus(session_factory=TestingSessionLocal))
+# Render document previews inline as well
+document_previews.set_pipeline(document_previews.SyncPreviewPipeline(session_factory=TestingSessionLocal))
+
 @pytest.fixture(scope="function")
 def db_session():
     """
@@ -37,6 +47,9 @@ def db_session():
     finally:
         session.close()
         Base.metadata.drop_all(bind=engine)
+        question_catalog.bump()
+        scoring_plans.bump()
+        instrument_cache.invalidate()
 
 @pytest.fixture(scope="function")
 def client(db_session):
@@ -52,6 +65,7 @@ def client(db_session):
     app.dependency_overrides[get_db] = override_get_db
     yield TestClient(app)
     app.dependency_overrides.clear()
+    dashboard_cache.clear()
 
 from datetime import date
 
@@ -96,3 +110,47 @@ def test_offender(db_session):
     db_session.commit()
     db_session.refresh(offender)
     return offender
+
+from contextlib import contextmanager
+from sqlalchemy import event
+
+@pytest.fixture(scope="function")
+def query_counter():
+    """
+    Counts SQL statements executed against the test engine.
+    Usage: `with query_counter() as counter: ...` then read `counter["count"]`.
+    """
+    @contextmanager
+    def _count():
+        counter = {"count": 0}
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            counter["count"] += 1
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return _count
+
+@pytest.fixture(scope="function")
+def auth_client(client, db_session):
+    """
+    TestClient whose requests are authenticated as a seeded user
+    (overrides auth.get_current_user).
+    """
+    from backend import auth
+
+    role = models.Role(role_name="Admin")
+    db_session.add(role)
+    db_session.flush()
+    user = models.User(username="tester", email="tester@system.local", password_hash="x", role_id=role.role_id)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    db_session.expunge(user)  # detached: later commits in the test won't expire it
+
+    app.dependency_overrides[auth.get_current_user] = lambda: user
+    yield client
@@ -0,0 +1,403 @@
+from datetime import date, timedelta
+from backend import models
+from backend.automation import run_daily_automations, check_trigger
+
+TODAY = date(2025, 6, 15)
+
+def _seed(db_session):
+    officer = models.Officer(badge_number="O-1", first_name="Ann", last_name="Officer")
+    db_session.add(officer)
+    db_session.flush()
+
+    def offender(badge, release_date, risk="Low", officer_id=officer.officer_id):
+        o = models.Offender(first_name="F", last_name=badge, badge_id=badge, dob=date(1990, 1, 1), release_date=release_date)
+        db_session.add(o)
+        db_session.flush()
+        db_session.add(models.SupervisionEpisode(
+            offender_id=o.offender_id, start_date=date(2024, 1, 1), status="Active",
+            risk_level_at_start=risk, assigned_officer_id=officer_id
+        ))
+        return o
+
+    seeded = {
+        "due": offender("B-1", TODAY - timedelta(days=30)),             # target = today
+        "caught_up": offender("B-2", TODAY - timedelta(days=35)),       # target 5 days ago
+        "too_old": offender("B-3", TODAY - timedelta(days=40)),         # target 10 days ago
+        "future": offender("B-4", TODAY - timedelta(days=20)),          # target in 10 days
+        "high": offender("B-5", TODAY - timedelta(days=30), risk="High"),
+        "unassigned": offender("B-6", TODAY - timedelta(days=30), officer_id=None),
+        "no_date": offender("B-7", None),
+        "upcoming": offender("B-8", TODAY + timedelta(days=12)),
+    }
+    db_session.commit()
+    return officer, seeded
+
+def _rule(**kw):
+    values = dict(name="30 day check", trigger_field="release_date", trigger_offset=30,
+                  trigger_direction="after", task_title="30 Day Review", due_offset=7)
+    values.update(kw)
+    return models.AutomationRule(**values)
+
+def _tasks_by_badge(db_session, title):
+    rows = (
+        db_session.query(models.Offender.badge_id, models.Task)
+        .join(models.Task, models.Task.offender_id == models.Offender.offender_id)
+        .filter(models.Task.title == title)
+    )
+    return {badge: task for badge, task in rows}
+
+def test_run_daily_automations_creates_tasks_in_window(db_session):
+    officer, seeded = _seed(db_session)
+    db_session.add(_rule())
+    db_session.commit()
+
+    assert run_daily_automations(db_session, today=TODAY) == 3
+    tasks = _tasks_by_badge(db_session, "30 Day Review")
+    assert set(tasks) == {"B-1", "B-2", "B-5"}
+
+    task = tasks["B-1"]
+    assert task.due_date == TODAY + timedelta(days=7)
+    assert task.assigned_officer_id == officer.officer_id
+    assert task.status == "Pending"
+
+    # The SQL window agrees with the per-offender check
+    rule = db_session.query(models.AutomationRule).one()
+    for key, offender in seeded.items():
+        expected = key in ("due", "caught_up", "high", "unassigned")
+        assert check_trigger(rule, offender, TODAY) == expected
+
+    # Re-running the same day is idempotent, even after the task title is edited
+    rule.task_title = "30 Day Review (Revised)"
+    db_session.commit()
+    assert run_daily_automations(db_session, today=TODAY) == 0
+
+    # Every firing is recorded in the ledger
+    runs = db_session.query(models.AutomationRun).all()
+    assert len(runs) == 3
+    assert {r.task_id for r in runs} == {t.task_id for t in tasks.values()}
+    assert all(r.rule_name == "30 day check" and r.fired_on == TODAY for r in runs)
+
+def test_run_daily_automations_before_direction_and_conditions(db_session):
+    _seed(db_session)
+    db_session.add_all([
+        # Two weeks before release: B-8 is released in 12 days (target 2 days ago)
+        _rule(name="pre", trigger_offset=14, trigger_direction="before", task_title="Pre"),
+        _rule(name="high only", task_title="High Risk Review",
+              conditions=[{"field": "risk_level", "operator": "equals", "value": "high"}]),
+        _rule(name="inactive", task_title="Never", is_active=False),
+        _rule(name="event", trigger_field="positive_ua", task_title="Event"),
+    ])
+    db_session.commit()
+
+    run_daily_automations(db_session, today=TODAY)
+
+    assert set(_tasks_by_badge(db_session, "High Risk Review")) == {"B-5"}
+    pre = _tasks_by_badge(db_session, "Pre")
+    assert set(pre) == {"B-8"}
+    assert pre["B-8"].due_date == TODAY - timedelta(days=2) + timedelta(days=7)
+    assert _tasks_by_badge(db_session, "Never") == {}
+    assert _tasks_by_badge(db_session, "Event") == {}
+
+def test_rule_compiler_predicates_and_sql(db_session):
+    from backend.services import rule_compiler
+
+    _, seeded = _seed(db_session)
+    conditions = [
+        {"field": "risk_level", "operator": "equals", "value": "HIGH"},
+        {"field": "release_date", "operator": "is_before", "value": (TODAY - timedelta(days=25)).isoformat()},
+        {"field": "last_name", "operator": "starts_with", "value": "b-"},
+    ]
+    compiled = rule_compiler.compile_conditions(conditions)
+    assert compiled.sql_filter is not None
+
+    sql_matches = {
+        badge for (badge,) in db_session.query(models.Offender.badge_id)
+        .join(models.SupervisionEpisode, models.SupervisionEpisode.offender_id == models.Offender.offender_id)
+        .filter(compiled.sql_filter)
+    }
+    episodes = {e.offender_id: e for e in db_session.query(models.SupervisionEpisode)}
+    python_matches = {
+        offender.badge_id for offender in seeded.values()
+        if compiled.matches(offender, episodes[offender.offender_id])
+    }
+    assert sql_matches == python_matches == {"B-5"}
+
+    # Blank means spaces only, in SQL and in Python alike
+    seeded["due"].employment_status = "   "
+    seeded["caught_up"].employment_status = "\t"
+    db_session.commit()
+    blank = rule_compiler.compile_conditions([{"field": "employment_status", "operator": "is_empty", "value": ""}])
+    targets = {"B-1", "B-2"}
+    sql_blank = {
+        badge for (badge,) in db_session.query(models.Offender.badge_id)
+        .filter(models.Offender.badge_id.in_(targets), blank.sql_filter)
+    }
+    python_blank = {o.badge_id for o in seeded.values() if o.badge_id in targets and blank.matches(o)}
+    assert sql_blank == python_blank == {"B-1"}
+
+    # Python-only fields still compile, without a SQL form
+    assert rule_compiler.compile_conditions([{"field": "assigned_office", "operator": "equals", "value": "x"}]).sql_filter is None
+
+def test_rule_compiler_cache_follows_rule_version(db_session):
+    from backend.services import rule_compiler
+
+    rule = _rule(conditions=[{"field": "risk_level", "operator": "equals", "value": "High"}])
+    db_session.add(rule)
+    db_session.commit()
+
+    first = rule_compiler.get_compiled(rule)
+    assert rule_compiler.get_compiled(rule) is first
+
+    rule.conditions = [{"field": "risk_level", "operator": "equals", "value": "Low"}]
+    db_session.commit()
+    assert rule_compiler.get_compiled(rule) is not first
+
+def test_create_rule_rejects_invalid_conditions(client):
+    payload = {
+        "name": "Bad", "trigger_field": "release_date", "trigger_offset": 30,
+        "trigger_direction": "after", "task_title": "Review",
+        "conditions": [{"field": "risk_level", "operator": "roughly", "value": "High"}]
+    }
+    response = client.post("/automations/rules/", json=payload)
+    assert response.status_code == 422
+    assert "unknown operator 'roughly'" in response.json()["detail"]
+
+    payload["conditions"] = [{"field": "lsi_score", "operator": "is_between", "value": "ten to twenty"}]
+    assert client.post("/automations/rules/", json=payload).status_code == 422
+
+    payload["conditions"] = [{"field": "lsi_score", "operator": "is_between", "value": "10 and 20"}]
+    created = client.post("/automations/rules/", json=payload)
+    assert created.status_code == 200
+    rule_id = created.json()["rule_id"]
+
+    # Updates are validated the same way
+    payload["conditions"] = [{"field": "release_date", "operator": "is_before", "value": "soon"}]
+    assert client.put(f"/automations/rules/{rule_id}", json=payload).status_code == 422
+    payload["conditions"] = [{"field": "release_date", "operator": "is_before", "value": "2025-01-01"}]
+    updated = client.put(f"/automations/rules/{rule_id}", json=payload)
+    assert updated.status_code == 200
+    assert updated.json()["conditions"][0]["operator"] == "is_before"
+    assert client.put("/automations/rules/999999", json=payload).status_code == 404
+
+def test_parallel_automations_match_serial_run(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend.services import automation_runner, job_lock
+
+    url = f"sqlite:///{tmp_path / 'shards.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    db_session = sessionmaker(bind=engine)()
+    try:
+        officer = models.Officer(badge_number="O-1", first_name="Ann", last_name="Officer")
+        db_session.add(officer)
+        db_session.flush()
+        for i in range(40):
+            offender = models.Offender(first_name="F", last_name=f"L{i}", badge_id=f"B-{i}", dob=date(1990, 1, 1),
+                                       release_date=TODAY - timedelta(days=30))
+            db_session.add(offender)
+            db_session.flush()
+            db_session.add(models.SupervisionEpisode(offender_id=offender.offender_id, start_date=date(2024, 1, 1),
+                                                     status="Active", risk_level_at_start="Low",
+                                                     assigned_officer_id=officer.officer_id))
+        db_session.add(_rule())
+        db_session.commit()
+
+        report = automation_runner.run_parallel_automations(db_session, shard_count=4, today=TODAY, database_url=url)
+        assert report["failed"] == []
+        assert [s["shard"] for s in report["shards"]] == [0, 1, 2, 3]
+        assert report["tasks_created"] == 40
+        assert db_session.query(models.Task).count() == 40
+
+        # Shard sizes agree with the Python hash
+        for s in report["shards"]:
+            expected = sum(1 for o in db_session.query(models.Offender) if automation_runner.shard_of(o.offender_id, 4) == s["shard"])
+            assert s["tasks_created"] == expected
+
+        # Re-running one shard is idempotent and leaves the lock free
+        retry = automation_runner.run_parallel_automations(db_session, shard_count=4, only_shards=[2], today=TODAY, database_url=url)
+        assert [s["shard"] for s in retry["shards"]] == [2]
+        assert retry["tasks_created"] == 0
+        assert job_lock.holder(db_session, automation_runner.LOCK_NAME) is None
+
+        # Overlapping runs are refused
+        with job_lock.job_lock(db_session, automation_runner.LOCK_NAME):
+            try:
+                automation_runner.run_parallel_automations(db_session, shard_count=2, today=TODAY, database_url=url)
+                assert False, "expected LockNotAcquired"
+            except job_lock.LockNotAcquired:
+                pass
+    finally:
+        db_session.close()
+        engine.dispose()
+
+def test_job_lock_renewal(db_session):
+    from datetime import datetime
+    from backend.services import job_lock
+
+    owner = job_lock.acquire(db_session, "nightly", timedelta(seconds=-1)) # already expired
+    assert job_lock.renew(db_session, "nightly", owner, timedelta(hours=1))
+    assert job_lock.holder(db_session, "nightly").expires_at > datetime.utcnow()
+    assert job_lock.acquire(db_session, "nightly", timedelta(hours=1)) is None
+
+    # Once another run has taken over, the old owner can't renew
+    db_session.query(models.JobLock).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db_session.commit()
+    assert job_lock.acquire(db_session, "nightly", timedelta(hours=1)) is not None
+    assert not job_lock.renew(db_session, "nightly", owner, timedelta(hours=1))
+
+def test_incremental_run_uses_watermarks(db_session):
+    _, seeded = _seed(db_session)
+    rule = _rule()
+    db_session.add(rule)
+    db_session.commit()
+
+    # First run is a full backfill and records the watermark
+    assert run_daily_automations(db_session, today=TODAY, incremental=True) == 3
+    db_session.refresh(rule)
+    assert rule.last_evaluated_date == TODAY
+    assert rule.evaluated_version is not None
+
+    # Next day: only the newly opened window and changed offenders are candidates
+    tomorrow = TODAY + timedelta(days=1)
+    db_session.query(models.Task).delete()
+    db_session.commit()
+    newcomer = seeded["future"]
+    newcomer.release_date = tomorrow - timedelta(days=30)  # edited: now due tomorrow
+    db_session.commit()
+    assert run_daily_automations(db_session, today=tomorrow, incremental=True) == 1
+    assert set(_tasks_by_badge(db_session, "30 Day Review")) == {"B-4"}
+
+    # Editing the rule forces one full backfill for that rule
+    # (with an empty ledger, every offender in the window fires again)
+    db_session.query(models.AutomationRun).delete()
+    db_session.commit()
+    rule.due_offset = 14
+    db_session.commit()
+    assert run_daily_automations(db_session, today=tomorrow, incremental=True) == 4
+    assert run_daily_automations(db_session, today=tomorrow, incremental=True) == 0
+
+def test_raw_sql_writes_stamp_updated_at(db_session):
+    from datetime import datetime
+    from sqlalchemy import text
+    from backend.services import change_tracking
+
+    _, seeded = _seed(db_session)
+    old = datetime(2020, 1, 1)
+    seeded["due"].updated_at = old
+    db_session.commit()
+    assert db_session.get(models.Offender, seeded["due"].offender_id).updated_at == old
+
+    # Bulk / raw statements that leave updated_at out are stamped by the triggers
+    db_session.execute(text("UPDATE offenders SET first_name = 'Raw' WHERE badge_id = 'B-1'"))
+    db_session.execute(text("INSERT INTO offenders (offender_id, badge_id, first_name, last_name, dob) "
+                            "VALUES ('00000000000000000000000000000001', 'B-RAW', 'F', 'L', '1990-01-01')"))
+    db_session.commit()
+    db_session.expire_all()
+    stamps = dict(db_session.query(models.Offender.badge_id, models.Offender.updated_at)
+                  .filter(models.Offender.badge_id.in_(["B-1", "B-RAW"])))
+    assert all(stamp > datetime.utcnow() - timedelta(minutes=1) for stamp in stamps.values())
+
+    # Rows from before the column existed are back-filled
+    db_session.execute(text("UPDATE supervision_episodes SET updated_at = NULL"))
+    db_session.commit()
+    assert change_tracking.backfill(db_session.connection()) == len(seeded)
+    db_session.commit()
+    assert db_session.query(models.SupervisionEpisode).filter(models.SupervisionEpisode.updated_at.is_(None)).count() == 0
+
+def test_change_trigger_errors_do_not_abort_startup(db_session, monkeypatch, caplog):
+    from backend.services import change_tracking
+
+    monkeypatch.setattr(change_tracking, "_sqlite_ddl", lambda table: ["CREATE TRIGGER broken"])
+    connection = db_session.connection()
+    change_tracking.ensure_change_triggers(connection)
+    assert "Could not create change trigger" in caplog.text
+    assert connection.exec_driver_sql("SELECT count(*) FROM offenders").scalar() == 0
+
+def test_positive_ua_publishes_event_rule(client, db_session):
+    officer, seeded = _seed(db_session)
+    db_session.add(_rule(name="UA follow-up", trigger_field="positive_ua", trigger_offset=0, task_title="UA Follow-up",
+                         conditions=[{"field": "risk_level", "operator": "equals", "value": "High"}]))
+    db_session.commit()
+
+    for key in ("due", "high"):
+        response = client.post(f"/offenders/{seeded[key].offender_id}/urinalysis",
+                               json={"date": TODAY.isoformat(), "result": "Positive"})
+        assert response.status_code == 200
+
+    tasks = _tasks_by_badge(db_session, "UA Follow-up")
+    assert set(tasks) == {"B-5"}
+    assert tasks["B-5"].assigned_officer_id == officer.officer_id
+
+def test_in_process_event_bus_batches_events(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend.services.automation_events import InProcessEventBus
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db_session = Session()
+    bus = InProcessEventBus(session_factory=Session, batch_size=50, batch_wait=0.2)
+    try:
+        _, seeded = _seed(db_session)
+        db_session.add(_rule(name="UA follow-up", trigger_field="positive_ua", trigger_offset=0, task_title="UA Follow-up"))
+        db_session.commit()
+
+        for _ in range(5):
+            for offender in seeded.values():
+                bus.publish("positive_ua", offender.offender_id)
+        bus.publish("unknown_event", seeded["due"].offender_id)
+        bus.flush(timeout=10)
+
+        stats = bus.stats()
+        assert stats["processed"] == stats["published"] + stats["inline"] == 5 * len(seeded) + 1
+        assert stats["batches"] < stats["processed"]
+        assert stats["errors"] == 0
+        assert db_session.query(models.Task).filter(models.Task.title == "UA Follow-up").count() == 5 * len(seeded)
+    finally:
+        bus.stop()
+        db_session.close()
+        engine.dispose()
+
+def test_dry_run_reports_without_writing(client, db_session):
+    _seed(db_session)
+    db_session.add_all([
+        _rule(),
+        _rule(name="UA follow-up", trigger_field="positive_ua", trigger_offset=0, task_title="UA Follow-up",
+              conditions=[{"field": "risk_level", "operator": "equals", "value": "High"}]),
+    ])
+    db_session.commit()
+
+    response = client.get(f"/automations/rules/dry-run?today={TODAY.isoformat()}&sample=2")
+    assert response.status_code == 200
+    report = response.json()
+    by_name = {r["name"]: r for r in report["rules"]}
+
+    date_rule = by_name["30 day check"]
+    assert date_rule["matches"] == 3
+    assert date_rule["would_create"] == 3
+    assert len(date_rule["sample"]) == 2
+    assert date_rule["queries"] >= 1 and date_rule["seconds"] >= 0
+
+    event_rule = by_name["UA follow-up"]
+    assert event_rule["trigger_type"] == "event"
+    assert event_rule["matches"] == 1 and event_rule["would_create"] is None
+
+    assert report["totals"]["would_create"] == 3
+    assert db_session.query(models.Task).count() == 0
+    assert db_session.query(models.AutomationRun).count() == 0
+
+    # After a real run the same dry run reports the firings as already done
+    run_daily_automations(db_session, today=TODAY)
+    rule_id = date_rule["rule_id"]
+    again = client.get(f"/automations/rules/{rule_id}/dry-run?today={TODAY.isoformat()}").json()["rules"][0]
+    assert again["already_fired"] == 3 and again["would_create"] == 0
+
+    # Draft rules can be previewed before they are saved
+    draft = {"name": "Draft", "trigger_field": "release_date", "trigger_offset": 30, "trigger_direction": "after",
+             "task_title": "Draft Review", "is_active": False,
+             "conditions": [{"field": "risk_level", "operator": "equals", "value": "High"}]}
+    preview = client.post(f"/automations/rules/dry-run?today={TODAY.isoformat()}", json=draft).json()
+    assert preview["rule_id"] is None and preview["would_create"] == 1
+    assert client.get("/automations/rules/999/dry-run").status_code == 404
@@ -0,0 +1,180 @@
+from datetime import date, datetime, timedelta
+import pytest
+from backend import models
+
+def _seed_dashboard(db_session):
+    location = models.Location(name="North", address="1 North St", type="Office")
+    other_location = models.Location(name="South", address="1 South St", type="Office")
+    db_session.add_all([location, other_location])
+    db_session.flush()
+    officer = models.Officer(badge_number="O-1", first_name="Ann", last_name="Officer", location_id=location.location_id)
+    other = models.Officer(badge_number="O-2", first_name="Bob", last_name="Officer", location_id=other_location.location_id)
+    db_session.add_all([officer, other])
+    db_session.flush()
+
+    def add_case(i, officer_id, risk, employment, status="Active"):
+        offender = models.Offender(first_name=f"F{i}", last_name=f"L{i}", badge_id=f"D-{i}", dob=date(1990, 1, 1), employment_status=employment)
+        db_session.add(offender)
+        db_session.flush()
+        episode = models.SupervisionEpisode(offender_id=offender.offender_id, assigned_officer_id=officer_id, start_date=date(2023, 1, 1), status=status, risk_level_at_start=risk)
+        db_session.add(episode)
+        db_session.flush()
+        return offender, episode
+
+    o1, e1 = add_case(1, officer.officer_id, "Low Risk", "Employed")
+    o2, e2 = add_case(2, officer.officer_id, "Moderate", "Unemployed")
+    o3, e3 = add_case(3, officer.officer_id, "High", "Employed")
+    o4, e4 = add_case(4, other.officer_id, "High", "Employed")
+    o5, e5 = add_case(5, officer.officer_id, "High", "Employed", status="Closed")
+
+    db_session.add_all([
+        # Pinned violation (warrant) + recent violation for o1
+        models.CaseNote(offender_id=o1.offender_id, type="Violation", is_pinned=True, content="w", date=datetime.utcnow()),
+        models.CaseNote(offender_id=o1.offender_id, type="Violation", is_pinned=False, content="v", date=datetime.utcnow()),
+        # Old violation for o2 does not affect compliance
+        models.CaseNote(offender_id=o2.offender_id, type="Violation", is_pinned=False, content="old", date=datetime.utcnow() - timedelta(days=60)),
+        # Other officer's violation
+        models.CaseNote(offender_id=o4.offender_id, type="Violation", is_pinned=True, content="w", date=datetime.utcnow()),
+        models.Task(episode_id=e1.episode_id, title="t1", status="Pending"),
+        models.Task(episode_id=e5.episode_id, title="t5", status="Pending"),
+        models.Task(episode_id=e2.episode_id, title="t2", status="Completed"),
+        models.Task(episode_id=e4.episode_id, title="t4", status="Pending"),
+    ])
+    db_session.commit()
+    return officer, location
+
+def test_dashboard_stats_system_wide(auth_client, db_session, query_counter):
+    _seed_dashboard(db_session)
+    with query_counter() as counter:
+        response = auth_client.get("/dashboard/stats")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["total_caseload"] == 4
+    assert stats["employment_rate"] == 75.0
+    assert stats["warrants_issued"] == 2
+    assert stats["compliance_rate"] == 50.0
+    assert stats["pending_reviews"] == 3
+    assert {r["name"]: r["value"] for r in stats["risk_distribution"]} == {"Low": 1, "Medium": 1, "High": 2}
+    assert counter["count"] == 1
+
+def test_dashboard_stats_filters(auth_client, db_session):
+    officer, location = _seed_dashboard(db_session)
+    for params in (f"officer_id={officer.officer_id}", f"location_id={location.location_id}"):
+        stats = auth_client.get(f"/dashboard/stats?{params}").json()
+        assert stats["total_caseload"] == 3
+        assert stats["employment_rate"] == 66.7
+        assert stats["warrants_issued"] == 1
+        assert stats["pending_reviews"] == 2
+        assert {r["name"]: r["value"] for r in stats["risk_distribution"]} == {"Low": 1, "Medium": 1, "High": 1}
+
+    assert auth_client.get("/dashboard/stats?officer_id=nope").status_code == 400
+
+def test_dashboard_stats_cached_and_invalidated(auth_client, db_session, query_counter):
+    officer, location = _seed_dashboard(db_session)
+    auth_client.get("/dashboard/stats")
+    before = auth_client.get("/dashboard/cache-stats").json()
+
+    with query_counter() as counter:
+        stats = auth_client.get("/dashboard/stats").json()
+    assert counter["count"] == 0
+    assert auth_client.get("/dashboard/cache-stats").json()["hits"] == before["hits"] + 1
+
+    # Employment change evicts the system-wide key
+    offender = db_session.query(models.Offender).filter(models.Offender.badge_id == "D-2").first()
+    response = auth_client.put(f"/offenders/{offender.offender_id}/employment-status", json={"status": "Employed"})
+    assert response.status_code == 200
+    assert auth_client.get("/dashboard/stats").json()["employment_rate"] == 100.0
+    assert stats["employment_rate"] == 75.0
+
+    # Task status change evicts the owning officer's key
+    stats = auth_client.get(f"/dashboard/stats?officer_id={officer.officer_id}").json()
+    assert stats["pending_reviews"] == 2
+    task = db_session.query(models.Task).filter(models.Task.title == "t1").first()
+    task.status = "Completed"
+    db_session.commit()
+    assert auth_client.get(f"/dashboard/stats?officer_id={officer.officer_id}").json()["pending_reviews"] == 1
+
+def test_bulk_task_inserts_invalidate_stats(auth_client, db_session):
+    from backend import automation
+
+    _seed_dashboard(db_session)
+    offender = db_session.query(models.Offender).filter(models.Offender.badge_id == "D-1").first()
+    offender.release_date = date(2025, 1, 1)
+    rule = models.AutomationRule(name="Release check", trigger_field="release_date", trigger_offset=0,
+                                 trigger_direction="after", task_title="Release Review", due_offset=7)
+    db_session.add(rule)
+    db_session.commit()
+    assert auth_client.get("/dashboard/stats").json()["pending_reviews"] == 3
+
+    # Core bulk insert of the new task, outside the ORM unit of work
+    assert automation.run_rule(db_session, rule, date(2025, 1, 1)) == 1
+    db_session.commit()
+    assert auth_client.get("/dashboard/stats").json()["pending_reviews"] == 4
+
+def test_stats_cache_single_flight():
+    import threading
+    import time
+    from backend.services.dashboard_cache import StatsCache
+
+    cache = StatsCache(ttl_seconds=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"value": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute(("a", None), compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 8
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 7
+
+    cache.evict_officers(["a"])
+    cache.get_or_compute(("a", None), compute)
+    assert len(calls) == 2
+
+def test_daily_rollup_and_trends(auth_client, db_session):
+    from backend.services import stats_rollup_service
+
+    officer, location = _seed_dashboard(db_session)
+    def rollup(day):
+        return stats_rollup_service.run_daily_stats_rollup(db_session, day, today=day)
+
+    # system + 2 locations + 2 officers
+    assert rollup(date(2024, 1, 31)) == 5
+    # Re-running the same date replaces its rows
+    assert rollup(date(2024, 1, 31)) == 5
+    assert db_session.query(models.DashboardStatsRollup).count() == 5
+    rollup(date(2024, 2, 15))
+    rollup(date(2024, 2, 29))
+    # Live data can't describe a past date
+    with pytest.raises(ValueError):
+        stats_rollup_service.run_daily_stats_rollup(db_session, date(2024, 1, 1), today=date(2024, 3, 1))
+
+    live = auth_client.get("/dashboard/stats").json()
+    trends = auth_client.get("/dashboard/trends?start_date=2024-01-01&end_date=2024-12-31").json()
+    assert [p["date"] for p in trends["points"]] == ["2024-01-31", "2024-02-15", "2024-02-29"]
+    point = trends["points"][0]
+    assert point["total_caseload"] == live["total_caseload"]
+    assert point["compliance_rate"] == live["compliance_rate"]
+    assert point["risk_distribution"] == {"Low": 1, "Medium": 1, "High": 2}
+
+    monthly = auth_client.get("/dashboard/trends?start_date=2024-01-01&end_date=2024-12-31&interval=month").json()
+    assert [p["date"] for p in monthly["points"]] == ["2024-01-31", "2024-02-29"]
+
+    officer_trend = auth_client.get(f"/dashboard/trends?scope=officer&scope_id={officer.officer_id}&start_date=2024-01-01&end_date=2024-12-31").json()
+    assert officer_trend["points"][0]["total_caseload"] == 3
+    assert officer_trend["points"][0]["pending_reviews"] == 2
+
+    location_trend = auth_client.get(f"/dashboard/trends?scope=location&scope_id={location.location_id}&start_date=2024-01-01&end_date=2024-12-31").json()
+    assert location_trend["points"][0]["warrants_issued"] == 1
+
+    assert auth_client.get("/dashboard/trends?scope=officer").status_code == 400
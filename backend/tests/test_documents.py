@@ -0,0 +1,468 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+import zipfile
+import pytest
+from datetime import datetime, timedelta
+from backend import auth, models
+from backend.services import document_delivery, document_previews, document_store, preview_renderers, resumable_uploads, storage_backends
+
+class LocalS3StandIn:
+    """
+    In-memory stand-in for the S3 API subset used by S3Storage.
+    """
+    class NotFound(Exception):
+        response = {"Error": {"Code": "404"}}
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body.read()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.NotFound()
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        if (Bucket, Key) not in self.objects:
+            raise self.NotFound()
+        data = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = Range.removeprefix("bytes=").split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        backend = storage_backends.LocalStorage(str(tmp_path / "media"))
+    else:
+        backend = storage_backends.S3Storage("documents", LocalS3StandIn(), prefix="blobs", tmp_dir=str(tmp_path / "tmp"))
+    storage_backends.set_storage(backend)
+    yield backend
+    storage_backends.set_storage(None)
+
+def _upload(client, offender, content: bytes, name="scan.pdf"):
+    response = client.post(
+        "/documents/upload",
+        files={"file": (name, content, "application/pdf")},
+        data={"offender_id": str(offender.offender_id), "category": "Court"},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _read(storage, key):
+    body = storage.open(key)
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+def test_identical_uploads_share_one_blob(client, db_session, test_offender, storage):
+    content = b"%PDF-1.4 court order" * 1000
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    first = _upload(client, test_offender, content)
+    second = _upload(client, test_offender, content, name="copy.pdf")
+    other = _upload(client, test_offender, b"something else")
+
+    assert first["file_path"] == second["file_path"] == f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+    assert (first["sha256"], first["file_size"]) == (sha256, len(content))
+    assert second["file_name"] == "copy.pdf"
+    assert other["file_path"] != first["file_path"]
+    assert _read(storage, first["file_path"]) == content
+
+    blob = db_session.get(models.DocumentBlob, sha256)
+    assert blob.ref_count == 2
+    assert blob.backend == storage.name
+
+    # The bytes stay until the last reference is deleted
+    assert client.delete(f"/documents/{first['document_id']}").status_code == 200
+    assert storage.exists(second["file_path"])
+    db_session.expire_all()
+    assert db_session.get(models.DocumentBlob, sha256).ref_count == 1
+
+    assert client.delete(f"/documents/{second['document_id']}").status_code == 200
+    assert not storage.exists(second["file_path"])
+    db_session.expire_all()
+    assert db_session.get(models.DocumentBlob, sha256) is None
+    assert storage.exists(other["file_path"])
+
+def test_reupload_between_release_and_purge_keeps_the_bytes(client, db_session, test_offender, storage):
+    content = b"%PDF-1.4 probation terms"
+    first = _upload(client, test_offender, content)
+    sha256 = first["sha256"]
+
+    # delete_document's first transaction, then a re-upload before the purge runs
+    db_session.delete(db_session.get(models.Document, uuid.UUID(first["document_id"])))
+    db_session.flush()
+    assert document_store.release_blob(db_session, sha256)
+    db_session.commit()
+    second = _upload(client, test_offender, content)
+
+    assert not document_store.purge_blob(db_session, sha256, storage)
+    assert _read(storage, second["file_path"]) == content
+
+    # A release that was never purged is picked up by the sweep
+    db_session.delete(db_session.get(models.Document, uuid.UUID(second["document_id"])))
+    db_session.flush()
+    document_store.release_blob(db_session, sha256)
+    db_session.commit()
+    assert document_store.purge_released_blobs(db_session, storage) == 1
+    assert not storage.exists(second["file_path"])
+    assert db_session.get(models.DocumentBlob, sha256) is None
+
+def test_spool_hashes_in_chunks(tmp_path):
+    content = bytes(range(256)) * 50
+    tmp_file, sha256, size = document_store.spool(io.BytesIO(content), str(tmp_path), chunk_size=1000)
+    assert sha256 == hashlib.sha256(content).hexdigest()
+    assert size == len(content)
+    assert open(tmp_file, "rb").read() == content
+
+def _put_chunk(client, upload_id, index, data, sha256=None):
+    return client.put(
+        f"/documents/uploads/{upload_id}/chunks/{index}",
+        content=data,
+        headers={"X-Chunk-SHA256": sha256 or hashlib.sha256(data).hexdigest()},
+    )
+
+def test_resumable_upload_matches_direct_upload(client, db_session, test_offender, storage):
+    content = bytes(range(256)) * 40
+    chunks = [content[i:i + 4096] for i in range(0, len(content), 4096)]
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    session = client.post("/documents/uploads", json={
+        "offender_id": str(test_offender.offender_id), "file_name": "bodycam.mp4",
+        "file_type": "video/mp4", "category": "Court", "total_size": len(content), "chunk_size": 4096,
+    }).json()
+    upload_id = session["upload_id"]
+
+    # Oversized and corrupted chunks are refused
+    assert _put_chunk(client, upload_id, 0, content[:5000]).status_code == 413
+    assert _put_chunk(client, upload_id, 0, chunks[0], sha256="0" * 64).status_code == 422
+    assert client.put(f"/documents/uploads/{upload_id}/chunks/0", content=chunks[0]).status_code == 400
+
+    # Out of order, with a retry; the session reports what to resume from
+    assert _put_chunk(client, upload_id, 2, chunks[2]).status_code == 200
+    assert _put_chunk(client, upload_id, 0, chunks[0]).status_code == 200
+    assert _put_chunk(client, upload_id, 0, chunks[0]).status_code == 200
+    state = client.get(f"/documents/uploads/{upload_id}").json()
+    assert state["received_chunks"] == [0, 2]
+
+    missing = client.post(f"/documents/uploads/{upload_id}/commit", json={"total_chunks": 3})
+    assert missing.status_code == 409
+
+    assert _put_chunk(client, upload_id, 1, chunks[1]).status_code == 200
+    response = client.post(f"/documents/uploads/{upload_id}/commit", json={"total_chunks": 3, "sha256": sha256})
+    assert response.status_code == 200, response.text
+    doc = response.json()
+    assert (doc["sha256"], doc["file_size"], doc["file_name"]) == (sha256, len(content), "bodycam.mp4")
+    assert _read(storage, doc["file_path"]) == content
+
+    # Same record and shared blob as the one-shot endpoint
+    direct = _upload(client, test_offender, content)
+    assert direct["file_path"] == doc["file_path"]
+    assert db_session.get(models.DocumentBlob, sha256).ref_count == 2
+    assert not os.path.exists(resumable_uploads.session_dir(upload_id, storage))
+
+    # A retried commit (response lost) returns the same document, no second row
+    retry = client.post(f"/documents/uploads/{upload_id}/commit", json={"total_chunks": 3})
+    assert (retry.status_code, retry.json()["document_id"]) == (200, doc["document_id"])
+    db_session.expire_all()
+    assert db_session.get(models.DocumentBlob, sha256).ref_count == 2
+    assert _put_chunk(client, upload_id, 0, chunks[0]).status_code == 409
+
+def test_concurrent_commit_of_a_session_is_refused(client, db_session, test_offender, storage):
+    upload_id = client.post("/documents/uploads", json={
+        "offender_id": str(test_offender.offender_id), "file_name": "scan.pdf",
+    }).json()["upload_id"]
+    assert _put_chunk(client, upload_id, 0, b"page one").status_code == 200
+
+    # Another request holds the session
+    assert resumable_uploads._claim(db_session, uuid.UUID(upload_id))
+    assert client.post(f"/documents/uploads/{upload_id}/commit", json={"total_chunks": 1}).status_code == 409
+    assert db_session.query(models.Document).count() == 0
+
+    # A failed commit hands the session back for a retry
+    resumable_uploads._release(db_session, uuid.UUID(upload_id))
+    bad = client.post(f"/documents/uploads/{upload_id}/commit", json={"total_chunks": 1, "sha256": "0" * 64})
+    assert bad.status_code == 422
+    assert client.get(f"/documents/uploads/{upload_id}").json()["status"] == "open"
+    assert client.post(f"/documents/uploads/{upload_id}/commit", json={"total_chunks": 1}).status_code == 200
+
+def test_expired_upload_sessions_are_cleaned_up(client, db_session, test_offender, storage):
+    session = client.post("/documents/uploads", json={
+        "offender_id": str(test_offender.offender_id), "file_name": "scan.pdf",
+    }).json()
+    upload_id = session["upload_id"]
+    assert _put_chunk(client, upload_id, 0, b"partial").status_code == 200
+    assert os.path.isdir(resumable_uploads.session_dir(upload_id, storage))
+
+    assert resumable_uploads.cleanup_expired(db_session) == 0
+    later = datetime.utcnow() + resumable_uploads.SESSION_TTL + timedelta(minutes=1)
+    assert resumable_uploads.cleanup_expired(db_session, now=later) == 1
+    assert not os.path.exists(resumable_uploads.session_dir(upload_id, storage))
+    assert db_session.query(models.UploadChunk).count() == 0
+    assert client.get(f"/documents/uploads/{upload_id}").status_code == 404
+
+def test_expiry_does_not_cut_a_commit_short(client, db_session, test_offender, storage):
+    def new_session(content):
+        upload_id = client.post("/documents/uploads", json={
+            "offender_id": str(test_offender.offender_id), "file_name": "scan.pdf",
+        }).json()["upload_id"]
+        assert _put_chunk(client, upload_id, 0, content).status_code == 200
+        return upload_id
+
+    # Mid-commit: cleanup leaves the session and its chunks alone
+    committing = new_session(b"being assembled")
+    assert resumable_uploads._claim(db_session, uuid.UUID(committing))
+    later = datetime.utcnow() + resumable_uploads.SESSION_TTL + timedelta(minutes=1)
+    assert resumable_uploads.cleanup_expired(db_session, now=later) == 0
+    assert os.path.isdir(resumable_uploads.session_dir(committing, storage))
+    # ... unless the commit died long ago
+    much_later = later + resumable_uploads.SESSION_TTL
+    assert resumable_uploads.cleanup_expired(db_session, now=much_later) == 1
+
+    # Committed after its upload expiry: a retry still gets the document
+    committed = new_session(b"already stored")
+    upload = db_session.get(models.UploadSession, uuid.UUID(committed))
+    doc = client.post(f"/documents/uploads/{committed}/commit", json={"total_chunks": 1}).json()
+    db_session.refresh(upload)
+    upload.expires_at = datetime.utcnow() - timedelta(minutes=1)
+    db_session.commit()
+    retry = client.post(f"/documents/uploads/{committed}/commit", json={"total_chunks": 1})
+    assert (retry.status_code, retry.json()["document_id"]) == (200, doc["document_id"])
+
+def _user(db_session, username, role_name, officer_fields=None):
+    role = db_session.query(models.Role).filter(models.Role.role_name == role_name).first()
+    if role is None:
+        role = models.Role(role_name=role_name)
+        db_session.add(role)
+        db_session.flush()
+    user = models.User(username=username, email=f"{username}@system.local", password_hash="x", role_id=role.role_id)
+    db_session.add(user)
+    db_session.flush()
+    officer = None
+    if officer_fields is not None:
+        officer = models.Officer(user_id=user.user_id, badge_number=username.upper(),
+                                 first_name="Test", last_name=username, **officer_fields)
+        db_session.add(officer)
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': username})}"}
+    return headers, officer
+
+def test_document_content_ranges_and_etag(client, db_session, test_offender, storage):
+    content = bytes(range(256)) * 4000
+    doc = _upload(client, test_offender, content, name="clip.mp4")
+    url = f"/documents/{doc['document_id']}/content"
+    admin, _ = _user(db_session, "admin", "Admin")
+
+    assert client.get(url).status_code == 401
+    full = client.get(url, headers=admin)
+    assert full.status_code == 200
+    assert full.content == content
+    assert full.headers["etag"] == f'"{doc["sha256"]}"'
+    assert full.headers["accept-ranges"] == "bytes"
+
+    assert client.get(url, headers={**admin, "If-None-Match": full.headers["etag"]}).status_code == 304
+
+    part = client.get(url, headers={**admin, "Range": "bytes=1000-299999"})
+    assert part.status_code == 206
+    assert part.headers["content-range"] == f"bytes 1000-299999/{len(content)}"
+    assert part.content == content[1000:300000]
+
+    tail = client.get(url, headers={**admin, "Range": "bytes=-10"})
+    assert (tail.status_code, tail.content) == (206, content[-10:])
+
+    # A stale If-Range gets the whole (changed) file instead of a mismatched slice
+    stale = client.get(url, headers={**admin, "Range": "bytes=0-9", "If-Range": '"other"'})
+    assert (stale.status_code, len(stale.content)) == (200, len(content))
+
+    unsatisfiable = client.get(url, headers={**admin, "Range": f"bytes={len(content)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(content)}"
+
+    head = client.head(url, headers=admin)
+    assert (head.status_code, head.headers["content-length"], head.content) == (200, str(len(content)), b"")
+
+def test_document_content_of_a_missing_blob_is_not_found(client, db_session, test_offender, storage):
+    doc = _upload(client, test_offender, b"gone before it was read")
+    admin, _ = _user(db_session, "admin", "Admin")
+    storage.delete(document_store.blob_key(doc["sha256"]))
+
+    response = client.get(f"/documents/{doc['document_id']}/content", headers=admin)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Document file is missing"
+
+def test_document_content_is_scoped_to_caseload(client, db_session, test_offender, storage):
+    doc = _upload(client, test_offender, b"%PDF-1.4 supervision plan")
+    url = f"/documents/{doc['document_id']}/content"
+
+    supervisor_headers, supervisor = _user(db_session, "sup1", "Supervisor", {})
+    db_session.flush()
+    assigned_headers, assigned = _user(db_session, "off1", "Officer", {"supervisor_id": supervisor.officer_id})
+    other_headers, _ = _user(db_session, "off2", "Officer", {})
+    episode = db_session.query(models.SupervisionEpisode).filter_by(offender_id=test_offender.offender_id).one()
+    episode.assigned_officer_id = assigned.officer_id
+    db_session.commit()
+
+    assert client.get(url, headers=assigned_headers).status_code == 200
+    assert client.get(url, headers=supervisor_headers).status_code == 200
+    assert client.get(url, headers=other_headers).status_code == 403
+    assert client.get(f"/documents/{doc['document_id']}/link", headers=other_headers).status_code == 403
+
+    # Link tokens only open the document they were issued for
+    link = client.get(f"/documents/{doc['document_id']}/link", headers=assigned_headers).json()
+    assert client.get(link["url"]).content == b"%PDF-1.4 supervision plan"
+    other_doc = _upload(client, test_offender, b"another file")
+    token = link["url"].split("token=")[1]
+    assert client.get(f"/documents/{other_doc['document_id']}/content?token={token}").status_code == 401
+
+    # ... and are never accepted as a login token
+    link_bearer = {"Authorization": f"Bearer {token}"}
+    assert client.get(url, headers=link_bearer).status_code == 401
+    assert client.get(f"/documents/{doc['document_id']}/link", headers=link_bearer).status_code == 401
+    # Nor is a login token accepted as a link token
+    login_token = assigned_headers["Authorization"].split()[1]
+    assert client.get(f"{url}?token={login_token}").status_code == 401
+
+def test_parse_range():
+    assert document_delivery.parse_range(None, 100) is None
+    assert document_delivery.parse_range("bytes=0-0", 100) == (0, 0)
+    assert document_delivery.parse_range("bytes=90-", 100) == (90, 99)
+    assert document_delivery.parse_range("bytes=-500", 100) == (0, 99)
+    assert document_delivery.parse_range("bytes=0-1,5-6", 100) is None # multipart: whole file
+    assert document_delivery.parse_range("items=0-1", 100) is None
+    with pytest.raises(document_delivery.RangeNotSatisfiable):
+        document_delivery.parse_range("bytes=100-", 100)
+
+def _png_bytes(size=(800, 600)):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new("RGB", size, "red").save(out, format="PNG")
+    return out.getvalue()
+
+def _docx_bytes(*paragraphs):
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        archive.writestr("word/document.xml", f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>')
+    return out.getvalue()
+
+def test_previews_are_generated_and_stored_next_to_the_blob(client, db_session, test_offender, storage):
+    admin, _ = _user(db_session, "admin", "Admin")
+
+    image = client.post("/documents/upload", files={"file": ("photo.png", _png_bytes(), "image/png")},
+                        data={"offender_id": str(test_offender.offender_id)}).json()
+    assert image["preview_status"] == "ready"
+    thumbnail = client.get(f"/documents/{image['document_id']}/thumbnail", headers=admin)
+    assert thumbnail.headers["content-type"] == "image/png"
+    from PIL import Image
+    assert max(Image.open(io.BytesIO(thumbnail.content)).size) <= preview_renderers.THUMBNAIL_SIZE[0]
+    assert client.get(f"/documents/{image['document_id']}/thumbnail").status_code == 401
+    assert client.get(f"/documents/{image['document_id']}/thumbnail",
+                      headers={**admin, "If-None-Match": thumbnail.headers["etag"]}).status_code == 304
+
+    report = client.post("/documents/upload", files={"file": ("report.docx", _docx_bytes("Violation report", "Missed curfew"))},
+                         data={"offender_id": str(test_offender.offender_id)}).json()
+    assert report["preview_status"] == "ready"
+    assert document_previews.read_text(report["sha256"]) == "Violation report\nMissed curfew"
+    assert storage.exists(document_previews.thumbnail_key(report["sha256"]))
+
+    other = client.post("/documents/upload", files={"file": ("blob.bin", b"\x00\x01", "application/octet-stream")},
+                        data={"offender_id": str(test_offender.offender_id)}).json()
+    assert other["preview_status"] == "unsupported"
+    assert client.get(f"/documents/{other['document_id']}/thumbnail", headers=admin).status_code == 404
+
+    listed = client.get(f"/documents/offender/{test_offender.offender_id}").json()
+    assert {d["file_name"]: d["preview_status"] for d in listed}["photo.png"] == "ready"
+
+    # Derivatives go with the last reference to the blob
+    assert client.delete(f"/documents/{report['document_id']}").status_code == 200
+    assert not storage.exists(document_previews.thumbnail_key(report["sha256"]))
+    assert not storage.exists(document_previews.text_key(report["sha256"]))
+
+def test_preview_job_timeout(monkeypatch, tmp_path):
+    def slow(path):
+        time.sleep(5)
+    monkeypatch.setitem(preview_renderers.RENDERERS, "text", slow)
+    source = tmp_path / "notes.txt"
+    source.write_text("hello")
+    start = time.monotonic()
+    with pytest.raises(preview_renderers.JobTimeout):
+        preview_renderers.run_job(str(source), "text/plain", "notes.txt", timeout=0.2)
+    assert time.monotonic() - start < 2
+
+def test_preview_claim_is_released_when_storage_fails(db_session, tmp_path):
+    storage = storage_backends.S3Storage("documents", LocalS3StandIn(), prefix="blobs", tmp_dir=str(tmp_path / "tmp"))
+    os.makedirs(storage.tmp_dir, exist_ok=True)
+    sha256 = hashlib.sha256(b"never stored").hexdigest()
+    db_session.add(models.DocumentBlob(sha256=sha256, storage_key=document_store.blob_key(sha256), backend=storage.name,
+                                       size=12, ref_count=1, preview_status="pending"))
+    db_session.commit()
+
+    # The download fails (bytes missing) before anything is rendered
+    with pytest.raises(LocalS3StandIn.NotFound):
+        document_previews.generate(db_session, storage, sha256, lambda *args: (None, "text"))
+    db_session.expire_all()
+    assert db_session.get(models.DocumentBlob, sha256).preview_status == "pending"
+    assert os.listdir(storage.tmp_dir) == []
+
+def test_process_pipeline_defers_when_full(monkeypatch, db_session, test_offender, tmp_path):
+    from backend.tests.conftest import TestingSessionLocal
+    storage_backends.set_storage(storage_backends.LocalStorage(str(tmp_path / "media")))
+    pipeline = document_previews.ProcessPreviewPipeline(TestingSessionLocal, max_workers=1, max_pending=1, job_timeout=20)
+    document_previews.set_pipeline(pipeline)
+    try:
+        # Workers not started yet: the second blob doesn't fit in the queue
+        monkeypatch.setattr(pipeline, "start", lambda: None)
+        docs = [
+            document_store.register(db_session, storage_backends.get_storage(), _spooled(tmp_path, content), sha, len(content),
+                                    {"offender_id": test_offender.offender_id, "file_name": f"note{i}.txt", "file_type": "text/plain"})
+            for i, (content, sha) in enumerate(_contents(b"first note", b"second note"))
+        ]
+        assert (pipeline.scheduled, pipeline.deferred) == (1, 1)
+
+        monkeypatch.undo()
+        pipeline.start()
+        pipeline.flush(timeout=60)
+        assert document_previews.sweep_pending(db_session, pipeline) == 1
+        pipeline.flush(timeout=60)
+        db_session.expire_all()
+        assert [db_session.get(models.DocumentBlob, d.sha256).preview_status for d in docs] == ["ready", "ready"]
+        assert document_previews.read_text(docs[1].sha256) == "second note"
+    finally:
+        document_previews.set_pipeline(document_previews.SyncPreviewPipeline(session_factory=TestingSessionLocal))
+        storage_backends.set_storage(None)
+
+def test_process_pipeline_recycles_only_the_stuck_dispatcher():
+    pipeline = document_previews.ProcessPreviewPipeline(max_workers=2)
+    executors = []
+    threads = [threading.Thread(target=lambda: executors.append(pipeline._pool())) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    assert len(set(executors)) == 2
+
+    pipeline._local.executor = executors[0]
+    pipeline._recycle(executors[0])
+    assert pipeline._executors == {executors[1]}
+    assert pipeline._pool() not in executors
+    pipeline.stop()
+
+def _contents(*contents):
+    return [(c, hashlib.sha256(c).hexdigest()) for c in contents]
+
+def _spooled(tmp_path, content):
+    path = tmp_path / hashlib.sha256(content).hexdigest()
+    path.write_bytes(content)
+    return str(path)
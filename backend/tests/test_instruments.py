@@ -0,0 +1,132 @@
+from backend.models import ScoringTable
+from backend.services.instrument_runtime import instrument_cache
+
+def _instrument_payload():
+    def item(text, points, control_type="Radio"):
+        return {
+            "text": text, "control_type": control_type,
+            "options": [{"label": f"{text} {p}", "value": str(p), "points": p, "order_index": p} for p in points]
+        }
+    return {
+        "name": "Test-Tool",
+        "version": "v1",
+        "target_populations": ["Male", "Female"],
+        "domains": [
+            {"name": "History", "order_index": 0, "max_score": 4,
+             "items": [item("Priors", [0, 1, 2]), item("Violence", [0, 2])]},
+            {"name": "Peers", "order_index": 1, "max_score": 3,
+             "items": [item("Associates", [0, 1, 2], control_type="Checkbox")]},
+        ],
+        "scoring_tables": [
+            {"population_filter": "All", "min_score": 0, "max_score": 3, "result_level": "Low",
+             "recommendation": "Standard reporting"},
+            {"population_filter": "All", "min_score": 4, "max_score": 99, "result_level": "High",
+             "recommendation": "Weekly reporting"},
+            {"population_filter": "Female", "min_score": 0, "max_score": 4, "result_level": "Low",
+             "recommendation": "Gender-responsive programming"},
+        ],
+    }
+
+def test_instrument_scoring_runtime(client, db_session, test_offender, query_counter):
+    instrument = client.post("/assessments/instruments", json=_instrument_payload()).json()
+    instrument_id = instrument["instrument_id"]
+    items = {i["text"]: i for d in instrument["domains"] for i in d["items"]}
+
+    # The full tree loads in a fixed number of queries
+    with query_counter() as counter:
+        assert client.get(f"/assessments/instruments/{instrument_id}").status_code == 200
+    assert counter["count"] == 5
+
+    answers = {
+        items["Priors"]["item_id"]: "2",
+        items["Violence"]["item_id"]: "Violence 2",  # by label
+        items["Associates"]["item_id"]: ["0", "1"],  # checkbox
+    }
+    url = f"/assessments/instruments/{instrument_id}/score"
+    result = client.post(url, json={"answers": answers}).json()
+    assert result["total_score"] == 5
+    assert result["risk_level"] == "High"
+    assert [(d["name"], d["score"]) for d in result["domains"]] == [("History", 4), ("Peers", 1)]
+    assert result["recommendations"] == ["Weekly reporting"]
+    assert result["unanswered"] == []
+
+    # Population-specific tables take precedence; the compiled instrument is cached
+    compiles = instrument_cache.compiles
+    partial = {items["Priors"]["item_id"]: "2", items["Violence"]["item_id"]: "2"}
+    with query_counter() as counter:
+        result = client.post(url, json={"answers": partial, "population": "Female"}).json()
+    assert counter["count"] == 0
+    assert instrument_cache.compiles == compiles
+    assert (result["total_score"], result["risk_level"]) == (4, "Low")
+    assert result["recommendation"] == "Gender-responsive programming"
+    assert result["unanswered"] == [items["Associates"]["item_id"]]
+
+    # Offender's gender is used when no population is given ("Male" -> "All" tables)
+    result = client.post(url, json={"answers": partial, "offender_id": str(test_offender.offender_id)}).json()
+    assert (result["population"], result["risk_level"]) == ("Male", "High")
+
+    # Any committed edit to the instrument tables recompiles it
+    table = db_session.query(ScoringTable).filter(ScoringTable.result_level == "High").one()
+    table.min_score = 10
+    db_session.commit()
+    assert client.post(url, json={"answers": partial}).json()["risk_level"] == "Unknown"
+    assert instrument_cache.compiles == compiles + 1
+
+def test_score_unknown_instrument(client):
+    response = client.post("/assessments/instruments/00000000-0000-0000-0000-000000000000/score", json={"answers": {}})
+    assert response.status_code == 404
+
+def test_instrument_update_is_a_structural_diff(client, query_counter):
+    created = client.post("/assessments/instruments", json=_instrument_payload()).json()
+    instrument_id = created["instrument_id"]
+    url = f"/assessments/instruments/{instrument_id}"
+    payload = client.get(url).json()
+    item_ids = {i["item_id"] for d in payload["domains"] for i in d["items"]}
+    for d in payload["domains"]:
+        d["id"] = d["domain_id"]  # as the builder sends it
+
+    # One label edit touches one row and keeps every id
+    payload["domains"][0]["items"][0]["options"][1]["label"] = "One prior"
+    with query_counter() as counter:
+        response = client.put(url, json=payload)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["changes"] == {
+        "instrument": [],
+        "domains": {"inserted": 0, "updated": 0, "deleted": 0},
+        "items": {"inserted": 0, "updated": 0, "deleted": 0},
+        "options": {"inserted": 0, "updated": 1, "deleted": 0},
+        "scoring_tables": {"inserted": 0, "updated": 0, "deleted": 0},
+    }
+    assert {i["item_id"] for d in result["domains"] for i in d["items"]} == item_ids
+    assert counter["count"] <= 12  # load (5) + 1 update + reload (5) regardless of size
+
+    # Remove the Peers domain (its items, options and tables go with it), add an item,
+    # move an item and add a domain-level table for the new domain
+    payload = result
+    for d in payload["domains"]:
+        d["id"] = d["domain_id"]
+    peers = payload["domains"].pop(1)
+    moved = payload["domains"][0]["items"].pop(1)
+    new_domain_id = "11111111-1111-1111-1111-111111111111"
+    payload["domains"].append({"id": new_domain_id, "name": "Violence", "order_index": 2, "items": [
+        moved,
+        {"text": "Weapons", "options": [{"label": "No", "value": "0", "points": 0}]},
+    ]})
+    payload["scoring_tables"].append({"domain_id": peers["domain_id"], "min_score": 0, "max_score": 1,
+                                      "result_level": "Low"})
+    payload["scoring_tables"].append({"domain_id": new_domain_id, "min_score": 0, "max_score": 5,
+                                      "result_level": "Moderate"})
+    result = client.put(url, json=payload).json()
+    assert result["changes"]["domains"] == {"inserted": 1, "updated": 0, "deleted": 1}
+    assert result["changes"]["items"] == {"inserted": 1, "updated": 1, "deleted": 1}
+    assert result["changes"]["options"] == {"inserted": 1, "updated": 0, "deleted": 3}
+    assert result["changes"]["scoring_tables"] == {"inserted": 1, "updated": 0, "deleted": 0}
+
+    violence = next(d for d in result["domains"] if d["name"] == "Violence")
+    assert violence["domain_id"] != new_domain_id
+    assert moved["item_id"] in {i["item_id"] for i in violence["items"]}
+    assert [t["domain_id"] for t in result["scoring_tables"] if t["domain_id"]] == [violence["domain_id"]]
+
+    assert client.put("/assessments/instruments/00000000-0000-0000-0000-000000000000",
+                      json=_instrument_payload()).status_code == 404
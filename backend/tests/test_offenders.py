@@ -32,3 +32,165 @@ def test_get_offenders_pagination(client, test_offender):
     assert data["total"] >= 1
     assert len(data["data"]) >= 1
     assert data["data"][0]["badgeId"] == "TST-001"
+
+def _seed_caseload(db_session, count, start=0):
+    from datetime import date, datetime, timedelta
+    from backend import models
+
+    offering = db_session.query(models.ProgramOffering).first()
+    if not offering:
+        offering = models.ProgramOffering(program_name="MRT")
+        db_session.add(offering)
+        db_session.flush()
+
+    for i in range(start, start + count):
+        offender = models.Offender(
+            first_name=f"First{i}",
+            last_name=f"Last{i:03d}",
+            badge_id=f"B-{i:04d}",
+            dob=date(1990, 1, 1)
+        )
+        db_session.add(offender)
+        db_session.flush()
+        episode = models.SupervisionEpisode(
+            offender_id=offender.offender_id,
+            start_date=date(2023, 1, 1),
+            status="Active",
+            risk_level_at_start="Low"
+        )
+        db_session.add(episode)
+        db_session.flush()
+        db_session.add_all([
+            models.Residence(episode_id=episode.episode_id, address_line_1=f"{i} Main St", is_current=True),
+            models.Employment(offender_id=offender.offender_id, employer_name=f"Employer {i}"),
+            models.Appointment(offender_id=offender.offender_id, date_time=datetime.utcnow() + timedelta(days=i + 1), status="Scheduled"),
+            models.Appointment(offender_id=offender.offender_id, date_time=datetime.utcnow() + timedelta(days=i + 30), status="Scheduled"),
+            models.RiskAssessment(offender_id=offender.offender_id, date=date(2024, 1, 1), status="Completed", risk_level="Low"),
+            models.RiskAssessment(offender_id=offender.offender_id, date=date(2024, 6, 1), status="Completed", risk_level="High"),
+            models.ProgramEnrollment(offender_id=offender.offender_id, offering_id=offering.offering_id, status="Active"),
+        ])
+    db_session.commit()
+
+def test_get_offenders_query_count_is_constant(client, db_session, query_counter):
+    _seed_caseload(db_session, 3)
+    with query_counter() as small_page:
+        response = client.get("/offenders/?page=1&limit=100")
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 3
+
+    _seed_caseload(db_session, 20, start=3)
+    with query_counter() as large_page:
+        response = client.get("/offenders/?page=1&limit=100")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data) == 23
+
+    # Page size must not change the number of round trips
+    assert large_page["count"] == small_page["count"]
+
+    # Batched lookups resolve the same values the per-row queries did
+    row = data[0]
+    assert row["risk"] == "High"
+    assert row["program"] == "MRT"
+    assert row["nextCheck"] != "Pending"
+    assert len(row["employmentHistory"]) == 1
+
+def test_get_offenders_cursor_pagination(client, db_session):
+    _seed_caseload(db_session, 5)
+
+    # Page mode never hands out a cursor
+    assert client.get("/offenders/?limit=2").json()["next_cursor"] is None
+
+    first = client.get("/offenders/?limit=2&include_total=false&cursor=").json()
+    assert first["total"] is None
+    assert [r["badgeId"] for r in first["data"]] == ["B-0000", "B-0001"]
+    assert first["next_cursor"]
+
+    second = client.get(f"/offenders/?limit=2&cursor={first['next_cursor']}").json()
+    assert [r["badgeId"] for r in second["data"]] == ["B-0002", "B-0003"]
+    assert second["total"] == 5
+
+    third = client.get(f"/offenders/?limit=2&cursor={second['next_cursor']}").json()
+    assert [r["badgeId"] for r in third["data"]] == ["B-0004"]
+    assert third["next_cursor"] is None
+
+    assert client.get("/offenders/?cursor=not-a-cursor").status_code == 400
+
+def test_get_offenders_cursor_pagination_with_null_last_name(client, db_session):
+    from sqlalchemy import text
+
+    _seed_caseload(db_session, 5)
+    # Databases created before the NOT NULL constraint can hold NULL last names
+    db_session.execute(text("PRAGMA writable_schema=ON"))
+    db_session.execute(text(
+        "UPDATE sqlite_master SET sql = replace(sql, 'last_name VARCHAR(50) NOT NULL', 'last_name VARCHAR(50)') "
+        "WHERE type = 'table' AND name = 'offenders'"
+    ))
+    db_session.execute(text("PRAGMA writable_schema=RESET"))
+    db_session.execute(text("UPDATE offenders SET last_name = NULL WHERE badge_id IN ('B-0001', 'B-0003')"))
+    db_session.commit()
+
+    badges = []
+    cursor = ""
+    while cursor is not None:
+        page = client.get(f"/offenders/?limit=2&include_total=false&cursor={cursor}").json()
+        badges += [r["badgeId"] for r in page["data"]]
+        cursor = page["next_cursor"]
+
+    # Every row exactly once, NULL last names after the rest
+    assert len(badges) == 5
+    assert badges[:3] == ["B-0000", "B-0002", "B-0004"]
+    assert set(badges[3:]) == {"B-0001", "B-0003"}
+
+def _create_offender(client, first_name, last_name, badge_id):
+    response = client.post("/offenders/", json={
+        "first_name": first_name,
+        "last_name": last_name,
+        "badge_id": badge_id,
+        "dob": "1985-05-15",
+        "risk_level": "Low",
+        "address_line_1": "1 Main St",
+        "city": "Phoenix",
+        "state": "AZ",
+        "zip_code": "85001",
+        "start_date": "2023-01-01"
+    })
+    assert response.status_code == 200
+    return response.json()["offender_id"]
+
+def test_offender_search_index(client):
+    _create_offender(client, "Maria", "Gonzalez", "A-1001")
+    _create_offender(client, "Mark", "Gonzales", "A-2001")
+    jones_id = _create_offender(client, "Tom", "Jones", "B-3001")
+
+    # Name prefix
+    names = [r["name"] for r in client.get("/offenders/search?q=gonz").json()]
+    assert sorted(names) == ["Gonzales, Mark", "Gonzalez, Maria"]
+
+    # Badge prefix
+    results = client.get("/offenders/search?q=a-1").json()
+    assert [r["badgeId"] for r in results] == ["A-1001"]
+
+    # Multiple words must all match
+    results = client.get("/offenders/search?q=mar gonzalez").json()
+    assert [r["badgeId"] for r in results] == ["A-1001"]
+
+    # Index follows updates
+    client.put(f"/offenders/{jones_id}", json={"last_name": "Smithers"})
+    assert client.get("/offenders/search?q=jones").json() == []
+    assert [r["id"] for r in client.get("/offenders/search?q=smith").json()] == [jones_id]
+
+    # Caseload list search uses the same index
+    data = client.get("/offenders/?search=gonz").json()["data"]
+    assert len(data) == 2
+
+def test_offender_like_search_escapes_wildcards(client, monkeypatch):
+    from backend.services import offender_search_service
+    _create_offender(client, "Ana", "O_Neil", "C-100%")
+    _create_offender(client, "Bob", "Oneil", "C-1000")
+    # The LIKE path used by other dialects and Postgres without pg_trgm
+    monkeypatch.setattr(offender_search_service, "_dialect", lambda db: "like")
+
+    for term in ("o_n", "100%", "%"):
+        results = client.get("/offenders/search", params={"q": term}).json()
+        assert [r["badgeId"] for r in results] == ["C-100%"], term
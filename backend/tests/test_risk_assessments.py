@@ -1,4 +1,5 @@
 from datetime import date, timedelta
+from uuid import UUID, uuid4
 from backend.models import RiskAssessment, RiskAssessmentAnswer, RiskAssessmentQuestion
 
 def test_init_assessment_schema(client, test_offender, db_session):
@@ -180,3 +181,270 @@ def test_override_logic(client, test_offender, db_session):
         SupervisionEpisode.status == "Active"
     ).first()
     assert episode.current_risk_level == "High"
+
+def test_question_catalog_is_cached_between_form_opens(client, test_offender, db_session, query_counter):
+    from backend.services.question_catalog import question_catalog
+
+    q1 = RiskAssessmentQuestion(universal_tag="dob", question_text="Date of Birth", input_type="date",
+                                source_type="static", assessments_list="ORAS|Static-99R")
+    q2 = RiskAssessmentQuestion(universal_tag="sex_offense", question_text="Sex offense?", input_type="boolean",
+                                source_type="static", assessments_list="Static-99R")
+    db_session.add_all([q1, q2])
+    db_session.commit()
+
+    url = f"/assessments/init?offender_id={test_offender.offender_id}&assessment_type=ORAS-CST"
+    assert [f["universal_tag"] for f in client.get(url).json()] == ["dob"]
+
+    # Steady state: only the offender lookup, no catalog query
+    loads = question_catalog.loads
+    with query_counter() as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert counter["count"] == 1
+    assert question_catalog.loads == loads
+
+    # Editing a question through the admin API rebuilds the catalog once
+    response = client.put(f"/assessments/questions/{q2.question_id}", json={"assessments_list": "ORAS|Static-99R"})
+    assert response.status_code == 200
+    assert [f["universal_tag"] for f in client.get(url).json()] == ["dob", "sex_offense"]
+    assert question_catalog.loads == loads + 1
+
+def test_lookback_uses_one_query_and_configurable_window(client, test_offender, db_session, query_counter):
+    from backend.models import SystemSettings
+
+    tags = ["employment_status", "housing", "peers"]
+    db_session.add_all([
+        RiskAssessmentQuestion(universal_tag=t, question_text=t, input_type="text",
+                               source_type="dynamic", assessments_list="ORAS")
+        for t in tags
+    ])
+    old = RiskAssessment(offender_id=test_offender.offender_id, assessment_type="ORAS",
+                         date=date.today() - timedelta(days=40), status="Completed")
+    recent = RiskAssessment(offender_id=test_offender.offender_id, assessment_type="ORAS",
+                            date=date.today() - timedelta(days=5), status="Completed")
+    db_session.add_all([old, recent])
+    db_session.flush()
+    db_session.add_all([
+        RiskAssessmentAnswer(assessment_id=old.assessment_id, question_tag="employment_status", value="old"),
+        RiskAssessmentAnswer(assessment_id=old.assessment_id, question_tag="housing", value="stable"),
+        RiskAssessmentAnswer(assessment_id=recent.assessment_id, question_tag="employment_status", value="new"),
+    ])
+    db_session.commit()
+
+    url = f"/assessments/init?offender_id={test_offender.offender_id}&assessment_type=ORAS"
+    client.get(url)  # warm the question catalog
+
+    # Default 30-day window: the 40-day-old answer is out of range
+    with query_counter() as counter:
+        fields = {f["universal_tag"]: f for f in client.get(url).json()}
+    assert counter["count"] == 3  # offender, look-back setting, answers
+    assert fields["employment_status"]["value"] == "new"
+    assert str(recent.date) in fields["employment_status"]["source_note"]
+    assert fields["housing"]["value"] is None
+    assert fields["peers"]["is_imported"] is False
+
+    db_session.add(SystemSettings(key="assessment_lookback_days", value="60"))
+    db_session.commit()
+    fields = {f["universal_tag"]: f for f in client.get(url).json()}
+    assert fields["employment_status"]["value"] == "new"
+    assert fields["housing"]["value"] == "stable"
+
+def test_scoring_plan_is_cached_and_rebuilt_on_type_edit(client, test_offender, db_session, query_counter):
+    from backend.models import RiskAssessmentType
+    from backend.services import risk_assessment_service
+    from backend.services.scoring_plan import scoring_plans
+
+    rtype = RiskAssessmentType(name="ORAS", scoring_matrix=[{"label": "Low", "min": 0, "max": 4},
+                                                            {"label": "High", "min": 5, "max": 99}])
+    db_session.add_all([
+        rtype,
+        RiskAssessmentQuestion(universal_tag="priors", question_text="Priors", input_type="integer",
+                               source_type="dynamic", assessments_list="ORAS"),
+    ])
+    assessment = RiskAssessment(offender_id=test_offender.offender_id, assessment_type="ORAS",
+                                date=date.today(), status="Draft")
+    db_session.add(assessment)
+    db_session.flush()
+    db_session.add(RiskAssessmentAnswer(assessment_id=assessment.assessment_id, question_tag="priors", value=5))
+    db_session.commit()
+
+    assert risk_assessment_service.calculate_score(db_session, assessment.assessment_id)["risk_level"] == "High"
+
+    # Steady state: the assessment and its answers, nothing else
+    builds = scoring_plans.builds
+    with query_counter() as counter:
+        result = risk_assessment_service.calculate_score(db_session, assessment.assessment_id)
+    assert counter["count"] == 2
+    assert result["total_score"] == 5
+    assert scoring_plans.builds == builds
+
+    response = client.put(f"/assessments/types/{rtype.type_id}",
+                          json={"scoring_matrix": [{"label": "Low", "min": 0, "max": 9}]})
+    assert response.status_code == 200
+    assert risk_assessment_service.calculate_score(db_session, assessment.assessment_id)["risk_level"] == "Low"
+    assert scoring_plans.builds == builds + 1
+
+def test_score_counts_questions_missing_from_cached_catalog(test_offender, db_session):
+    from sqlalchemy import insert
+    from backend.models import RiskAssessmentType
+    from backend.services import risk_assessment_service
+
+    db_session.add(RiskAssessmentType(name="ORAS", scoring_matrix=[{"label": "Low", "min": 0, "max": 4},
+                                                                   {"label": "High", "min": 5, "max": 99}]))
+    assessment = RiskAssessment(offender_id=test_offender.offender_id, assessment_type="ORAS",
+                                date=date.today(), status="Draft")
+    db_session.add(assessment)
+    db_session.commit()
+    assert risk_assessment_service.calculate_score(db_session, assessment.assessment_id)["total_score"] == 0
+
+    # Added behind the cache's back, as another worker process would
+    db_session.execute(insert(RiskAssessmentQuestion).values(
+        universal_tag="priors", question_text="Priors", input_type="integer",
+        source_type="dynamic", assessments_list="ORAS"))
+    db_session.add(RiskAssessmentAnswer(assessment_id=assessment.assessment_id, question_tag="priors", value=6))
+    db_session.commit()
+
+    result = risk_assessment_service.calculate_score(db_session, assessment.assessment_id)
+    assert result["details"] == {"priors": 6}
+    assert result["risk_level"] == "High"
+
+def test_bulk_rescore_preview_and_apply(client, test_offender, db_session, monkeypatch):
+    from backend.models import Offender, RiskAssessmentType, SupervisionEpisode
+    from backend.services import assessment_rescore, automation_events
+
+    rtype = RiskAssessmentType(name="ORAS", scoring_matrix=[{"label": "Low", "min": 0, "max": 4},
+                                                            {"label": "High", "min": 5, "max": 99}])
+    db_session.add_all([
+        rtype,
+        RiskAssessmentQuestion(universal_tag="priors", question_text="Priors", input_type="integer",
+                               source_type="dynamic", assessments_list="ORAS", category="History"),
+        RiskAssessmentQuestion(universal_tag="peers", question_text="Peers", input_type="select",
+                               source_type="dynamic", assessments_list="ORAS",
+                               options=[{"label": "Negative", "score": 2}, {"label": "Positive", "score": 0}]),
+    ])
+    other = Offender(first_name="Other", last_name="Person", badge_id="TST-002", dob=date(1985, 5, 5))
+    db_session.add(other)
+    db_session.flush()
+
+    def completed(offender, days_ago, priors, peers, override=None):
+        assessment = RiskAssessment(offender_id=offender.offender_id, assessment_type="ORAS",
+                                    date=date.today() - timedelta(days=days_ago), status="Draft")
+        db_session.add(assessment)
+        db_session.flush()
+        db_session.add_all([
+            RiskAssessmentAnswer(assessment_id=assessment.assessment_id, question_tag="priors", value=priors),
+            RiskAssessmentAnswer(assessment_id=assessment.assessment_id, question_tag="peers", value=peers),
+        ])
+        db_session.commit()
+        client.post(f"/assessments/{assessment.assessment_id}/submit",
+                    json={"final_risk_level": override, "override_reason": "Judgment" if override else None})
+        return assessment
+
+    old = completed(test_offender, 30, 1, "Positive")   # 1 -> Low
+    latest = completed(test_offender, 1, 2, "Negative")  # 4 -> Low
+    overridden = completed(other, 1, 2, "Positive", override="Low")  # 2 -> Low
+
+    # Tighten the matrix: High now starts at 2 (nothing applied until asked)
+    manual = assessment_rescore.ManualRescorer()
+    monkeypatch.setattr(assessment_rescore, "_rescorer", manual)
+    published = []
+    monkeypatch.setattr(automation_events, "publish", lambda *args, **kwargs: published.append(args))
+    client.put(f"/assessments/types/{rtype.type_id}",
+               json={"scoring_matrix": [{"label": "Low", "min": 0, "max": 1}, {"label": "High", "min": 2, "max": 99}]})
+    assert manual.requested == ["ORAS"]
+
+    preview = client.post("/assessments/rescore").json()
+    assert preview["preview"] is True
+    assert preview["scanned"] == 3
+    assert preview["level_changes"] == 2
+    assert preview["transitions"] == {"Low -> High": 2}
+    assert preview["offenders_changed"] == 1  # the other offender's level is an override
+    change = next(c for c in preview["changes"] if c["assessment_id"] == str(latest.assessment_id))
+    assert change["after"]["category_scores"] == {"History": 2, "General": 2}
+    db_session.expire_all()
+    assert db_session.get(RiskAssessment, latest.assessment_id).risk_level == "Low"
+
+    applied = client.post("/assessments/rescore?preview=false").json()
+    assert applied["level_changes"] == 2
+    db_session.expire_all()
+    assert db_session.get(RiskAssessment, old.assessment_id).risk_level == "Low"
+    assert db_session.get(RiskAssessment, latest.assessment_id).final_risk_level == "High"
+    assert db_session.get(RiskAssessment, overridden.assessment_id).risk_level == "High"
+    assert db_session.get(RiskAssessment, overridden.assessment_id).final_risk_level == "Low"
+    episode = db_session.query(SupervisionEpisode).filter(SupervisionEpisode.offender_id == test_offender.offender_id).one()
+    assert episode.current_risk_level == "High"
+    assert published == [] # retroactive: no risk_level_change automations
+
+    # Nothing left to change
+    assert client.post("/assessments/rescore?preview=false").json()["changed"] == 0
+
+def test_default_transport_does_not_apply_scoring_edits(monkeypatch):
+    from backend.services import assessment_rescore
+    monkeypatch.delenv("RESCORE_TRANSPORT", raising=False)
+    monkeypatch.setattr(assessment_rescore, "_rescorer", None)
+    assert isinstance(assessment_rescore.get_rescorer(), assessment_rescore.ManualRescorer)
+
+def test_scoring_edits_trigger_rescore(client, test_offender, db_session, monkeypatch):
+    from backend.models import RiskAssessmentType
+    from backend.services import assessment_rescore
+    from backend.tests.conftest import TestingSessionLocal
+
+    # Opt-in automatic apply (RESCORE_TRANSPORT=sync)
+    monkeypatch.setattr(assessment_rescore, "_rescorer", assessment_rescore.SyncRescorer(session_factory=TestingSessionLocal))
+
+    rtype = RiskAssessmentType(name="ORAS", scoring_matrix=[{"label": "Low", "min": 0, "max": 4},
+                                                            {"label": "High", "min": 5, "max": 99}])
+    peers = RiskAssessmentQuestion(universal_tag="peers", question_text="Peers", input_type="select",
+                                   source_type="dynamic", assessments_list="ORAS",
+                                   options=[{"label": "Negative", "score": 2}, {"label": "Positive", "score": 0}])
+    db_session.add_all([rtype, peers])
+    assessment = RiskAssessment(offender_id=test_offender.offender_id, assessment_type="ORAS",
+                                date=date.today(), status="Draft")
+    db_session.add(assessment)
+    db_session.flush()
+    db_session.add(RiskAssessmentAnswer(assessment_id=assessment.assessment_id, question_tag="peers", value="Negative"))
+    db_session.commit()
+    client.post(f"/assessments/{assessment.assessment_id}/submit", json={})
+
+    # Option score change: the stored total follows without a manual rescore
+    client.put(f"/assessments/questions/{peers.question_id}",
+               json={"options": [{"label": "Negative", "score": 6}, {"label": "Positive", "score": 0}]})
+    db_session.expire_all()
+    stored = db_session.get(RiskAssessment, assessment.assessment_id)
+    assert (stored.total_score, stored.risk_level) == (6, "High")
+
+    # Matrix change
+    client.put(f"/assessments/types/{rtype.type_id}", json={"scoring_matrix": [{"label": "Low", "min": 0, "max": 9}]})
+    db_session.expire_all()
+    assert db_session.get(RiskAssessment, assessment.assessment_id).risk_level == "Low"
+
+def test_bulk_answer_upsert(client, test_offender, db_session, query_counter):
+    db_session.add_all([
+        RiskAssessmentQuestion(universal_tag=f"item_{i}", question_text=f"Item {i}", input_type="integer",
+                               source_type="dynamic", assessments_list="ORAS")
+        for i in range(5)
+    ])
+    db_session.commit()
+    assessment_id = client.post(
+        f"/assessments/?offender_id={test_offender.offender_id}&assessment_type=ORAS&date={date.today()}"
+    ).json()["assessment_id"]
+    url = f"/assessments/{assessment_id}/answers"
+
+    client.post(url, json={"answers": {"item_0": 0}})  # warms the question catalog
+    with query_counter() as counter:
+        response = client.post(url, json={"answers": {f"item_{i}": i for i in range(5)}})
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "saved": 5}
+    assert counter["count"] == 2  # assessment check + one upsert
+
+    # Re-saving updates in place (no duplicates) and can return the new score
+    response = client.post(f"{url}?include_score=true", json={"answers": {"item_0": 7, "item_4": 1}})
+    assert response.json()["score"]["total_score"] == 7 + 1 + 2 + 3 + 1
+    client.post(f"/assessments/{assessment_id}/save", json={"tag": "item_1", "value": 0})
+    rows = db_session.query(RiskAssessmentAnswer).filter(RiskAssessmentAnswer.assessment_id == UUID(assessment_id)).all()
+    assert sorted((a.question_tag, a.value) for a in rows) == [
+        ("item_0", 7), ("item_1", 0), ("item_2", 2), ("item_3", 3), ("item_4", 1)
+    ]
+
+    assert client.post(url, json={"answers": {"nope": 1}}).status_code == 422
+    assert client.post(f"/assessments/{uuid4()}/answers", json={"answers": {"item_0": 1}}).status_code == 404
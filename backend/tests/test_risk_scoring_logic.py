@@ -6,7 +6,7 @@ import os
 # Add backend to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.services import risk_assessment_service
+from backend.services import risk_assessment_service, scoring_plan
 from backend.models import RiskAssessmentType, RiskAssessmentQuestion, RiskAssessmentAnswer, RiskAssessment
 
 class TestRiskScoring(unittest.TestCase):
@@ -89,5 +89,100 @@ class TestRiskScoring(unittest.TestCase):
         self.assertEqual(result["total_score"], 10)
         self.assertEqual(result["risk_level"], "Unknown") # 10 is not in [0, 2]
 
+class TestScoringPlan(unittest.TestCase):
+
+    def setUp(self):
+        # Q1: Option-based, Q2: Integer-based (Count), Q3: Boolean-based
+        self.questions = [
+            RiskAssessmentQuestion(universal_tag="q1", input_type="select", category="History",
+                                   options=[{"label": "Bad", "score": 5}, {"label": "Good", "score": 0}]),
+            RiskAssessmentQuestion(universal_tag="q2", input_type="integer", category="History"),
+            RiskAssessmentQuestion(universal_tag="q3", input_type="boolean"),
+        ]
+
+    def test_plan_with_matrix(self):
+        # 1. Setup Assessment Type (ORAS-Like)
+        mock_type = RiskAssessmentType(
+            name="Test-Type",
+            scoring_matrix=[
+                {"label": "Low", "min": 0, "max": 5},
+                {"label": "Medium", "min": 6, "max": 10},
+                {"label": "High", "min": 11, "max": 99}
+            ]
+        )
+        plan = scoring_plan.compile_plan(self.questions, mock_type)
+
+        # Bad -> 5, "3" -> 3, Yes -> 1; unknown tags are ignored
+        result = plan.score([("q1", "Bad"), ("q2", "3"), ("q3", "Yes"), ("missing", 7)])
+
+        self.assertEqual(result["total_score"], 9)
+        self.assertEqual(result["risk_level"], "Medium") # 9 falls in 6-10 range
+        self.assertEqual(result["details"], {"q1": 5, "q2": 3, "q3": 1})
+        self.assertEqual(result["category_scores"], {"History": 8, "General": 1})
+
+    def test_plan_out_of_bounds(self):
+        # Test fallback or boundary conditions
+        mock_type = RiskAssessmentType(
+            name="Test-Type",
+            scoring_matrix=[{"label": "Safe", "min": 0, "max": 2}]
+        )
+        plan = scoring_plan.compile_plan(self.questions, mock_type)
+
+        result = plan.score([("q2", "10")])
+
+        self.assertEqual(result["total_score"], 10)
+        self.assertEqual(result["risk_level"], "Unknown") # 10 is not in [0, 2]
+        self.assertEqual(plan.risk_level(-1), "Unknown")
+        self.assertEqual(plan.risk_level(2), "Safe")
+
+    def test_overlapping_bands_keep_first_match(self):
+        mock_type = RiskAssessmentType(
+            name="Test-Type",
+            scoring_matrix=[
+                {"label": "Medium", "min": 5, "max": 10},
+                {"label": "Low", "min": 0, "max": 7},
+                {"label": "High", "min": 11}
+            ]
+        )
+        plan = scoring_plan.compile_plan(self.questions, mock_type)
+
+        levels = [plan.risk_level(score) for score in (0, 4, 5, 7, 10, 11, 999, 1000)]
+        self.assertEqual(levels, ["Low", "Low", "Medium", "Medium", "Medium", "High", "High", "Unknown"])
+
+    def test_fallback_levels_without_matrix(self):
+        plan = scoring_plan.compile_plan(self.questions, None)
+
+        self.assertEqual(plan.risk_level(7), "Low")
+        self.assertEqual(plan.risk_level(8), "Medium")
+        self.assertEqual(plan.risk_level(15), "High")
+
+    def test_option_and_input_type_handlers(self):
+        questions = [
+            RiskAssessmentQuestion(universal_tag="edu", input_type="select",
+                                   options=[{"label": "No Diploma", "value": 1}, {"label": "One", "value": 0, "score": 9}]),
+            RiskAssessmentQuestion(universal_tag="flag", input_type="boolean"),
+            RiskAssessmentQuestion(universal_tag="date", input_type="date"),
+        ]
+        plan = scoring_plan.compile_plan(questions, None)
+
+        # Matched by label or by value; unhashable or unknown answers score 0
+        self.assertEqual(plan.score([("edu", "No Diploma")])["total_score"], 1)
+        self.assertEqual(plan.score([("edu", 1)])["total_score"], 1)
+        self.assertEqual(plan.score([("edu", "One")])["total_score"], 9)
+        self.assertEqual(plan.score([("edu", ["x"])])["total_score"], 0)
+        self.assertEqual(plan.score([("flag", "TRUE"), ("date", "2024-01-01")])["total_score"], 1)
+
+    def test_malformed_option_score_only_affects_that_option(self):
+        questions = self.questions + [
+            RiskAssessmentQuestion(universal_tag="bad", input_type="select",
+                                   options=[{"label": "Typo", "score": "3a"}, {"label": "Empty", "score": None},
+                                            {"label": "Fine", "score": "2"}]),
+        ]
+        with self.assertLogs("backend.services.scoring_plan", level="WARNING"):
+            plan = scoring_plan.compile_plan(questions, None)
+
+        self.assertEqual(plan.score([("q1", "Bad"), ("bad", "Fine")])["total_score"], 7)
+        self.assertEqual(plan.score([("bad", "Typo")])["details"], {"bad": 0})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,151 @@
+import io
+import zipfile
+from datetime import date, datetime, timedelta
+import pytest
+from backend import auth, models
+from backend.main import app
+from backend.services import storage_backends, text_search_service
+
+def _note(db_session, offender, content, days_ago=0):
+    note = models.CaseNote(offender_id=offender.offender_id, content=content, type="Office Visit",
+                           date=datetime(2025, 6, 1) - timedelta(days=days_ago))
+    db_session.add(note)
+    db_session.commit()
+    return note
+
+def _search(client, **params):
+    response = client.get("/search/records", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_note_search_ranks_highlights_and_pages(auth_client, db_session, test_offender):
+    other = models.Offender(first_name="Other", last_name="Person", badge_id="TST-002", dob=date(1985, 5, 5))
+    db_session.add(other)
+    db_session.commit()
+
+    _note(db_session, test_offender, "Started work at Acme Roofing on 5th Street.")
+    _note(db_session, test_offender, "Acme Roofing supervisor confirmed hours. <b>Acme</b> pays weekly.", 1)
+    for i in range(5):
+        _note(db_session, test_offender, f"Routine check-in {i}, mentioned acme again.", i + 2)
+    _note(db_session, other, "Works at Acme Roofing too.")
+    unrelated = _note(db_session, test_offender, "Moved to 12 Elm Street.")
+
+    first = _search(auth_client, q="acme roof", offender_id=str(test_offender.offender_id))
+    assert len(first["results"]) == 2
+    assert first["next_cursor"] is None
+    top = first["results"][0]
+    assert top["kind"] == "note"
+    assert "<mark>Acme</mark>" in top["snippet"]
+    weekly = next(hit for hit in first["results"] if "weekly" in hit["snippet"])
+    assert "&lt;b&gt;<mark>Acme</mark>&lt;/b&gt;" in weekly["snippet"] # note content is escaped
+
+    # Cursor paging walks every match once, best first
+    seen, cursor = [], None
+    while True:
+        params = {"q": "acme", "offender_id": str(test_offender.offender_id), "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = _search(auth_client, **params)
+        seen.extend(page["results"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len({hit["id"] for hit in seen}) == 7
+    scores = [hit["score"] for hit in seen]
+    assert scores == sorted(scores, reverse=True)
+
+    # Index follows updates
+    unrelated.content = "Now employed by Acme Roofing."
+    db_session.commit()
+    assert len(_search(auth_client, q="acme roof", offender_id=str(test_offender.offender_id))["results"]) == 3
+
+    assert auth_client.get("/search/records", params={"q": "acme", "cursor": "garbage"}).status_code == 400
+
+def test_caseload_scope(auth_client, db_session, test_offender):
+    officer = models.Officer(badge_number="OFF-1", first_name="Case", last_name="Load")
+    db_session.add(officer)
+    db_session.flush()
+    episode = db_session.query(models.SupervisionEpisode).filter_by(offender_id=test_offender.offender_id).one()
+    episode.assigned_officer_id = officer.officer_id
+    other = models.Offender(first_name="Not", last_name="Mine", badge_id="TST-003", dob=date(1980, 1, 1))
+    db_session.add(other)
+    db_session.commit()
+    _note(db_session, test_offender, "Employer: Desert Logistics")
+    _note(db_session, other, "Employer: Desert Logistics")
+
+    everything = _search(auth_client, q="desert logistics")
+    caseload = _search(auth_client, q="desert logistics", officer_id=str(officer.officer_id))
+    assert len(everything["results"]) == 2
+    assert [hit["offender_id"] for hit in caseload["results"]] == [str(test_offender.offender_id)]
+
+def test_officer_search_is_limited_to_caseload(client, db_session, test_offender):
+    role = models.Role(role_name="Officer")
+    db_session.add(role)
+    db_session.flush()
+    user = models.User(username="officer", email="officer@system.local", password_hash="x", role_id=role.role_id)
+    db_session.add(user)
+    db_session.flush()
+    mine = models.Officer(user_id=user.user_id, badge_number="OFF-1", first_name="Case", last_name="Load")
+    theirs = models.Officer(badge_number="OFF-2", first_name="Other", last_name="Officer")
+    db_session.add_all([mine, theirs])
+    db_session.flush()
+    episode = db_session.query(models.SupervisionEpisode).filter_by(offender_id=test_offender.offender_id).one()
+    episode.assigned_officer_id = mine.officer_id
+    other = models.Offender(first_name="Not", last_name="Mine", badge_id="TST-003", dob=date(1980, 1, 1))
+    db_session.add(other)
+    db_session.flush()
+    db_session.add(models.SupervisionEpisode(offender_id=other.offender_id, assigned_officer_id=theirs.officer_id,
+                                             start_date=date(2024, 1, 1), status="Active", risk_level_at_start="Low"))
+    db_session.commit()
+    _note(db_session, test_offender, "Employer: Desert Logistics")
+    _note(db_session, other, "Employer: Desert Logistics")
+    db_session.refresh(user)
+    db_session.expunge(user)
+
+    app.dependency_overrides[auth.get_current_user] = lambda: user
+    hits = _search(client, q="desert logistics")["results"]
+    assert [hit["offender_id"] for hit in hits] == [str(test_offender.offender_id)]
+    assert _search(client, q="desert logistics", offender_id=str(other.offender_id))["results"] == []
+    assert client.get("/search/records", params={"q": "desert", "officer_id": str(theirs.officer_id)}).status_code == 403
+    assert len(_search(client, q="desert", officer_id=str(mine.officer_id))["results"]) == 1
+
+def test_document_text_is_searchable(auth_client, db_session, test_offender, tmp_path):
+    storage_backends.set_storage(storage_backends.LocalStorage(str(tmp_path / "media")))
+    try:
+        ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+        docx = io.BytesIO()
+        with zipfile.ZipFile(docx, "w") as archive:
+            archive.writestr("word/document.xml", f'<w:document xmlns:w="{ns}"><w:body><w:p><w:r>'
+                             f'<w:t>Lease signed for 4411 Cactus Road, unit 7.</w:t></w:r></w:p></w:body></w:document>')
+        doc = auth_client.post("/documents/upload", files={"file": ("lease.docx", docx.getvalue())},
+                               data={"offender_id": str(test_offender.offender_id)}).json()
+        _note(db_session, test_offender, "Verified new address on Cactus Road.")
+
+        hits = _search(auth_client, q="cactus road", offender_id=str(test_offender.offender_id))["results"]
+        assert {hit["kind"] for hit in hits} == {"note", "document"}
+        document_hit = next(hit for hit in hits if hit["kind"] == "document")
+        assert (document_hit["id"], document_hit["title"]) == (doc["document_id"], "lease.docx")
+        assert "<mark>Cactus</mark>" in document_hit["snippet"]
+
+        only_notes = _search(auth_client, q="cactus", types=["note"])["results"]
+        assert [hit["kind"] for hit in only_notes] == ["note"]
+
+        # The extract goes with the last reference to the blob
+        assert auth_client.delete(f"/documents/{doc['document_id']}").status_code == 200
+        assert [hit["kind"] for hit in _search(auth_client, q="cactus")["results"]] == ["note"]
+    finally:
+        storage_backends.set_storage(None)
+
+def test_like_snippet_fallback_marks_terms():
+    snippet = text_search_service._like_snippet("Met with employer at Acme; acme confirmed.", ["acme"])
+    assert text_search_service.highlight(snippet) == "Met with employer at <mark>Acme</mark>; <mark>acme</mark> confirmed."
+
+def test_like_fallback_escapes_wildcards(auth_client, db_session, test_offender, monkeypatch):
+    _note(db_session, test_offender, "Attendance at 100% this month.")
+    _note(db_session, test_offender, "Attended 1000 hours of community service.")
+    # The LIKE path used by dialects without a full-text index
+    monkeypatch.setattr(text_search_service, "_dialect", lambda db: "like")
+
+    for term in ("100%", "%"):
+        hits = _search(auth_client, q=term)["results"]
+        assert [hit["snippet"].startswith("Attendance") for hit in hits] == [True], term
@@ -0,0 +1,42 @@
+from datetime import date
+from backend import models
+
+def _seed_tasks(db_session, test_offender):
+    officer = models.Officer(badge_number="T-1", first_name="Task", last_name="Officer")
+    db_session.add(officer)
+    db_session.flush()
+    due_dates = [date(2024, 1, 3), None, date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2)]
+    for i, due in enumerate(due_dates):
+        db_session.add(models.Task(
+            title=f"Task {i}",
+            due_date=due,
+            offender_id=test_offender.offender_id,
+            assigned_officer_id=officer.officer_id
+        ))
+    db_session.commit()
+
+def test_get_tasks_unpaged_returns_everything(client, db_session, test_offender):
+    _seed_tasks(db_session, test_offender)
+    response = client.get("/tasks")
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+    assert "X-Next-Cursor" not in response.headers
+
+def test_get_tasks_cursor_pagination(client, db_session, test_offender):
+    _seed_tasks(db_session, test_offender)
+
+    seen = []
+    response = client.get("/tasks?limit=2&include_total=true")
+    assert response.headers["X-Total-Count"] == "5"
+    while True:
+        assert response.status_code == 200
+        seen.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        response = client.get(f"/tasks?limit=2&cursor={cursor}")
+
+    assert len(seen) == 5
+    assert len({t["task_id"] for t in seen}) == 5
+    # Ascending by due date, undated tasks last
+    assert [t["due_date"] for t in seen] == ["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-03", None]
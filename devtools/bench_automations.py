@@ -0,0 +1,125 @@
+"""
+Benchmark for the daily automation engine (backend/automation.py).
+
+Seeds a throwaway in-memory SQLite database with N offenders (each with an
+active, assigned episode) and R rules, then times run_daily_automations over
+a grid of sizes. A second run on the same day measures the idempotent path
+(every task already exists).
+
+Usage:
+    python devtools/bench_automations.py
+    python devtools/bench_automations.py --offenders 600 2400 9600 --rules 5 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+from backend.automation import run_daily_automations
+
+TODAY = date(2025, 6, 15)
+
+def seed(session, n_offenders, n_rules):
+    rng = random.Random(n_offenders * 1000 + n_rules)
+    officer_ids = [uuid.uuid4() for _ in range(max(1, n_offenders // 60))]
+    session.execute(insert(models.Officer), [
+        {"officer_id": oid, "badge_number": f"O-{i}", "first_name": "Bench", "last_name": f"Officer{i}"}
+        for i, oid in enumerate(officer_ids)
+    ])
+
+    offenders, episodes = [], []
+    for i in range(n_offenders):
+        offender_id = uuid.uuid4()
+        offenders.append({
+            "offender_id": offender_id,
+            "badge_id": f"B-{i:06d}",
+            "first_name": "Bench",
+            "last_name": f"Offender{i}",
+            "dob": date(1990, 1, 1),
+            "release_date": TODAY - timedelta(days=rng.randint(0, 730)),
+            "csed_date": TODAY + timedelta(days=rng.randint(0, 730)),
+        })
+        episodes.append({
+            "episode_id": uuid.uuid4(),
+            "offender_id": offender_id,
+            "assigned_officer_id": rng.choice(officer_ids),
+            "start_date": date(2024, 1, 1),
+            "status": "Active",
+            "risk_level_at_start": rng.choice(["Low", "Medium", "High"]),
+        })
+    session.execute(insert(models.Offender), offenders)
+    session.execute(insert(models.SupervisionEpisode), episodes)
+
+    rules = []
+    for r in range(n_rules):
+        after = r % 2 == 0
+        rules.append(models.AutomationRule(
+            name=f"Rule {r}",
+            trigger_field="release_date" if after else "csed_date",
+            trigger_direction="after" if after else "before",
+            trigger_offset=rng.choice([7, 30, 90, 180, 365]),
+            conditions=[{"field": "risk_level", "operator": "equals", "value": "High"}] if r % 3 == 2 else [],
+            task_title=f"Bench Task {r}",
+            due_offset=7,
+        ))
+    session.add_all(rules)
+    session.commit()
+
+def bench(n_offenders, n_rules):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+
+    queries = {"count": 0}
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*args):
+        queries["count"] += 1
+
+    session = sessionmaker(bind=engine)()
+    try:
+        seed(session, n_offenders, n_rules)
+
+        queries["count"] = 0
+        start = time.perf_counter()
+        created = run_daily_automations(session, today=TODAY)
+        first_run = time.perf_counter() - start
+        first_queries = queries["count"]
+
+        start = time.perf_counter()
+        run_daily_automations(session, today=TODAY)
+        rerun = time.perf_counter() - start
+    finally:
+        session.close()
+        engine.dispose()
+    return created, first_queries, first_run, rerun
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offenders", type=int, nargs="+", default=[600, 2400, 9600])
+    parser.add_argument("--rules", type=int, nargs="+", default=[5, 20])
+    args = parser.parse_args()
+
+    # The engine prints progress; keep the table readable
+    devnull = open(os.devnull, "w")
+    print(f"{'offenders':>10} {'rules':>6} {'tasks':>7} {'queries':>8} {'run (ms)':>10} {'rerun (ms)':>11}")
+    for n_rules in args.rules:
+        for n_offenders in args.offenders:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                created, queries, first_run, rerun = bench(n_offenders, n_rules)
+            finally:
+                sys.stdout = stdout
+            print(f"{n_offenders:>10} {n_rules:>6} {created:>7} {queries:>8} {first_run * 1000:>10.1f} {rerun * 1000:>11.1f}")
+    devnull.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark for document downloads: GET /documents/{id}/content against a plain
+StaticFiles mount of the same storage directory (what /media used to be).
+
+Runs the app under uvicorn on a local port with a throwaway in-memory
+database and a temp LocalStorage, uploads one file per size, then times full
+downloads and 1 MiB range reads (video seeking) through httpx. StaticFiles
+ignores Range, so its "1MiB" row is the cost of re-sending the whole file.
+
+Usage:
+    python devtools/bench_document_download.py
+    python devtools/bench_document_download.py --sizes 1 16 128 --repeat 20
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import auth, models
+from backend.database import get_db
+from backend.main import app
+from backend.services import storage_backends
+
+MIB = 1024 * 1024
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(root):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+
+    def bench_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    app.dependency_overrides[get_db] = bench_db
+    storage_backends.set_storage(storage_backends.LocalStorage(root))
+    app.mount("/bench-static", StaticFiles(directory=root), name="bench-static")
+
+    db = SessionLocal()
+    role = models.Role(role_name="Admin")
+    db.add(role)
+    db.flush()
+    db.add(models.User(username="bench", email="bench@system.local", password_hash="x", role_id=role.role_id))
+    offender = models.Offender(badge_id="BENCH-1", first_name="Bench", last_name="Offender", dob=date(1990, 1, 1))
+    db.add(offender)
+    db.commit()
+    offender_id = str(offender.offender_id)
+    db.close()
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}", offender_id
+
+def timed(client, url, headers, repeat):
+    total = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with client.stream("GET", url, headers=headers) as response:
+            assert response.status_code in (200, 206), response.status_code
+            for piece in response.iter_raw():
+                total += len(piece)
+    return total, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 128], help="file sizes in MiB")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench-media-")
+    server, base, offender_id = start_server(root)
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'bench'})}"}
+
+    print(f"{'size MiB':>9} {'request':>8} {'static ms':>10} {'content ms':>11} {'static MB/s':>12} {'content MB/s':>13}")
+    with httpx.Client(base_url=base, timeout=120) as client:
+        for size in args.sizes:
+            data = os.urandom(size * MIB)
+            doc = client.post("/documents/upload", files={"file": ("bench.bin", data)},
+                              data={"offender_id": offender_id}).json()
+            static_url = f"/bench-static/{doc['file_path']}"
+            content_url = f"/documents/{doc['document_id']}/content"
+            ranges = {"full": {}, "1MiB": {"Range": f"bytes={size * MIB // 2}-{size * MIB // 2 + MIB - 1}"}}
+            for label, extra in ranges.items():
+                timed(client, content_url, {**headers, **extra}, 1) # warm up
+                static_bytes, static_s = timed(client, static_url, extra, args.repeat)
+                content_bytes, content_s = timed(client, content_url, {**headers, **extra}, args.repeat)
+                print(f"{size:>9} {label:>8} {static_s / args.repeat * 1000:>10.1f} {content_s / args.repeat * 1000:>11.1f}"
+                      f" {static_bytes / static_s / 1e6:>12.0f} {content_bytes / content_s / 1e6:>13.0f}")
+
+    server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from backend.database import engine
+from sqlalchemy import text
+
+# Which duplicate survives: answers carry no timestamp, and rowid / xmin / ctid
+# don't reliably say which row was written last (SQLite reuses rowids after
+# deletes, Postgres rewrites ctid on update and xmin wraps). So the choice is by
+# the rows' own columns, and deterministic across reruns:
+# - an answer the officer entered beats one imported by Look-Back,
+# - an answered row beats an empty one,
+# - otherwise the lowest answer_id.
+# Keys whose duplicates held different values are counted so they can be reviewed.
+SURVIVOR_ORDER = (
+    "CASE WHEN is_imported THEN 1 ELSE 0 END, "
+    "CASE WHEN value IS NULL THEN 1 ELSE 0 END, "
+    "answer_id"
+)
+
+def migrate():
+    # One answer per (assessment, question): backs the bulk upsert in
+    # POST /assessments/{id}/answers. Older data may hold duplicates from
+    # concurrent single saves; keep one row per key before adding the constraint.
+    with engine.connect() as conn:
+        conflicting = conn.execute(text("""
+            SELECT COUNT(*) FROM (
+                SELECT assessment_id, question_tag FROM risk_assessment_answers
+                GROUP BY assessment_id, question_tag
+                HAVING COUNT(DISTINCT CAST(value AS TEXT)) > 1
+            ) conflicts
+        """)).scalar()
+        removed = conn.execute(text(f"""
+            DELETE FROM risk_assessment_answers
+            WHERE answer_id IN (
+                SELECT answer_id FROM (
+                    SELECT answer_id, ROW_NUMBER() OVER (
+                        PARTITION BY assessment_id, question_tag ORDER BY {SURVIVOR_ORDER}
+                    ) AS rn
+                    FROM risk_assessment_answers
+                ) ranked
+                WHERE rn > 1
+            )
+        """)).rowcount
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_risk_assessment_answers_assessment_tag "
+            "ON risk_assessment_answers (assessment_id, question_tag)"
+        ))
+        conn.commit()
+    print(f"Removed {removed} duplicate answers ({conflicting} questions had conflicting values); "
+          f"ensured uq_risk_assessment_answers_assessment_tag exists")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,45 @@
+from datetime import datetime
+from backend.database import SessionLocal, engine
+from backend import models
+from backend.automation import trigger_column, claim_runs
+
+def migrate():
+    # automation_runs ledger (replaces Task.title + episode_id idempotency).
+    # Back-fills the ledger from tasks created by the old engine so they don't fire again.
+    models.AutomationRun.__table__.create(bind=engine, checkfirst=True)
+    print("Ensured automation_runs table exists")
+
+    db = SessionLocal()
+    try:
+        total = 0
+        for rule in db.query(models.AutomationRule).all():
+            column = trigger_column(rule)
+            if column is None:
+                continue
+            rows = (
+                db.query(models.Task, column)
+                .join(models.SupervisionEpisode, models.SupervisionEpisode.episode_id == models.Task.episode_id)
+                .join(models.Offender, models.Offender.offender_id == models.SupervisionEpisode.offender_id)
+                .filter(models.Task.title == rule.task_title, column.isnot(None))
+                .all()
+            )
+            ledger = {}
+            for task, trigger_date in rows:
+                ledger[(task.episode_id, trigger_date)] = {
+                    "rule_id": rule.rule_id,
+                    "rule_name": rule.name,
+                    "episode_id": task.episode_id,
+                    "offender_id": task.offender_id,
+                    "trigger_date": trigger_date,
+                    "task_id": task.task_id,
+                    "fired_on": (task.created_at or datetime.utcnow()).date(),
+                    "fired_at": task.created_at or datetime.utcnow(),
+                }
+            total += len(claim_runs(db, rule, list(ledger.values())))
+        db.commit()
+        print(f"Back-filled {total} ledger rows from existing tasks")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,35 @@
+from backend.database import engine
+from backend.services import change_tracking
+from sqlalchemy import text
+
+# Incremental automation runs: change watermarks on offenders / episodes and
+# per-rule evaluation watermarks on automation_rules.
+STATEMENTS = [
+    "ALTER TABLE offenders ADD COLUMN updated_at TIMESTAMP",
+    "ALTER TABLE supervision_episodes ADD COLUMN updated_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_offenders_updated_at ON offenders (updated_at)",
+    "CREATE INDEX IF NOT EXISTS ix_supervision_episodes_updated_at ON supervision_episodes (updated_at)",
+    "ALTER TABLE automation_rules ADD COLUMN last_evaluated_date DATE",
+    "ALTER TABLE automation_rules ADD COLUMN last_evaluated_at TIMESTAMP",
+    "ALTER TABLE automation_rules ADD COLUMN evaluated_version VARCHAR(40)",
+]
+
+def run_migration():
+    for statement in STATEMENTS:
+        with engine.connect() as connection:
+            try:
+                connection.execute(text(statement))
+                connection.commit()
+                print(f"OK: {statement}")
+            except Exception as e:
+                print(f"Skipped (might already exist): {statement} -> {e}")
+
+    with engine.begin() as connection:
+        # Existing rows count as changed now (see change_tracking.backfill)
+        print(f"Back-filled updated_at on {change_tracking.backfill(connection)} rows")
+        # Stamp raw SQL / bulk writes too, not only ORM updates
+        change_tracking.ensure_change_triggers(connection)
+        print("OK: updated_at triggers")
+
+if __name__ == "__main__":
+    run_migration()
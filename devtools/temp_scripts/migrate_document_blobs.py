@@ -0,0 +1,47 @@
+import os
+from sqlalchemy import text
+from backend.database import SessionLocal, engine
+from backend import models
+from backend.services import document_store, storage_backends
+
+def migrate():
+    # Content-addressed document store: document_blobs table + documents.sha256.
+    # Moves existing flat files (backend/media/<uuid>.<ext>) into the store,
+    # deduplicating identical files.
+    models.DocumentBlob.__table__.create(bind=engine, checkfirst=True)
+    print("Ensured document_blobs table exists")
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("ALTER TABLE documents ADD COLUMN sha256 VARCHAR(64) REFERENCES document_blobs (sha256)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_sha256 ON documents (sha256)"))
+            conn.commit()
+            print("Added documents.sha256")
+        except Exception as e:
+            print(f"Skipped (might already exist): documents.sha256 -> {e}")
+
+    storage = storage_backends.get_storage()
+    db = SessionLocal()
+    try:
+        moved = missing = 0
+        for doc in db.query(models.Document).filter(models.Document.sha256.is_(None)).all():
+            if not doc.file_path or not os.path.exists(doc.file_path):
+                missing += 1
+                continue
+            legacy_path = doc.file_path
+            with open(legacy_path, "rb") as source:
+                tmp_path, sha256, size = document_store.spool(source, storage.tmp_dir)
+            is_new = document_store.acquire_blob(db, sha256, size, storage)
+            doc.sha256, doc.file_path, doc.file_size = sha256, document_store.blob_key(sha256), size
+            db.commit()
+            if is_new:
+                storage.put_file(doc.file_path, tmp_path)
+            else:
+                os.remove(tmp_path)
+            os.remove(legacy_path)
+            moved += 1
+        print(f"Moved {moved} legacy files into the store ({missing} missing on disk)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
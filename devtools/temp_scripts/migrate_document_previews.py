@@ -0,0 +1,27 @@
+from sqlalchemy import text
+from backend.database import engine
+
+STATEMENTS = [
+    "ALTER TABLE document_blobs ADD COLUMN preview_status VARCHAR(20) NOT NULL DEFAULT 'pending'",
+    "ALTER TABLE document_blobs ADD COLUMN preview_error VARCHAR(500)",
+    "ALTER TABLE document_blobs ADD COLUMN has_thumbnail BOOLEAN NOT NULL DEFAULT FALSE",
+    "ALTER TABLE document_blobs ADD COLUMN preview_updated_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_document_blobs_preview_status ON document_blobs (preview_status)",
+]
+
+def migrate():
+    # Preview pipeline columns. Existing blobs start 'pending'; the
+    # sweep-document-previews beat task (or document_previews.sweep_pending)
+    # generates their thumbnails.
+    with engine.connect() as conn:
+        for statement in STATEMENTS:
+            try:
+                conn.execute(text(statement))
+                conn.commit()
+                print(f"OK: {statement}")
+            except Exception as e:
+                conn.rollback()
+                print(f"Skipped (might already exist): {statement} -> {e}")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,10 @@
+from backend.database import engine
+from backend import models
+
+def migrate():
+    # job_locks: DB-level mutex for the daily automation run (services/job_lock.py)
+    models.JobLock.__table__.create(bind=engine, checkfirst=True)
+    print("Ensured job_locks table exists")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,33 @@
+from backend.database import engine
+from sqlalchemy import text
+
+def migrate():
+    # One dashboard_stats_rollups row per (snapshot_date, scope): backs the
+    # upsert in run_daily_stats_rollup. Overlapping runs of the old delete +
+    # insert could leave duplicates; keep the newest row per key first.
+    with engine.connect() as conn:
+        removed = conn.execute(text("""
+            DELETE FROM dashboard_stats_rollups
+            WHERE rollup_id IN (
+                SELECT rollup_id FROM (
+                    SELECT rollup_id, ROW_NUMBER() OVER (
+                        PARTITION BY snapshot_date, scope_type, scope_id ORDER BY rollup_id DESC
+                    ) AS rn
+                    FROM dashboard_stats_rollups
+                ) ranked
+                WHERE rn > 1
+            )
+        """)).rowcount
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_dashboard_rollups_date_scope "
+            "ON dashboard_stats_rollups (snapshot_date, scope_type, scope_id)"
+        ))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_dashboard_rollups_date_system "
+            "ON dashboard_stats_rollups (snapshot_date, scope_type) WHERE scope_id IS NULL"
+        ))
+        conn.commit()
+    print(f"Removed {removed} duplicate rollup rows; ensured uq_dashboard_rollups_date_scope / _date_system exist")
+
+if __name__ == "__main__":
+    migrate()
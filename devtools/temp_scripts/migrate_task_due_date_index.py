@@ -0,0 +1,12 @@
+from backend.database import engine
+from sqlalchemy import text
+
+def migrate():
+    # Supports keyset pagination on GET /tasks (ORDER BY due_date, task_id)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tasks_due_date ON tasks (due_date)"))
+        conn.commit()
+    print("Ensured ix_tasks_due_date index exists")
+
+if __name__ == "__main__":
+    migrate()
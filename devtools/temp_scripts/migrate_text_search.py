@@ -0,0 +1,31 @@
+from backend.database import SessionLocal, engine
+from backend import models
+from backend.services import document_previews, text_search_service
+
+def migrate():
+    # Full-text search over case notes and document text: document_texts table
+    # plus the FTS5 tables (SQLite) / GIN indexes (Postgres). Back-fills
+    # document_texts from the text extracts of blobs already previewed.
+    models.DocumentText.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        text_search_service.ensure_search_index(conn)
+    print("Ensured document_texts table and full-text indexes exist")
+
+    db = SessionLocal()
+    try:
+        loaded = 0
+        ready = db.query(models.DocumentBlob.sha256).filter(models.DocumentBlob.preview_status == 'ready').all()
+        for (sha256,) in ready:
+            if db.get(models.DocumentText, sha256) is not None:
+                continue
+            content = document_previews.read_text(sha256)
+            if content and content.strip():
+                db.add(models.DocumentText(sha256=sha256, content=content))
+                db.commit()
+                loaded += 1
+        print(f"Indexed text of {loaded} documents")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
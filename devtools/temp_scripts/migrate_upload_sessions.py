@@ -0,0 +1,11 @@
+from backend.database import engine
+from backend import models
+
+def migrate():
+    # Resumable uploads: upload_sessions + upload_chunks
+    for model in (models.UploadSession, models.UploadChunk):
+        model.__table__.create(bind=engine, checkfirst=True)
+        print(f"Ensured {model.__tablename__} table exists")
+
+if __name__ == "__main__":
+    migrate()
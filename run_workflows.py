@@ -1,9 +1,38 @@
+import argparse
+import sys
 from backend.database import SessionLocal
 from backend.automation import run_daily_automations
+from backend.services import automation_runner, automation_simulator, job_lock
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the daily automation rules.")
+    parser.add_argument("--shards", type=int, default=1, help="Partition offenders into N shards run in parallel processes")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per shard)")
+    parser.add_argument("--only", default=None, help="Comma-separated shard indices to re-run (e.g. 3,5)")
+    parser.add_argument("--retries", type=int, default=1, help="Retries per failed shard")
+    parser.add_argument("--incremental", action="store_true", help="Only evaluate offenders that entered a rule's window or changed since its last run")
+    parser.add_argument("--dry-run", action="store_true", help="Report what the rules would do, without writing")
+    parser.add_argument("--rule", type=int, default=None, help="With --dry-run: only this rule (active or not)")
+    args = parser.parse_args()
+
     db = SessionLocal()
     try:
-        run_daily_automations(db)
+        if args.dry_run:
+            print(automation_simulator.format_report(automation_simulator.simulate_rules(db, rule_id=args.rule)))
+        elif args.shards <= 1:
+            with job_lock.job_lock(db, automation_runner.LOCK_NAME):
+                run_daily_automations(db, incremental=args.incremental)
+        else:
+            only = [int(i) for i in args.only.split(",")] if args.only else None
+            report = automation_runner.run_parallel_automations(
+                db, shard_count=args.shards, workers=args.workers, only_shards=only, retries=args.retries,
+                incremental=args.incremental
+            )
+            print(automation_runner.format_report(report))
+            if report["failed"]:
+                sys.exit(1)
+    except job_lock.LockNotAcquired as e:
+        print(f"Skipped: {e}")
+        sys.exit(2)
     finally:
         db.close()
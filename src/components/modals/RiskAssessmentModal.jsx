@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { X, Save, AlertCircle, CheckCircle, Info, Link as LinkIcon, Lock } from 'lucide-react';
 
@@ -22,6 +22,10 @@ const RiskAssessmentModal = ({ isOpen, onClose, offenderId, onSuccess }) => {
     const [answers, setAnswers] = useState({});
     const [currentAssessmentId, setCurrentAssessmentId] = useState(null);
 
+    // Answers not yet saved; flushed in one batch request
+    const pendingAnswers = useRef({});
+    const saveTimer = useRef(null);
+
     useEffect(() => {
         if (!isOpen) {
             setStep('select');
@@ -76,13 +80,24 @@ const RiskAssessmentModal = ({ isOpen, onClose, offenderId, onSuccess }) => {
         }
     };
 
+    const flushAnswers = (includeScore = false) => {
+        clearTimeout(saveTimer.current);
+        const batch = pendingAnswers.current;
+        pendingAnswers.current = {};
+        return axios.post(`http://localhost:8000/assessments/${currentAssessmentId}/answers`,
+            { answers: batch },
+            { params: { include_score: includeScore } }
+        );
+    };
+
     const handleAnswerChange = (tag, value) => {
         setAnswers(prev => ({ ...prev, [tag]: value }));
         if (currentAssessmentId) {
-            axios.post(`http://localhost:8000/assessments/${currentAssessmentId}/save`, {
-                tag: tag,
-                value: value
-            }).catch(e => console.error("Auto-save failed", e));
+            pendingAnswers.current[tag] = value;
+            clearTimeout(saveTimer.current);
+            saveTimer.current = setTimeout(() => {
+                flushAnswers().catch(e => console.error("Auto-save failed", e));
+            }, 500);
         }
     };
 
@@ -90,8 +105,9 @@ const RiskAssessmentModal = ({ isOpen, onClose, offenderId, onSuccess }) => {
         if (!currentAssessmentId) return;
         setIsLoading(true);
         try {
-            const res = await axios.get(`http://localhost:8000/assessments/${currentAssessmentId}/calculate`);
-            setReviewData(res.data);
+            // Saves any pending answers and returns the recomputed score
+            const res = await flushAnswers(true);
+            setReviewData(res.data.score);
             setFinalRiskLevel(res.data.risk_level); // Default to calculated
             setOverrideReason('');
             setStep('review');
@@ -8,6 +8,7 @@ import Modal from '../common/Modal';
 import TaskModal from '../modals/TaskModal';
 import ModuleRegistry from '../../core/ModuleRegistry';
 import PersonalDetailsTab from './tabs/PersonalDetailsTab';
+import RecordSearch from './RecordSearch';
 import { useParams, useNavigate } from 'react-router-dom';
 
 const OffenderProfile = () => {
@@ -710,6 +711,10 @@ const OffenderProfile = () => {
                         </div>
                     </div>
 
+                    <div className="border-t border-slate-100 pt-4">
+                        <RecordSearch offenderId={offenderId} />
+                    </div>
+
                     <div className="border-t border-slate-100 pt-4">
                         <h4 className="text-sm font-bold text-slate-800 mb-4">Recent Notes</h4>
                         <div className="space-y-4">
@@ -0,0 +1,86 @@
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
+import { Search, FileText, MessageSquare, Loader } from 'lucide-react';
+
+const API_URL = 'http://localhost:8000';
+const PAGE_SIZE = 10;
+
+// Full-text search over an offender's case notes and document text.
+// Snippets come back HTML-escaped with matches wrapped in <mark>.
+const RecordSearch = ({ offenderId }) => {
+    const [query, setQuery] = useState('');
+    const [results, setResults] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loading, setLoading] = useState(false);
+
+    const runSearch = async (cursor = null) => {
+        setLoading(true);
+        try {
+            const params = { q: query.trim(), offender_id: offenderId, limit: PAGE_SIZE };
+            if (cursor) params.cursor = cursor;
+            const response = await axios.get(`${API_URL}/search/records`, { params });
+            setResults(prev => cursor ? [...prev, ...response.data.results] : response.data.results);
+            setNextCursor(response.data.next_cursor);
+        } catch (err) {
+            console.error("Search failed:", err);
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    useEffect(() => {
+        if (!query.trim()) {
+            setResults([]);
+            setNextCursor(null);
+            return;
+        }
+        const timer = setTimeout(() => runSearch(), 300);
+        return () => clearTimeout(timer);
+    }, [query, offenderId]);
+
+    return (
+        <div>
+            <div className="relative">
+                <Search size={16} className="absolute left-3 top-1/2 -translate-y-1/2 text-slate-400" />
+                <input
+                    value={query}
+                    onChange={(e) => setQuery(e.target.value)}
+                    placeholder="Search notes and documents (address, employer...)"
+                    className="w-full pl-9 pr-3 py-2 border border-slate-200 rounded-lg text-sm focus:ring-2 focus:ring-blue-500 focus:border-transparent outline-none"
+                />
+            </div>
+
+            {query.trim() && (
+                <div className="mt-3 space-y-2">
+                    {results.map(hit => (
+                        <div key={`${hit.kind}-${hit.id}`} className="bg-slate-50 p-3 rounded-lg border border-slate-100">
+                            <div className="flex items-center gap-2 text-xs text-slate-500 mb-1">
+                                {hit.kind === 'document' ? <FileText size={12} /> : <MessageSquare size={12} />}
+                                <span className="font-medium text-slate-700">{hit.title}</span>
+                                {hit.date && <span>{new Date(hit.date).toLocaleDateString()}</span>}
+                            </div>
+                            <p
+                                className="text-sm text-slate-600 leading-relaxed [&_mark]:bg-yellow-100 [&_mark]:text-slate-900"
+                                dangerouslySetInnerHTML={{ __html: hit.snippet }}
+                            />
+                        </div>
+                    ))}
+                    {!loading && results.length === 0 && (
+                        <p className="text-sm text-slate-400 italic">No matches.</p>
+                    )}
+                    {loading && <Loader size={16} className="animate-spin text-blue-500 mx-auto" />}
+                    {nextCursor && !loading && (
+                        <button
+                            onClick={() => runSearch(nextCursor)}
+                            className="w-full py-2 text-sm font-medium text-blue-600 bg-blue-50 hover:bg-blue-100 rounded-lg"
+                        >
+                            Load more
+                        </button>
+                    )}
+                </div>
+            )}
+        </div>
+    );
+};
+
+export default RecordSearch;
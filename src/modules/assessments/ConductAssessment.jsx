@@ -59,23 +59,16 @@ const ConductAssessment = ({ offenderId, isOpen, onClose, onSuccess }) => {
 
     const handleSubmit = async () => {
         try {
-            // In a real app, we would POST to /assessments/submit
-            // For this POC, we might calculate locally or send to backend to record
-
-            // Simulating backend result based on Scoring Table logic (client-side for now)
-            const score = calculateScore();
-            let finalLevel = "Low";
-
-            // Simple mapping if scoring tables existed in frontend state (they are in selectedInstrument)
-            if (selectedInstrument.scoring_tables?.length > 0) {
-                // Simple find
-                const match = selectedInstrument.scoring_tables.find(t => score >= t.min_score && score <= t.max_score);
-                if (match) finalLevel = match.result_level;
-            } else {
-                // Fallback
-                if (score > 10) finalLevel = "High";
-                else if (score > 5) finalLevel = "Medium";
-            }
+            // Score against the instrument's scoring tables on the server
+            const answerValues = Object.fromEntries(
+                Object.entries(answers).map(([itemId, ans]) => [itemId, ans.value])
+            );
+            const scoreRes = await axios.post(
+                `http://localhost:8000/assessments/instruments/${selectedInstrument.instrument_id}/score`,
+                { answers: answerValues, offender_id: offenderId }
+            );
+            const score = scoreRes.data.total_score;
+            const finalLevel = scoreRes.data.risk_level;
 
             // Create Assessment Record
             // Note: detailed saving would involve creating the record first, then saving answers.
@@ -110,7 +103,7 @@ const ConductAssessment = ({ offenderId, isOpen, onClose, onSuccess }) => {
                 final_risk_level: finalLevel
             });
 
-            setResult({ score, level: finalLevel });
+            setResult({ score, level: finalLevel, recommendations: scoreRes.data.recommendations });
             setStep('result');
 
         } catch (error) {
@@ -271,6 +264,12 @@ const ConductAssessment = ({ offenderId, isOpen, onClose, onSuccess }) => {
                                 </div>
                             </div>
 
+                            {result.recommendations?.length > 0 && (
+                                <ul className="max-w-md mx-auto text-left text-sm text-slate-600 mb-8 list-disc pl-5 space-y-1">
+                                    {result.recommendations.map((rec, idx) => <li key={idx}>{rec}</li>)}
+                                </ul>
+                            )}
+
                             <div>
                                 <button
                                     onClick={() => { onClose(); onSuccess(); }}
@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
-import { X, Save, ArrowRight, Calendar, AlertTriangle, CheckSquare, Plus, Trash2 } from 'lucide-react';
+import axios from 'axios';
+import { X, Save, ArrowRight, Calendar, AlertTriangle, CheckSquare, Plus, Trash2, Eye } from 'lucide-react';
 
 const AutomationBuilderModal = ({ isOpen, onClose, onSave }) => {
     const [step, setStep] = useState(1);
@@ -10,8 +11,34 @@ const AutomationBuilderModal = ({ isOpen, onClose, onSave }) => {
         action: { type: 'create_task', title: '', description: '', priority: 'Normal', due_offset: 7, action_is_parole_plan: false }
     });
 
+    const [preview, setPreview] = useState(null);
+    const [previewError, setPreviewError] = useState(null);
+
     if (!isOpen) return null;
 
+    const handlePreview = async () => {
+        // Dry run: how many tasks this rule would create today, without saving it
+        setPreviewError(null);
+        try {
+            const payload = {
+                name: workflow.name || 'Draft',
+                trigger_field: workflow.trigger.field,
+                trigger_offset: workflow.trigger.offset,
+                trigger_direction: workflow.trigger.direction,
+                conditions: workflow.conditions,
+                task_title: workflow.action.title || 'Draft',
+                task_description: workflow.action.description,
+                due_offset: workflow.action.due_offset,
+                is_active: false
+            };
+            const response = await axios.post('http://localhost:8000/automations/rules/dry-run?sample=5', payload);
+            setPreview(response.data);
+        } catch (error) {
+            setPreview(null);
+            setPreviewError(error.response?.data?.detail || 'Preview failed');
+        }
+    };
+
     const handleSave = () => {
         // Validation logic here
         onSave(workflow);
@@ -262,7 +289,20 @@ const AutomationBuilderModal = ({ isOpen, onClose, onSave }) => {
             </div>
 
             {/* Footer */}
-            <div className="p-6 border-t border-slate-100 bg-slate-50 flex justify-end gap-3 shrink-0">
+            <div className="p-6 border-t border-slate-100 bg-slate-50 flex justify-end items-center gap-3 shrink-0">
+                {(preview || previewError) && (
+                    <p className={`mr-auto text-sm ${previewError ? 'text-red-500' : 'text-slate-600'}`}>
+                        {previewError
+                            ? String(previewError)
+                            : preview.would_create === null
+                                ? `${preview.matches} offenders match each time this event fires`
+                                : `Would create ${preview.would_create} tasks today (${preview.matches} matches, ${Math.round(preview.seconds * 1000)} ms, ${preview.queries} queries)`}
+                    </p>
+                )}
+                <button onClick={handlePreview} className="px-4 py-2.5 font-semibold text-violet-700 hover:bg-violet-100 rounded-lg flex items-center gap-2 transition-colors">
+                    <Eye size={18} />
+                    Preview
+                </button>
                 <button onClick={onClose} className="px-6 py-2.5 font-semibold text-slate-600 hover:bg-slate-200 rounded-lg transition-colors">
                     Cancel
                 </button>
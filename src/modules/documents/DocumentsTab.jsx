@@ -7,6 +7,26 @@ import {
 } from 'lucide-react';
 
 const API_URL = 'http://localhost:8000'; // TODO: Move to config
+const PREVIEW_POLL_MS = 3000;
+
+// Fetched with the auth header (an <img src> can't send it)
+const DocumentThumbnail = ({ docId, fallback }) => {
+    const [src, setSrc] = useState(null);
+
+    useEffect(() => {
+        let objectUrl = null;
+        axios.get(`${API_URL}/documents/${docId}/thumbnail`, { responseType: 'blob' })
+            .then((response) => {
+                objectUrl = URL.createObjectURL(response.data);
+                setSrc(objectUrl);
+            })
+            .catch(() => setSrc(null));
+        return () => objectUrl && URL.revokeObjectURL(objectUrl);
+    }, [docId]);
+
+    if (!src) return fallback;
+    return <img src={src} alt="" className="w-full h-32 object-contain bg-slate-50 rounded-lg" />;
+};
 
 const DocumentsTab = ({ offenderId }) => {
     const { currentUser } = useUser();
@@ -23,9 +43,17 @@ const DocumentsTab = ({ offenderId }) => {
         }
     }, [offenderId]);
 
-    const fetchDocuments = async () => {
+    // Thumbnails are generated in the background; refresh until they settle
+    useEffect(() => {
+        const waiting = documents.some(d => d.preview_status === 'pending' || d.preview_status === 'processing');
+        if (!waiting) return;
+        const timer = setTimeout(() => fetchDocuments(true), PREVIEW_POLL_MS);
+        return () => clearTimeout(timer);
+    }, [documents]);
+
+    const fetchDocuments = async (quiet = false) => {
         try {
-            setLoading(true);
+            if (!quiet) setLoading(true);
             const response = await axios.get(`${API_URL}/documents/offender/${offenderId}`);
             setDocuments(response.data);
             setError(null);
@@ -110,6 +138,20 @@ const DocumentsTab = ({ offenderId }) => {
         }
     };
 
+    const handleOpen = async (docId) => {
+        // Open the window synchronously (popup blockers), then point it at a
+        // short-lived authorized link
+        const viewer = window.open('', '_blank');
+        try {
+            const response = await axios.get(`${API_URL}/documents/${docId}/link`);
+            viewer.location = `${API_URL}${response.data.url}`;
+        } catch (err) {
+            viewer?.close();
+            console.error("Open failed:", err);
+            alert(err.response?.status === 403 ? "You don't have access to this document." : "Failed to open document.");
+        }
+    };
+
     const getFileIcon = (type) => {
         if (type?.includes('image')) return <ImageIcon className="text-purple-500" size={24} />;
         if (type?.includes('pdf')) return <FileText className="text-red-500" size={24} />;
@@ -193,10 +235,20 @@ const DocumentsTab = ({ offenderId }) => {
                     ) : (
                         documents.map((doc) => (
                             <div key={doc.document_id} className="bg-white p-4 rounded-xl border border-slate-200 hover:shadow-md transition-shadow group">
-                                <div className="flex items-start justify-between mb-3">
-                                    <div className="p-2 bg-slate-50 rounded-lg">
-                                        {getFileIcon(doc.file_type)}
-                                    </div>
+                                <div className="flex items-start justify-between mb-3 gap-2">
+                                    {doc.preview_status === 'ready' ? (
+                                        <DocumentThumbnail
+                                            docId={doc.document_id}
+                                            fallback={<div className="p-2 bg-slate-50 rounded-lg">{getFileIcon(doc.file_type)}</div>}
+                                        />
+                                    ) : (
+                                        <div className="p-2 bg-slate-50 rounded-lg flex items-center gap-2">
+                                            {getFileIcon(doc.file_type)}
+                                            {(doc.preview_status === 'pending' || doc.preview_status === 'processing') && (
+                                                <Loader size={12} className="animate-spin text-slate-300" title="Generating preview" />
+                                            )}
+                                        </div>
+                                    )}
                                     <button
                                         onClick={(e) => {
                                             e.stopPropagation(); // Prevent card click issues
@@ -219,16 +271,16 @@ const DocumentsTab = ({ offenderId }) => {
                                     </span>
                                 </div>
 
-                                <a
-                                    href={`${API_URL}/media/${doc.file_path.split(/[\\/]/).pop()}`}
-                                    target="_blank"
-                                    rel="noopener noreferrer"
+                                <button
                                     className="mt-4 flex items-center justify-center gap-2 w-full py-2 text-sm font-medium text-blue-600 bg-blue-50 hover:bg-blue-100 rounded-lg transition-colors"
-                                    onClick={(e) => e.stopPropagation()}
+                                    onClick={(e) => {
+                                        e.stopPropagation();
+                                        handleOpen(doc.document_id);
+                                    }}
                                 >
                                     <Download size={14} />
                                     Download / View
-                                </a>
+                                </button>
                             </div>
                         ))
                     )}
@@ -14,6 +14,11 @@ const SystemConfiguration = () => {
             type: 'number',
             description: 'Number of days after release until onboarding tasks are due.'
         },
+        'assessment_lookback_days': {
+            label: 'Assessment Look-Back (Days)',
+            type: 'number',
+            description: 'Dynamic answers from assessments within this many days pre-fill new assessments.'
+        },
         'default_caseload_cap': {
             label: 'Default Caseload Cap',
             type: 'number',